@@ -0,0 +1,153 @@
+import pandas as pd
+
+
+def _to_cents(amount):
+    if pd.isna(amount):
+        return 0
+    return int(round(float(amount) * 100))
+
+
+def _category_key(category):
+    return '' if pd.isna(category) else category
+
+
+def _month_key(date):
+    """'AAAA-MM' de una fecha 'AAAA-MM-DD'"""
+    return '' if pd.isna(date) else str(date)[:7]
+
+
+class LedgerAggregates:
+    """Totales de ingresos, gastos y sumas por categoría del libro.
+
+    Se actualizan con cada alta, modificación o baja en lugar de recorrer el
+    libro completo. Los importes se acumulan en céntimos para que las sumas
+    incrementales coincidan exactamente con un recálculo.
+    """
+
+    TYPES = ('income', 'expense')
+
+    def __init__(self):
+        self.totals = {transaction_type: 0 for transaction_type in self.TYPES}
+        # {tipo: {categoría: [céntimos, número de movimientos]}}
+        self.categories = {transaction_type: {} for transaction_type in self.TYPES}
+        # {tipo: {'AAAA-MM': [céntimos, número de movimientos]}}
+        self.months = {transaction_type: {} for transaction_type in self.TYPES}
+
+    @classmethod
+    def from_frame(cls, transactions):
+        """Calcula los agregados recorriendo todo el libro"""
+        aggregates = cls()
+        aggregates.add_frame(transactions)
+        return aggregates
+
+    @classmethod
+    def from_grouped(cls, categories, months):
+        """Agregados a partir de sumas ya agrupadas, p. ej. por una consulta SQL.
+
+        `categories` y `months` son filas (tipo, categoría o 'AAAA-MM',
+        céntimos, número de movimientos).
+        """
+        aggregates = cls()
+        for transaction_type, category, cents, count in categories:
+            aggregates._apply(transaction_type, category, int(cents), int(count))
+        for transaction_type, month, cents, count in months:
+            aggregates._apply_month(transaction_type, month, int(cents), int(count))
+        return aggregates
+
+    def copy(self):
+        aggregates = LedgerAggregates()
+        aggregates.totals = dict(self.totals)
+        aggregates.categories = self._copy_groups(self.categories)
+        aggregates.months = self._copy_groups(self.months)
+        return aggregates
+
+    @staticmethod
+    def _copy_groups(groups):
+        return {
+            transaction_type: {name: list(values) for name, values in values_by_name.items()}
+            for transaction_type, values_by_name in groups.items()
+        }
+
+    @staticmethod
+    def _add_to_group(group, name, cents, count):
+        values = group.setdefault(name, [0, 0])
+        values[0] += cents
+        values[1] += count
+        if values[1] <= 0:
+            del group[name]
+
+    def _apply(self, transaction_type, category, cents, count):
+        if transaction_type not in self.totals:
+            return
+        self.totals[transaction_type] += cents
+        self._add_to_group(self.categories[transaction_type], category, cents, count)
+
+    def _apply_month(self, transaction_type, month, cents, count):
+        if transaction_type not in self.totals:
+            return
+        self._add_to_group(self.months[transaction_type], month, cents, count)
+
+    def _apply_row(self, row, sign):
+        cents = sign * _to_cents(row['amount'])
+        self._apply(row['type'], _category_key(row['category']), cents, sign)
+        self._apply_month(row['type'], _month_key(row['date']), cents, sign)
+
+    def add_row(self, row):
+        self._apply_row(row, 1)
+
+    def remove_row(self, row):
+        self._apply_row(row, -1)
+
+    def add_frame(self, transactions):
+        """Suma un lote de movimientos agrupándolo de una vez"""
+        if transactions.empty:
+            return
+        cents = (transactions['amount'].astype(float).fillna(0) * 100).round().astype('int64')
+        categories = transactions['category'].fillna('')
+        grouped = cents.groupby([transactions['type'], categories]).agg(['sum', 'count'])
+        for (transaction_type, category), values in grouped.iterrows():
+            self._apply(transaction_type, category, int(values['sum']), int(values['count']))
+
+        months = transactions['date'].astype(str).str.slice(0, 7).where(transactions['date'].notna(), '')
+        grouped = cents.groupby([transactions['type'], months]).agg(['sum', 'count'])
+        for (transaction_type, month), values in grouped.iterrows():
+            self._apply_month(transaction_type, month, int(values['sum']), int(values['count']))
+
+    def total(self, transaction_type):
+        return self.totals[transaction_type] / 100
+
+    def balance(self, initial_balance):
+        return initial_balance + (self.totals['income'] - self.totals['expense']) / 100
+
+    def by_category(self, transaction_type):
+        """Serie categoría -> importe, ordenada como un groupby"""
+        categories = self.categories[transaction_type]
+        names = sorted(categories)
+        return pd.Series(
+            [categories[name][0] / 100 for name in names],
+            index=pd.Index(names, name='category'),
+            name='amount',
+            dtype=float
+        )
+
+    def by_month(self):
+        """DataFrame 'AAAA-MM' -> importes de ingresos y gastos, ordenado por mes"""
+        months = sorted(
+            month for month in set(self.months['income']) | set(self.months['expense']) if month
+        )
+        return pd.DataFrame(
+            {
+                transaction_type: [
+                    self.months[transaction_type].get(month, [0, 0])[0] / 100 for month in months
+                ]
+                for transaction_type in self.TYPES
+            },
+            index=pd.Index(months, name='month'),
+            dtype=float
+        )
+
+    def matches(self, transactions):
+        """Comprueba los agregados contra un recálculo completo"""
+        expected = LedgerAggregates.from_frame(transactions)
+        return (expected.totals == self.totals and expected.categories == self.categories
+                and expected.months == self.months)
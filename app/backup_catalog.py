@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+
+# Estado de la copia en Drive -> valor de 'drive_sync' en el catálogo
+DRIVE_STATES = {
+    'synced': True,
+    'failed': False,
+    'local': None,
+}
+
+
+class BackupCatalog:
+    """Índice persistente de las copias de seguridad (catalog.json).
+
+    Guarda por copia la fecha, los ficheros con su tamaño y hash y el estado
+    de la subida a Drive, de modo que listar o filtrar copias no necesita
+    recorrer el directorio ni abrir los manifiestos. También recuerda qué
+    objetos están ya en Drive, para volver a subir los que fallaron. Cada
+    cambio se escribe en un fichero temporal que sustituye al anterior; si
+    otro proceso lo modifica, se vuelve a leer.
+    """
+
+    def __init__(self, catalog_path):
+        self.catalog_path = catalog_path
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._uploaded = set()
+        self._mtime_ns = None
+        self.loaded = self._load()
+
+    def _load(self):
+        try:
+            with open(self.catalog_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._entries = {entry['id']: entry for entry in data.get('backups', [])}
+            if 'uploaded_objects' in data:
+                self._uploaded = set(data['uploaded_objects'])
+            else:
+                # Catálogo anterior: están en Drive los objetos de las copias subidas
+                self._uploaded = {item['sha256'] for entry in self._entries.values()
+                                  if entry.get('drive_sync') is True for item in entry['files']}
+            self._mtime_ns = os.stat(self.catalog_path).st_mtime_ns
+            return True
+        except (OSError, ValueError, KeyError, TypeError):
+            self._entries = {}
+            self._uploaded = set()
+            self._mtime_ns = None
+            return False
+
+    def _reload_if_changed(self):
+        try:
+            mtime_ns = os.stat(self.catalog_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime_ns != self._mtime_ns:
+            self._load()
+
+    def _commit(self, entries, uploaded):
+        """Escribe el catálogo completo y solo entonces lo da por bueno en memoria"""
+        tmp_path = f"{self.catalog_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'backups': sorted(entries.values(), key=lambda entry: entry['id']),
+                'uploaded_objects': sorted(uploaded),
+            }, f, indent=1)
+        os.replace(tmp_path, self.catalog_path)
+        self._entries = entries
+        self._uploaded = uploaded
+        self._mtime_ns = os.stat(self.catalog_path).st_mtime_ns
+
+    def update(self, put=(), remove=(), uploaded=(), forgotten=()):
+        """Añade o sustituye las entradas `put` y quita las de `remove` en una
+        sola escritura; `uploaded` y `forgotten` son objetos (hash) que se
+        acaban de subir a Drive o que ya no existen"""
+        with self._lock:
+            self._reload_if_changed()
+            entries = dict(self._entries)
+            for entry_id in remove:
+                entries.pop(entry_id, None)
+            for entry in put:
+                entries[entry['id']] = entry
+            self._commit(entries, (self._uploaded | set(uploaded)) - set(forgotten))
+
+    def uploaded_objects(self):
+        """Hashes de los objetos que ya están en Drive"""
+        with self._lock:
+            self._reload_if_changed()
+            return set(self._uploaded)
+
+    def get(self, entry_id):
+        with self._lock:
+            self._reload_if_changed()
+            return self._entries.get(entry_id)
+
+    def ids(self, kind=None):
+        """Identificadores ordenados (del más antiguo al más reciente)"""
+        with self._lock:
+            self._reload_if_changed()
+            return sorted(
+                entry_id for entry_id, entry in self._entries.items()
+                if kind is None or entry['kind'] == kind
+            )
+
+    def query(self, offset=0, limit=None, start_date=None, end_date=None, file_name=None, drive_state=None):
+        """Página de copias, de la más reciente a la más antigua, y total filtrado.
+
+        Las fechas son cadenas ISO ('AAAA-MM-DD...'); `drive_state` es una de
+        las claves de DRIVE_STATES.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            entries = list(self._entries.values())
+
+        if start_date is not None:
+            entries = [entry for entry in entries if entry['date'] >= start_date]
+        if end_date is not None:
+            entries = [entry for entry in entries if entry['date'][:len(end_date)] <= end_date]
+        if file_name:
+            needle = file_name.lower()
+            entries = [entry for entry in entries
+                       if any(needle in item['name'].lower() for item in entry['files'])]
+        if drive_state is not None:
+            drive_sync = DRIVE_STATES[drive_state]
+            entries = [entry for entry in entries if entry.get('drive_sync') is drive_sync]
+
+        entries.sort(key=lambda entry: entry['date'], reverse=True)
+        end = None if limit is None else offset + limit
+        return entries[offset:end], len(entries)
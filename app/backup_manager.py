@@ -1,72 +1,260 @@
+import gzip
+import hashlib
+import json
 import os
-import shutil
-from datetime import datetime
-import pandas as pd
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
+from app.backup_catalog import BackupCatalog
+from app.concurrency import get_ledger_lock
+from app.storage import (
+    LEDGER_FILES, TRANSACTION_COLUMNS, TRANSACTION_FILES, JournalStorage, SQLiteStorage,
+    empty_transactions, is_sqlite_file, read_sqlite_file, replay_journal, sqlite_mtime_ns
+)
+
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+# Copias que se conservan: las más recientes y la última de cada día, semana y mes
+DEFAULT_RETENTION = {'recent': 5, 'daily': 7, 'weekly': 4, 'monthly': 12}
+# Subidas simultáneas a Drive al crear una copia
+UPLOAD_WORKERS = 4
+OBJECT_MIMETYPE = 'application/gzip'
+MANIFEST_MIMETYPE = 'application/json'
+
+
+def _retention_bucket(date, period):
+    if period == 'recent':
+        return date
+    if period == 'daily':
+        return date.date()
+    if period == 'weekly':
+        return tuple(date.isocalendar())[:2]
+    return (date.year, date.month)
+
 
 class BackupManager:
-    def __init__(self, drive_manager, backup_folder="backups"):
+    """Copias de seguridad direccionadas por contenido.
+
+    Cada fichero se guarda comprimido una sola vez en `objects/<sha256>.gz`;
+    cada copia es un manifiesto pequeño en `snapshots/<fecha>.json` con el
+    hash de cada fichero. Una copia sin cambios no escribe nada y las copias
+    antiguas se podan con una política abuelo-padre-hijo (diaria, semanal y
+    mensual), conservando además las más recientes.
+    """
+
+    def __init__(self, drive_manager, backup_folder="backups", retention=None, upload_workers=UPLOAD_WORKERS):
         self.drive_manager = drive_manager
+        self.upload_workers = upload_workers
         self.backup_folder = backup_folder
-        self.local_backup_path = Path("data") / backup_folder
+        self.local_backup_path = Path(drive_manager.local_data_dir) / backup_folder
+        self.objects_path = self.local_backup_path / 'objects'
+        self.snapshots_path = self.local_backup_path / 'snapshots'
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self._lock = threading.Lock()
         self.ensure_backup_folders()
+        self.catalog = BackupCatalog(str(self.local_backup_path / 'catalog.json'))
+        self._reconcile_catalog()
 
     def ensure_backup_folders(self):
         """Asegura que existan las carpetas necesarias para los backups"""
-        if not os.path.exists(self.local_backup_path):
-            os.makedirs(self.local_backup_path)
+        for path in (self.local_backup_path, self.objects_path, self.snapshots_path):
+            if not os.path.exists(path):
+                os.makedirs(path)
+
+    def _object_path(self, digest):
+        return self.objects_path / f"{digest}.gz"
+
+    def _manifest_path(self, snapshot_id):
+        return self.snapshots_path / f"{snapshot_id}.json"
+
+    def _drive_name(self, path):
+        # En Drive se usa la ruta relativa a data/, como en el resto de ficheros
+        return path.relative_to(Path(self.drive_manager.local_data_dir)).as_posix()
+
+    @staticmethod
+    def _remove(path):
+        os.remove(path)
+        # Estado de sincronización que DriveManager guarda junto al fichero
+        sync_state = path.with_name(f".{path.name}.sync.json")
+        if sync_state.exists():
+            os.remove(sync_state)
+
+    @staticmethod
+    def _write_atomic(path, content):
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _scan_snapshot_ids(self):
+        return sorted(
+            file_name[:-len('.json')] for file_name in os.listdir(self.snapshots_path)
+            if file_name.endswith('.json') and not file_name.startswith('.')
+        )
+
+    @staticmethod
+    def _catalog_entry(manifest, drive_sync=None, drive_errors=()):
+        return {
+            'id': manifest['id'],
+            'kind': 'snapshot',
+            'date': datetime.strptime(manifest['id'], TIMESTAMP_FORMAT).isoformat(),
+            'files': manifest['files'],
+            'size': sum(entry['size'] for entry in manifest['files']),
+            'stored_size': sum(entry.get('stored_size', 0) for entry in manifest['files']),
+            'drive_sync': drive_sync,
+            'drive_errors': list(drive_errors),
+        }
+
+    def _reconcile_catalog(self):
+        """Pone el catálogo al día con los manifiestos en disco (una vez por proceso)"""
+        on_disk = set(self._scan_snapshot_ids())
+        cataloged = set(self.catalog.ids('snapshot'))
+        put = [self._catalog_entry(self.load_manifest(snapshot_id)) for snapshot_id in on_disk - cataloged]
+
+        # Copias antiguas: un fichero completo por cada archivo del libro
+        if not self.catalog.loaded:
+            for file in os.listdir(self.local_backup_path):
+                if file.endswith(('.csv', '.parquet')):
+                    stat = os.stat(self.local_backup_path / file)
+                    put.append({
+                        'id': file,
+                        'kind': 'legacy',
+                        'date': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                        'files': [{'name': file, 'size': stat.st_size}],
+                        'size': stat.st_size,
+                        'stored_size': stat.st_size,
+                        'drive_sync': None,
+                        'drive_errors': [],
+                    })
+
+        remove = cataloged - on_disk
+        if put or remove or not self.catalog.loaded:
+            self.catalog.update(put=put, remove=remove)
+
+    def snapshot_ids(self):
+        """Identificadores de las copias, del más antiguo al más reciente"""
+        return self.catalog.ids('snapshot')
+
+    def load_manifest(self, snapshot_id):
+        with open(self._manifest_path(snapshot_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _latest_manifest(self):
+        snapshot_ids = self.snapshot_ids()
+        if not snapshot_ids:
+            return None
+        entry = self.catalog.get(snapshot_ids[-1])
+        return {'id': entry['id'], 'files': entry['files']}
+
+    def _store_object(self, content):
+        """Guarda el contenido comprimido si no existe ya; devuelve (hash, nuevo)"""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object_path(digest)
+        if path.exists():
+            return digest, False
+        self._write_atomic(path, gzip.compress(content, compresslevel=6))
+        return digest, True
+
+    def read_object(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def _capture_ledger(self, previous_files):
+        """Guarda como objetos los ficheros del libro y devuelve sus entradas.
+
+        Se leen con el bloqueo del libro tomado, para que la instantánea, el
+        diario y la base de datos sean del mismo estado.
+        """
+        entries = []
+        data_dir = Path(self.drive_manager.local_data_dir)
+        with get_ledger_lock(self.drive_manager.local_data_dir):
+            for file_name in LEDGER_FILES:
+                source_path = data_dir / file_name
+                if not source_path.exists():
+                    continue
+                if is_sqlite_file(file_name):
+                    # La base de datos se copia a través de SQLite para incluir el WAL
+                    mtime_ns = sqlite_mtime_ns(source_path)
+                    content = read_sqlite_file(source_path)
+                else:
+                    stat = source_path.stat()
+                    mtime_ns = stat.st_mtime_ns
+                    entry = previous_files.get(file_name)
+                    # Mismo tamaño y fecha de modificación: no hace falta leerlo
+                    if (entry is not None and entry['size'] == stat.st_size
+                            and entry['mtime_ns'] == stat.st_mtime_ns
+                            and self._object_path(entry['sha256']).exists()):
+                        entries.append(dict(entry))
+                        continue
+                    content = source_path.read_bytes()
+
+                digest, _ = self._store_object(content)
+                entries.append({
+                    'name': file_name,
+                    'sha256': digest,
+                    'size': len(content),
+                    'mtime_ns': mtime_ns,
+                    'stored_size': self._object_path(digest).stat().st_size
+                })
+        return entries
 
     def create_backup(self):
         """Crea una copia de seguridad de los archivos de datos"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Lista de archivos a respaldar
-        files_to_backup = ['transactions.csv', 'balance.csv']
-        
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+
         backup_info = {
             'timestamp': timestamp,
             'files': [],
-            'status': 'success'
+            'status': 'success',
+            'unchanged': False
         }
 
         try:
-            for file_name in files_to_backup:
-                source_path = Path("data") / file_name
-                if source_path.exists():
-                    # Crear nombre del archivo de backup
-                    backup_filename = f"{file_name.split('.')[0]}_{timestamp}.csv"
-                    backup_path = self.local_backup_path / backup_filename
-
-                    # Hacer copia local
-                    shutil.copy2(source_path, backup_path)
-
-                    # Si hay conexión a Drive, subir también allí
-                    if self.drive_manager.service:
-                        try:
-                            with open(backup_path, 'rb') as f:
-                                df = pd.read_csv(f)
-                                self.drive_manager.save_data(
-                                    df,
-                                    f"backups/{backup_filename}"
-                                )
-                            backup_info['files'].append({
-                                'name': file_name,
-                                'backup_name': backup_filename,
-                                'drive_sync': True
-                            })
-                        except Exception as e:
-                            backup_info['files'].append({
-                                'name': file_name,
-                                'backup_name': backup_filename,
-                                'drive_sync': False,
-                                'error': str(e)
-                            })
-                    else:
-                        backup_info['files'].append({
-                            'name': file_name,
-                            'backup_name': backup_filename,
-                            'drive_sync': False
-                        })
+            with self._lock:
+                previous = self._latest_manifest()
+                previous_files = {entry['name']: entry for entry in previous['files']} if previous else {}
+
+                entries = self._capture_ledger(previous_files)
+
+                unchanged = previous is not None and (
+                    [(entry['name'], entry['sha256']) for entry in entries]
+                    == [(entry['name'], entry['sha256']) for entry in previous['files']]
+                )
+                if unchanged:
+                    backup_info['unchanged'] = True
+                    backup_info['timestamp'] = previous['id']
+                    # La copia anterior pudo quedarse a medio subir: se reintenta
+                    uploads = []
+                    if self.catalog.get(previous['id']).get('drive_sync') is not True:
+                        uploads = self._sync_to_drive(previous)
+                    backup_info['uploads'] = uploads
+                    backup_info['files'] = self._files_info(previous, previous_files, uploads)
+                    return backup_info
+
+                # Los identificadores tienen que ser crecientes aunque se hagan
+                # dos copias en el mismo segundo
+                if previous is not None and timestamp <= previous['id']:
+                    timestamp = (datetime.strptime(previous['id'], TIMESTAMP_FORMAT)
+                                 + timedelta(seconds=1)).strftime(TIMESTAMP_FORMAT)
+                backup_info['timestamp'] = timestamp
+
+                manifest = {
+                    'id': timestamp,
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                    'files': entries
+                }
+                manifest_path = self._manifest_path(timestamp)
+                self._write_atomic(manifest_path, json.dumps(manifest, indent=1).encode('utf-8'))
+
+                # Primero queda registrada; después se anota el resultado de la subida
+                self.catalog.update(put=[self._catalog_entry(manifest)])
+
+                # Si hay conexión a Drive, subir allí los objetos que falten y el manifiesto
+                uploads = self._sync_to_drive(manifest)
+                backup_info['uploads'] = uploads
+                backup_info['files'] = self._files_info(manifest, previous_files, uploads)
+
+                backup_info['pruned'] = self._apply_retention()
 
         except Exception as e:
             backup_info['status'] = 'error'
@@ -74,33 +262,227 @@ class BackupManager:
 
         return backup_info
 
-    def list_backups(self):
-        """Lista todos los backups disponibles"""
-        backups = []
-        if os.path.exists(self.local_backup_path):
-            for file in os.listdir(self.local_backup_path):
-                if file.endswith('.csv'):
-                    file_path = self.local_backup_path / file
-                    backups.append({
-                        'filename': file,
-                        'date': datetime.fromtimestamp(os.path.getmtime(file_path)),
-                        'size': os.path.getsize(file_path)
-                    })
-        
-        return sorted(backups, key=lambda x: x['date'], reverse=True)
+    def _sync_to_drive(self, manifest):
+        """Sube los objetos de la copia que aún no están en Drive y su manifiesto.
+
+        Los objetos subidos y el estado de la copia quedan anotados en el
+        catálogo, así que lo que falle se vuelve a intentar con la siguiente.
+        Devuelve el resultado de cada subida, o una lista vacía sin conexión.
+        """
+        missing = sorted({entry['sha256'] for entry in manifest['files']}
+                         - self.catalog.uploaded_objects())
+        uploads = self._upload_to_drive(missing, self._manifest_path(manifest['id']))
+        if uploads:
+            uploaded = [digest for digest, result in zip(missing, uploads) if result['drive_sync']]
+            failed = [result['name'] for result in uploads if not result['drive_sync']]
+            self.catalog.update(put=[self._catalog_entry(manifest, not failed, failed)],
+                                uploaded=uploaded)
+        return uploads
+
+    def _files_info(self, manifest, previous_files, uploads):
+        """Resultado por fichero de la copia: si está en Drive y si cambió"""
+        synced = self.catalog.get(manifest['id']).get('drive_sync') is True
+        errors = {result['name']: result['error'] for result in uploads if not result['drive_sync']}
+        manifest_error = errors.get(self._drive_name(self._manifest_path(manifest['id'])))
+        files = []
+        for entry in manifest['files']:
+            file_info = {
+                'name': entry['name'],
+                'backup_name': manifest['id'],
+                'drive_sync': synced,
+                'changed': previous_files.get(entry['name'], {}).get('sha256') != entry['sha256']
+            }
+            error = errors.get(self._drive_name(self._object_path(entry['sha256']))) or manifest_error
+            if error:
+                file_info['error'] = error
+            files.append(file_info)
+        return files
+
+    def _upload_file(self, path, mimetype):
+        name = self._drive_name(path)
+        try:
+            self.drive_manager.upload_file(name, mimetype)
+            return {'name': name, 'drive_sync': True, 'size': path.stat().st_size}
+        except Exception as e:
+            return {'name': name, 'drive_sync': False, 'error': str(e)}
+
+    def _upload_to_drive(self, digests, manifest_path):
+        """Sube los objetos en paralelo y después el manifiesto.
+
+        Devuelve el resultado de cada fichero (el manifiesto el último), o
+        una lista vacía si no hay conexión.
+        """
+        if not self.drive_manager.service:
+            return []
+
+        paths = [self._object_path(digest) for digest in digests]
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+            results = list(executor.map(lambda path: self._upload_file(path, OBJECT_MIMETYPE), paths))
+
+        # El manifiesto solo se sube si están todos sus objetos
+        if all(result['drive_sync'] for result in results):
+            results.append(self._upload_file(manifest_path, MANIFEST_MIMETYPE))
+        else:
+            results.append({
+                'name': self._drive_name(manifest_path),
+                'drive_sync': False,
+                'error': "No se subió el manifiesto porque faltan objetos"
+            })
+        return results
+
+    def _apply_retention(self):
+        """Poda las copias según la política y borra los objetos huérfanos"""
+        snapshot_ids = self.snapshot_ids()
+        if not snapshot_ids:
+            return []
+        dates = {snapshot_id: datetime.strptime(snapshot_id, TIMESTAMP_FORMAT) for snapshot_id in snapshot_ids}
+
+        # La más reciente se conserva siempre
+        keep = {snapshot_ids[-1]}
+        for period, count in self.retention.items():
+            buckets = set()
+            for snapshot_id in reversed(snapshot_ids):
+                bucket = _retention_bucket(dates[snapshot_id], period)
+                if bucket in buckets:
+                    continue
+                if len(buckets) >= count:
+                    break
+                buckets.add(bucket)
+                keep.add(snapshot_id)
+
+        pruned = [snapshot_id for snapshot_id in snapshot_ids if snapshot_id not in keep]
+        if not pruned:
+            return []
+
+        # Se quitan del catálogo antes de borrar nada: una copia catalogada
+        # siempre tiene su manifiesto y sus objetos
+        self.catalog.update(remove=pruned)
+        removed_paths = []
+        for snapshot_id in pruned:
+            path = self._manifest_path(snapshot_id)
+            self._remove(path)
+            removed_paths.append(path)
+
+        referenced = set()
+        for snapshot_id in keep:
+            referenced.update(entry['sha256'] for entry in self.catalog.get(snapshot_id)['files'])
+        removed_objects = []
+        for file_name in os.listdir(self.objects_path):
+            if (file_name.endswith('.gz') and not file_name.startswith('.')
+                    and file_name[:-len('.gz')] not in referenced):
+                path = self.objects_path / file_name
+                self._remove(path)
+                removed_paths.append(path)
+                removed_objects.append(file_name[:-len('.gz')])
+        if removed_objects:
+            self.catalog.update(forgotten=removed_objects)
+
+        if self.drive_manager.service:
+            for path in removed_paths:
+                self.drive_manager.delete_file(self._drive_name(path))
+        return pruned
+
+    def list_backups(self, offset=0, limit=None, start_date=None, end_date=None, file_name=None,
+                     drive_state=None):
+        """Lista las copias disponibles desde el catálogo; devuelve (página, total)"""
+        entries, total = self.catalog.query(offset, limit, start_date, end_date, file_name, drive_state)
+        backups = [{
+            'filename': entry['id'],
+            'date': datetime.fromisoformat(entry['date']),
+            'size': entry['size'],
+            'stored_size': entry['stored_size'],
+            'files': [item['name'] for item in entry['files']],
+            'drive_sync': entry.get('drive_sync'),
+        } for entry in entries]
+        return backups, total
+
+    def read_manifest_file(self, manifest, file_name):
+        """(DataFrame, entrada del manifiesto) de un fichero de la copia, o (None, None)"""
+        entry = next((entry for entry in manifest['files'] if entry['name'] == file_name), None)
+        if entry is None:
+            return None, None
+        content = self.read_object(entry['sha256'])
+        return self.drive_manager.parse_content(file_name, content), entry
+
+    def snapshot_state(self, manifest):
+        """(transacciones, saldo inicial, journal_seq) de la instantánea de una copia"""
+        # Si la copia tiene los dos formatos, el más reciente es el que estaba en uso
+        candidates = []
+        for file_name in TRANSACTION_FILES.values():
+            transactions, entry = self.read_manifest_file(manifest, file_name)
+            if transactions is not None:
+                candidates.append((entry['mtime_ns'], transactions, None))
+        # La base de datos SQLite trae también el saldo inicial
+        database = next((entry for entry in manifest['files']
+                         if entry['name'] == SQLiteStorage.DATABASE_FILE), None)
+        if database is not None:
+            transactions, initial_balance = SQLiteStorage.read_database(
+                self.read_object(database['sha256'])
+            )
+            candidates.append((database['mtime_ns'], transactions, initial_balance))
+        transactions, initial_balance = None, None
+        if candidates:
+            _, transactions, initial_balance = max(candidates, key=lambda candidate: candidate[0])
+        if transactions is None or transactions.empty:
+            transactions = empty_transactions()
+
+        balance_df, _ = self.read_manifest_file(manifest, 'balance.csv')
+        if balance_df is None or balance_df.empty:
+            return transactions, initial_balance or 0.0, 0
+        journal_seq = int(balance_df['journal_seq'].iloc[0]) if 'journal_seq' in balance_df.columns else 0
+        if initial_balance is None:
+            initial_balance = float(balance_df['balance'].iloc[0])
+        return transactions, initial_balance, journal_seq
+
+    def ledger_state(self, snapshot_id):
+        """(transacciones, saldo inicial) del libro guardado en una copia,
+        con los registros de su diario ya aplicados"""
+        manifest = self.load_manifest(snapshot_id)
+        transactions, initial_balance, journal_seq = self.snapshot_state(manifest)
+        journal, _ = self.read_manifest_file(manifest, JournalStorage.JOURNAL_FILE)
+        if journal is not None and not journal.empty:
+            journal['seq'] = journal['seq'].astype(int)
+            journal = journal[journal['seq'] > journal_seq].sort_values('seq')
+            if not journal.empty:
+                transactions, initial_balance = replay_journal(transactions, initial_balance, journal)
+        return transactions[TRANSACTION_COLUMNS].reset_index(drop=True), initial_balance
+
+    def restore_backup(self, backup_filename, financial_manager):
+        """Restaura un backup específico.
+
+        El libro se sustituye con `financial_manager.replace_ledger`, que toma
+        el bloqueo del libro, lo guarda en el modo de almacenamiento actual y
+        retira las copias en caché de todas las sesiones.
+        """
+        entry = self.catalog.get(backup_filename)
+        if entry is not None and entry['kind'] == 'snapshot':
+            return self._restore_snapshot(backup_filename, financial_manager)
 
-    def restore_backup(self, backup_filename):
-        """Restaura un backup específico"""
         backup_path = self.local_backup_path / backup_filename
         if not backup_path.exists():
             raise FileNotFoundError(f"No se encontró el archivo de backup: {backup_filename}")
 
-        # Extraer el nombre original del archivo
-        original_name = backup_filename.split('_')[0] + '.csv'
-        destination_path = Path("data") / original_name
+        # Extraer el nombre original del archivo: <nombre>_<AAAAMMDD>_<HHMMSS><ext>
+        stem, extension = os.path.splitext(backup_filename)
+        original_name = stem.rsplit('_', 2)[0] + extension
+
+        try:
+            data = self.drive_manager.parse_content(original_name, backup_path.read_bytes())
+            # Las copias antiguas son de un solo fichero: el resto del libro se conserva
+            if original_name == 'balance.csv':
+                financial_manager.replace_ledger(financial_manager.transactions,
+                                                 float(data['balance'].iloc[0]))
+            else:
+                transactions = data if not data.empty else empty_transactions()
+                financial_manager.replace_ledger(transactions, financial_manager.initial_balance)
+            return True
+        except Exception as e:
+            raise Exception(f"Error al restaurar el backup: {str(e)}")
 
+    def _restore_snapshot(self, snapshot_id, financial_manager):
         try:
-            shutil.copy2(backup_path, destination_path)
+            transactions, initial_balance = self.ledger_state(snapshot_id)
+            financial_manager.replace_ledger(transactions, initial_balance)
             return True
         except Exception as e:
             raise Exception(f"Error al restaurar el backup: {str(e)}")
@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: no se coordina con otros procesos
+    fcntl = None
+
+INTERVALS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(days=7),
+    'monthly': timedelta(days=30),
+}
+# Trabajos que se conservan en el historial
+HISTORY_SIZE = 50
+# Espera antes de reintentar una copia automática fallida
+RETRY_DELAY = timedelta(minutes=15)
+
+
+class BackupScheduler:
+    """Copias de seguridad automáticas en un hilo de fondo.
+
+    Hay un planificador por proceso (main.py lo crea con st.cache_resource).
+    La frecuencia, la hora de la última copia y el historial de trabajos se
+    guardan en disco, así que un reinicio no repite una copia que ya se hizo;
+    un flock sobre .backup.lock impide que dos procesos la hagan a la vez, y
+    el sistema lo libera si el proceso muere. Las copias manuales también se
+    ejecutan en este hilo.
+    """
+
+    def __init__(self, backup_manager, state_path, check_interval=60):
+        self.backup_manager = backup_manager
+        self.state_path = state_path
+        self.lock_path = os.path.join(os.path.dirname(state_path), '.backup.lock')
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._run_requested = False
+        self._running = False
+        # Última copia pedida que no se hizo porque otro proceso estaba haciendo una
+        self._skipped = None
+        self._thread = None
+        self._state = self._load_state()
+
+    def _load_state(self):
+        state = {'interval': 'daily', 'last_run': None, 'last_attempt': None, 'history': []}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return state
+
+    def _persist(self):
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f, indent=1)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"Error al guardar el estado de las copias automáticas: {str(e)}")
+
+    def start(self):
+        """Arranca el hilo; llamarlo más de una vez no tiene efecto"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name='backup-scheduler', daemon=True)
+            self._thread.start()
+
+    @property
+    def interval(self):
+        return self._state['interval']
+
+    def set_interval(self, interval):
+        if interval not in INTERVALS:
+            raise ValueError(f"Frecuencia no válida: {interval}")
+        with self._lock:
+            self._state['interval'] = interval
+            self._persist()
+        self._wake.set()
+
+    def next_run(self):
+        """Fecha de la próxima copia automática; None si aún no se ha hecho ninguna"""
+        with self._lock:
+            last_run = self._state['last_run']
+            if last_run is None:
+                return None
+            return datetime.fromisoformat(last_run) + INTERVALS[self._state['interval']]
+
+    def _due(self):
+        next_run = self.next_run()
+        if next_run is not None and datetime.now() < next_run:
+            return False
+        last_attempt = self._state['last_attempt']
+        return last_attempt is None or datetime.now() - datetime.fromisoformat(last_attempt) >= RETRY_DELAY
+
+    def run_now(self):
+        """Pide una copia inmediata; la hace el hilo de fondo.
+
+        Devuelve False, sin pedirla, si ya hay una copia en curso en este o
+        en otro proceso.
+        """
+        with self._lock:
+            if self._running or self._run_requested:
+                return False
+        if self._lock_busy():
+            return False
+        with self._lock:
+            self._run_requested = True
+            self._skipped = None
+        self._wake.set()
+        return True
+
+    def status(self):
+        with self._lock:
+            return {
+                'interval': self._state['interval'],
+                'last_run': self._state['last_run'],
+                'running': self._running,
+                'requested': self._run_requested,
+                'skipped': self._skipped,
+                'history': list(reversed(self._state['history'])),
+            }
+
+    def _loop(self):
+        while True:
+            try:
+                with self._lock:
+                    requested = self._run_requested
+                    self._run_requested = False
+                if requested or self._due():
+                    self._run_job('manual' if requested else 'scheduled')
+            except Exception as e:
+                print(f"Error en las copias automáticas: {str(e)}")
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def _try_flock(self):
+        """Fichero de bloqueo abierto y con flock exclusivo, o None si lo tiene otro"""
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        except Exception:
+            lock_file.close()
+            raise
+        return lock_file
+
+    def _lock_busy(self):
+        """True si otro proceso está haciendo una copia"""
+        if fcntl is None:
+            return False
+        lock_file = self._try_flock()
+        if lock_file is None:
+            return True
+        lock_file.close()
+        return False
+
+    def _run_job(self, trigger):
+        lock_file = self._try_flock() if fcntl is not None else None
+        if fcntl is not None and lock_file is None:
+            print("Otra instancia está haciendo una copia de seguridad; se omite esta ejecución")
+            if trigger == 'manual':
+                with self._lock:
+                    self._skipped = datetime.now().isoformat(timespec='seconds')
+            return None
+
+        try:
+            # Otro proceso pudo hacer la copia mientras esperábamos
+            persisted = self._load_state()
+            with self._lock:
+                for key in ('last_run', 'last_attempt', 'history'):
+                    self._state[key] = persisted[key]
+            if trigger == 'scheduled' and not self._due():
+                return None
+
+            with self._lock:
+                self._running = True
+            started = time.monotonic()
+            started_at = datetime.now()
+            result = self.backup_manager.create_backup()
+            job = {
+                'started_at': started_at.isoformat(timespec='seconds'),
+                'duration': round(time.monotonic() - started, 3),
+                'trigger': trigger,
+                'status': result['status'],
+                'snapshot': result.get('timestamp'),
+                'unchanged': result.get('unchanged', False),
+                'changed_files': [file_info['name'] for file_info in result.get('files', [])
+                                  if file_info.get('changed')],
+                'drive_errors': [file_info['name'] for file_info in result.get('uploads', [])
+                                 if not file_info['drive_sync']],
+                'error': result.get('error'),
+            }
+            with self._lock:
+                # Una copia fallida no cuenta: se reintentará pasado RETRY_DELAY
+                self._state['last_attempt'] = job['started_at']
+                if result['status'] == 'success':
+                    self._state['last_run'] = job['started_at']
+                self._state['history'] = (self._state['history'] + [job])[-HISTORY_SIZE:]
+                self._persist()
+            return job
+        finally:
+            with self._lock:
+                self._running = False
+            if lock_file is not None:
+                # Cerrar el descriptor libera el flock; el fichero se deja, porque
+                # borrarlo separaría a quien ya lo tenga abierto de los siguientes
+                lock_file.close()
@@ -0,0 +1,181 @@
+import io
+import unicodedata
+import pandas as pd
+from app.storage import TRANSACTION_COLUMNS
+
+# Nombres de columna habituales en las exportaciones de los bancos
+DATE_COLUMNS = ['fecha', 'fecha operacion', 'f. operacion', 'fecha valor', 'f. valor', 'date']
+DESCRIPTION_COLUMNS = ['concepto', 'descripcion', 'description', 'detalle', 'movimiento', 'observaciones']
+AMOUNT_COLUMNS = ['importe', 'amount', 'cantidad', 'importe eur', 'importe (eur)']
+DEBIT_COLUMNS = ['cargo', 'debe', 'cargos']
+CREDIT_COLUMNS = ['abono', 'haber', 'abonos']
+
+# Categoría sugerida según el concepto; el resto queda en "Otros"
+INCOME_RULES = {
+    'Cuota de socios': r'cuota|socio',
+    'Subvención': r'subvencion',
+    'Venta de Lotería': r'loteria',
+    'Donación': r'donacion|donativo',
+}
+EXPENSE_RULES = {
+    'Verbena': r'verbena',
+    'Charlas y talleres': r'charla|taller',
+    'Donaciones': r'donacion|donativo',
+}
+
+
+def _normalize_text(value):
+    text = unicodedata.normalize('NFKD', str(value))
+    return ''.join(c for c in text if not unicodedata.combining(c)).strip().lower()
+
+
+def _fold(series):
+    """Minúsculas y sin acentos, para comparar conceptos"""
+    return (series.fillna('').astype(str).str.lower()
+            .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii'))
+
+
+def _find_column(columns, candidates):
+    normalized = {_normalize_text(column): column for column in columns}
+    for candidate in candidates:
+        if candidate in normalized:
+            return normalized[candidate]
+    return None
+
+
+def parse_amounts(series):
+    """Convierte importes en texto ("1.234,56 €", "-12.5") a float"""
+    text = series.fillna('').astype(str).str.replace(r'[€\s]', '', regex=True)
+    # Coma decimal si algún valor termina en ",d" o ",dd"
+    if text.str.contains(r',\d{1,2}$', regex=True).any():
+        text = text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    else:
+        text = text.str.replace(',', '', regex=False)
+    return pd.to_numeric(text, errors='coerce')
+
+
+def parse_dates(series):
+    """Convierte fechas dd/mm/aaaa o aaaa-mm-dd al formato del libro"""
+    text = series.fillna('').astype(str).str.strip()
+    iso = text.str.match(r'^\d{4}-\d{2}-\d{2}')
+    dates = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    if iso.any():
+        dates[iso] = pd.to_datetime(text[iso].str.slice(0, 10), format='%Y-%m-%d', errors='coerce')
+    if (~iso).any():
+        dates[~iso] = pd.to_datetime(text[~iso], dayfirst=True, format='mixed', errors='coerce')
+    return dates.dt.strftime('%Y-%m-%d')
+
+
+def categorize(transactions):
+    """Asigna una categoría a partir del concepto"""
+    description = _fold(transactions['description'])
+    category = pd.Series('Otros', index=transactions.index, dtype=object)
+    for rules, transaction_type in ((INCOME_RULES, 'income'), (EXPENSE_RULES, 'expense')):
+        is_type = transactions['type'] == transaction_type
+        # Las primeras reglas tienen prioridad
+        for name, pattern in reversed(list(rules.items())):
+            category[is_type & description.str.contains(pattern, regex=True)] = name
+    return category
+
+
+def _finish(dates, amounts, descriptions):
+    """Construye el lote normalizado: importes en positivo y tipo según el signo"""
+    transactions = pd.DataFrame({
+        'date': dates,
+        'type': amounts.lt(0).map({True: 'expense', False: 'income'}),
+        'amount': amounts.abs().round(2),
+        'description': descriptions.fillna('').astype(str).str.strip(),
+    })
+    transactions = transactions[transactions['date'].notna() & transactions['amount'].notna()]
+    transactions = transactions[transactions['amount'] > 0]
+    transactions['category'] = categorize(transactions)
+    return transactions[TRANSACTION_COLUMNS].reset_index(drop=True)
+
+
+def parse_bank_csv(content):
+    """Lee un extracto CSV de banco (o un CSV exportado por esta aplicación)"""
+    text = _decode(content)
+    raw = pd.read_csv(io.StringIO(text), sep=None, engine='python', dtype=str)
+    raw.columns = [str(column).strip() for column in raw.columns]
+
+    # Formato propio de la aplicación: se respeta tipo y categoría
+    if set(TRANSACTION_COLUMNS).issubset(raw.columns):
+        transactions = raw[TRANSACTION_COLUMNS].copy()
+        transactions['date'] = parse_dates(transactions['date'])
+        transactions['amount'] = parse_amounts(transactions['amount']).abs()
+        transactions['description'] = transactions['description'].fillna('')
+        transactions = transactions.dropna(subset=['date', 'amount'])
+        return transactions[transactions['type'].isin(['income', 'expense'])].reset_index(drop=True)
+
+    date_column = _find_column(raw.columns, DATE_COLUMNS)
+    description_column = _find_column(raw.columns, DESCRIPTION_COLUMNS)
+    amount_column = _find_column(raw.columns, AMOUNT_COLUMNS)
+    if date_column is None or description_column is None:
+        raise ValueError("No se encontraron las columnas de fecha y concepto en el CSV")
+
+    if amount_column is not None:
+        amounts = parse_amounts(raw[amount_column])
+    else:
+        debit_column = _find_column(raw.columns, DEBIT_COLUMNS)
+        credit_column = _find_column(raw.columns, CREDIT_COLUMNS)
+        if debit_column is None or credit_column is None:
+            raise ValueError("No se encontró la columna de importe en el CSV")
+        amounts = (parse_amounts(raw[credit_column]).fillna(0)
+                   - parse_amounts(raw[debit_column]).abs().fillna(0))
+
+    return _finish(parse_dates(raw[date_column]), amounts, raw[description_column])
+
+
+def parse_norma43(content):
+    """Lee un fichero Norma 43 (AEB43) de movimientos de cuenta.
+
+    Los registros 22 son los movimientos y los 23 que les siguen amplían el
+    concepto. Todos los campos son de ancho fijo sobre líneas de 80 caracteres.
+    """
+    lines = pd.Series(_decode(content).splitlines()).str.pad(80, side='right')
+    codes = lines.str.slice(0, 2)
+    # Cada registro 23 pertenece al último registro 22 anterior
+    movement_id = (codes == '22').cumsum()
+
+    movements = lines[codes == '22']
+    if movements.empty:
+        raise ValueError("El fichero no contiene movimientos Norma 43")
+
+    dates = pd.to_datetime(movements.str.slice(10, 16), format='%y%m%d', errors='coerce')
+    amounts = pd.to_numeric(movements.str.slice(28, 42), errors='coerce') / 100
+    # Clave 1 = debe (cargo), 2 = haber (abono)
+    amounts = amounts.where(movements.str.slice(27, 28) == '2', -amounts)
+    reference = movements.str.slice(64, 80).str.strip()
+
+    complements = lines[codes == '23']
+    concepts = (complements.str.slice(4, 42).str.strip() + ' '
+                + complements.str.slice(42, 80).str.strip()).str.strip()
+    concepts = concepts.groupby(movement_id[codes == '23']).agg(' '.join)
+
+    descriptions = movement_id[codes == '22'].map(concepts).fillna('')
+    descriptions = descriptions.where(descriptions.str.len() > 0, reference)
+    descriptions = descriptions.where(descriptions.str.len() > 0, 'Movimiento bancario')
+
+    return _finish(dates.dt.strftime('%Y-%m-%d'), amounts, descriptions)
+
+
+def _decode(content):
+    if isinstance(content, str):
+        return content
+    for encoding in ('utf-8-sig', 'latin-1'):
+        try:
+            return content.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return content.decode('utf-8', errors='replace')
+
+
+def parse_statement(content, file_name):
+    """Detecta el formato del extracto por su contenido y lo normaliza"""
+    text = _decode(content)
+    first_line = text.lstrip('\ufeff').split('\n', 1)[0]
+    if first_line.startswith('11') and len(first_line.rstrip('\r')) == 80:
+        return parse_norma43(text)
+    if file_name.lower().endswith(('.n43', '.aeb', '.q43')):
+        return parse_norma43(text)
+    return parse_bank_csv(text)
@@ -0,0 +1,26 @@
+import plotly.graph_objects as go
+
+
+class CachedFigure(go.Figure):
+    """Figura de Plotly que guarda su serialización.
+
+    Se comparte entre sesiones a través de la caché del libro, así que no
+    debe modificarse una vez creada. Streamlit llama a `to_dict` en cada
+    ejecución; con esta clase el diccionario y el JSON se calculan una vez.
+    """
+
+    def to_dict(self):
+        cached = self.__dict__.get('_cached_dict')
+        if cached is None:
+            cached = super().to_dict()
+            self.__dict__['_cached_dict'] = cached
+        return cached
+
+    def to_json(self, *args, **kwargs):
+        if args or kwargs:
+            return super().to_json(*args, **kwargs)
+        cached = self.__dict__.get('_cached_json')
+        if cached is None:
+            cached = super().to_json()
+            self.__dict__['_cached_json'] = cached
+        return cached
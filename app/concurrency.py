@@ -0,0 +1,165 @@
+import os
+import threading
+import pandas as pd
+from app.storage import TRANSACTION_COLUMNS
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se serializan los hilos del proceso
+    fcntl = None
+
+LOCK_FILE = '.ledger.lock'
+
+
+class LedgerConflict(Exception):
+    """El movimiento que se quería modificar lo ha cambiado o borrado otra sesión"""
+
+
+class LedgerLock:
+    """Bloqueo de escritura del libro para todos los procesos que comparten data/.
+
+    Se toma con `with` alrededor de comprobar la versión y guardar; entre
+    procesos usa flock sobre data/.ledger.lock, que el sistema libera aunque
+    el proceso termine sin soltarlo.
+    """
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, LOCK_FILE)
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except Exception:
+                self._close()
+                self._thread_lock.release()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._close()
+        self._thread_lock.release()
+        return False
+
+    def _close(self):
+        if self._file is not None:
+            # Cerrar el descriptor libera el flock
+            self._file.close()
+            self._file = None
+
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def get_ledger_lock(data_dir):
+    """Bloqueo del libro guardado en `data_dir`, uno por proceso"""
+    with _locks_lock:
+        lock = _locks.get(data_dir)
+        if lock is None:
+            lock = _locks[data_dir] = LedgerLock(data_dir)
+        return lock
+
+
+def _row_key(row):
+    """(fecha, tipo, categoría, céntimos, concepto) para comparar filas"""
+    values = []
+    for column in ('date', 'type', 'category'):
+        value = row[column]
+        values.append('' if pd.isna(value) else str(value))
+    amount = row['amount']
+    values.append(0 if pd.isna(amount) else int(round(float(amount) * 100)))
+    description = row['description']
+    values.append('' if pd.isna(description) else str(description))
+    return tuple(values)
+
+
+def _frame_keys(frame):
+    return [_row_key(row) for row in frame[TRANSACTION_COLUMNS].to_dict('records')]
+
+
+def _locate(keys, key, occurrence, expected):
+    """Posición actual de la fila `occurrence`-ésima (desde 0) con clave `key`.
+
+    `expected` es cuántas filas idénticas había en el libro de la sesión. Si
+    ahora hay otro número, otra sesión ha añadido, cambiado o borrado alguna
+    gemela y no se sabe cuál era: LedgerConflict. None si ya no queda ninguna.
+    """
+    matches = [position for position, row_key in enumerate(keys) if row_key == key]
+    if not matches:
+        return None
+    if len(matches) != expected:
+        raise LedgerConflict(
+            "Otro usuario ha modificado movimientos idénticos a este mientras lo editabas"
+        )
+    return matches[occurrence]
+
+
+def rebase_changes(transactions, initial_balance, changes, base_transactions):
+    """Aplica `changes` sobre el último estado guardado por otra sesión.
+
+    `base_transactions` es el libro sobre el que la sesión hizo los cambios.
+    Las filas de las modificaciones y bajas se buscan de nuevo por su
+    contenido anterior (`old`) y por cuántas filas idénticas tenía delante,
+    nunca por cercanía. Borrar una fila que ya no existe no hace nada;
+    modificar una que otra sesión cambió o borró, o tocar una de varias
+    filas idénticas cuando su número ha cambiado, lanza LedgerConflict.
+    Devuelve (transactions, initial_balance, changes) con las posiciones
+    corregidas.
+    """
+    frame = transactions[TRANSACTION_COLUMNS].reset_index(drop=True)
+    keys = _frame_keys(frame)
+    # Claves del libro de la sesión, al día con sus propios cambios
+    base_keys = _frame_keys(base_transactions)
+    pending_adds = []
+    rebased = []
+
+    def flush_adds():
+        nonlocal frame
+        if pending_adds:
+            frame = pd.concat([frame, pd.DataFrame(pending_adds)], ignore_index=True)
+            pending_adds.clear()
+
+    for change in changes:
+        op = change['op']
+        if op == 'add':
+            pending_adds.append(change['row'])
+            keys.append(_row_key(change['row']))
+            base_keys.append(_row_key(change['row']))
+            rebased.append(change)
+        elif op == 'balance':
+            initial_balance = float(change['balance'])
+            rebased.append(change)
+        elif op in ('update', 'delete'):
+            flush_adds()
+            index = int(change['index'])
+            key = _row_key(change['old'])
+            occurrence = base_keys[:index].count(key)
+            position = _locate(keys, key, occurrence, base_keys.count(key))
+            if op == 'update':
+                base_keys[index] = _row_key(change['row'])
+            else:
+                del base_keys[index]
+            if position is None:
+                if op == 'update' and _row_key(change['row']) not in keys:
+                    raise LedgerConflict(
+                        "Otro usuario ha modificado o eliminado este movimiento mientras lo editabas"
+                    )
+                # Ya estaba borrada, o ya tiene exactamente el contenido nuevo
+                continue
+            if op == 'update':
+                for column in TRANSACTION_COLUMNS:
+                    frame.at[position, column] = change['row'][column]
+                keys[position] = _row_key(change['row'])
+            else:
+                frame = frame.drop(position).reset_index(drop=True)
+                del keys[position]
+            rebased.append(dict(change, index=position))
+
+    flush_adds()
+    return frame, initial_balance, rebased
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+class DateIndex:
+    """Índice ordenado por fecha sobre las posiciones del libro.
+
+    El libro conserva el orden de alta (las posiciones son los ID que ve el
+    usuario y los que usa el diario); el índice guarda esas posiciones
+    ordenadas por fecha para responder consultas por rango con búsqueda
+    binaria.
+    """
+
+    def __init__(self, dates, order):
+        # dates[i] es la fecha de la fila order[i]; ambos ordenados por fecha
+        self.dates = dates
+        self.order = order
+        self._is_identity = None
+
+    @staticmethod
+    def _normalize(dates):
+        return dates.fillna('').astype(str).to_numpy(dtype=object)
+
+    @classmethod
+    def from_frame(cls, transactions):
+        dates = cls._normalize(transactions['date'])
+        order = np.argsort(dates, kind='stable')
+        return cls(dates[order], order.astype(np.int64))
+
+    def copy(self):
+        return DateIndex(self.dates.copy(), self.order.copy())
+
+    def __len__(self):
+        return len(self.order)
+
+    @property
+    def is_identity(self):
+        """True si el libro ya está ordenado por fecha"""
+        if self._is_identity is None:
+            self._is_identity = bool(np.array_equal(self.order, np.arange(len(self.order))))
+        return self._is_identity
+
+    def _find(self, position, date):
+        """Posición dentro del índice de la fila `position`"""
+        lo = np.searchsorted(self.dates, date, side='left')
+        hi = np.searchsorted(self.dates, date, side='right')
+        matches = np.flatnonzero(self.order[lo:hi] == position)
+        if len(matches) == 0:
+            raise KeyError(position)
+        return lo + matches[0]
+
+    def insert_many(self, first_position, dates):
+        """Añade filas nuevas al final del libro, a partir de `first_position`"""
+        dates = self._normalize(dates)
+        if len(dates) == 0:
+            return
+        batch_order = np.argsort(dates, kind='stable')
+        sorted_dates = dates[batch_order]
+        slots = np.searchsorted(self.dates, sorted_dates, side='right')
+        self.dates = np.insert(self.dates, slots, sorted_dates)
+        self.order = np.insert(self.order, slots, batch_order + first_position)
+        self._is_identity = None
+
+    def insert(self, position, date):
+        # Con la misma fecha, las filas quedan ordenadas por posición
+        date = str(date)
+        lo = np.searchsorted(self.dates, date, side='left')
+        hi = np.searchsorted(self.dates, date, side='right')
+        slot = lo + np.searchsorted(self.order[lo:hi], position)
+        self.dates = np.insert(self.dates, slot, date)
+        self.order = np.insert(self.order, slot, position)
+        self._is_identity = None
+
+    def update(self, position, old_date, new_date):
+        slot = self._find(position, str(old_date))
+        self.dates = np.delete(self.dates, slot)
+        self.order = np.delete(self.order, slot)
+        self.insert(position, new_date)
+
+    def delete(self, position, date):
+        """Quita la fila; las posiciones posteriores se desplazan una hacia atrás"""
+        slot = self._find(position, str(date))
+        self.dates = np.delete(self.dates, slot)
+        self.order = np.delete(self.order, slot)
+        self.order[self.order > position] -= 1
+        self._is_identity = None
+
+    def range(self, start_date=None, end_date=None):
+        """Devuelve (inicio, fin) dentro del índice para el rango [start, end]"""
+        lo = 0 if start_date is None else np.searchsorted(self.dates, start_date, side='left')
+        hi = len(self.dates) if end_date is None else np.searchsorted(self.dates, end_date, side='right')
+        return int(lo), int(max(hi, lo))
+
+    def positions(self, start_date=None, end_date=None):
+        """Posiciones en el libro del rango, ordenadas por fecha (vista, sin copia)"""
+        lo, hi = self.range(start_date, end_date)
+        return self.order[lo:hi]
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+
+
+class DriveFileCache:
+    """Persistent name -> Drive file metadata cache.
+
+    Entries expire after `ttl` seconds. A cached `None` means the file is known
+    not to exist in the folder, which saves the lookup before creating it.
+    Those negative entries only last `negative_ttl` seconds, so a file that
+    another machine creates becomes visible quickly.
+    """
+
+    def __init__(self, cache_path, ttl=300, negative_ttl=15):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._folder_id = None
+        self._entries = {}
+        # Time of the last full folder listing: until it expires, names that
+        # were not listed are known to be missing
+        self._listed_at = 0
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._folder_id = data.get('folder_id')
+            self._entries = data.get('files', {})
+            self._listed_at = data.get('listed_at', 0)
+        except (OSError, ValueError):
+            self._folder_id = None
+            self._entries = {}
+            self._listed_at = 0
+
+    def _persist(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'folder_id': self._folder_id,
+                    'listed_at': self._listed_at,
+                    'files': self._entries
+                }, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Error saving Drive file cache: {str(e)}")
+
+    def _check_folder(self, folder_id):
+        # The cache only describes one folder; changing it drops every entry
+        if folder_id != self._folder_id:
+            self._folder_id = folder_id
+            self._entries = {}
+            self._listed_at = 0
+
+    def get(self, folder_id, file_name, max_age=None):
+        """Return (found, metadata); metadata is None for known missing files.
+
+        `max_age` overrides the TTL for callers that need fresher metadata.
+        """
+        ttl = self.ttl if max_age is None else max_age
+        negative_ttl = min(ttl, self.negative_ttl)
+        with self._lock:
+            self._check_folder(folder_id)
+            now = time.time()
+            entry = self._entries.get(file_name)
+            if entry is None and now - self._listed_at <= negative_ttl:
+                self.hits += 1
+                return True, None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            if now - entry['cached_at'] > (ttl if entry['metadata'] is not None else negative_ttl):
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry['metadata']
+
+    def put(self, folder_id, file_name, metadata):
+        with self._lock:
+            self._check_folder(folder_id)
+            self._entries[file_name] = {'metadata': metadata, 'cached_at': time.time()}
+            self._persist()
+
+    def replace_all(self, folder_id, files):
+        """Replace the cache with a full folder listing"""
+        with self._lock:
+            self._folder_id = folder_id
+            now = time.time()
+            self._listed_at = now
+            self._entries = {}
+            for metadata in files:
+                self._entries[metadata['name']] = {'metadata': metadata, 'cached_at': now}
+            self._persist()
+
+    def invalidate(self, file_name=None):
+        """Forget `file_name` (or everything); the next get() for it is a miss"""
+        with self._lock:
+            if file_name is None:
+                self._entries = {}
+                self._listed_at = 0
+            else:
+                # An already expired entry rather than no entry: a missing name
+                # would count as known missing until the folder listing expires
+                self._entries[file_name] = {'metadata': None, 'cached_at': 0}
+            self._persist()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
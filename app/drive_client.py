@@ -0,0 +1,225 @@
+from functools import partial
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2 import service_account
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+import httplib2
+from app.metrics import measure
+import json
+import os
+import random
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
+
+SCOPES = ['https://www.googleapis.com/auth/drive']
+# Retries for rate limits, server errors and dropped connections
+MAX_RETRIES = 5
+# Exponential backoff: the cap doubles from BACKOFF_BASE up to BACKOFF_MAX seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 32
+HTTP_TIMEOUT = 60
+# Connections kept open to Google's servers (shared by every thread)
+POOL_SIZE = 10
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def load_credentials():
+    """Service account credentials from the GCP_* environment variables"""
+    if not all(os.getenv(key) for key in [
+        "GCP_PROJECT_ID", "GCP_PRIVATE_KEY_ID", "GCP_PRIVATE_KEY",
+        "GCP_CLIENT_EMAIL", "GCP_CLIENT_ID", "GCP_CLIENT_X509_CERT_URL"
+    ]):
+        raise ValueError("Missing required service account values in environment variables")
+
+    service_account_info = {
+        "type": "service_account",
+        "project_id": os.getenv("GCP_PROJECT_ID"),
+        "private_key_id": os.getenv("GCP_PRIVATE_KEY_ID"),
+        "private_key": os.getenv("GCP_PRIVATE_KEY").replace('\\n', '\n'),
+        "client_email": os.getenv("GCP_CLIENT_EMAIL"),
+        "client_id": os.getenv("GCP_CLIENT_ID"),
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        "client_x509_cert_url": os.getenv("GCP_CLIENT_X509_CERT_URL")
+    }
+    return service_account.Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
+
+
+class RequestStats:
+    """Thread-safe counters for Drive requests and retries"""
+
+    FIELDS = ('requests', 'retries', 'rate_limited', 'server_errors', 'connection_errors',
+              'failed', 'backoff_seconds')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, field, amount=1):
+        with self._lock:
+            self._counters[field] += amount
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters['backoff_seconds'] = round(counters['backoff_seconds'], 3)
+        return counters
+
+
+def _retry_reason(error):
+    """Counter to record if `error` is worth retrying, otherwise None"""
+    if not isinstance(error, HttpError):
+        return 'connection_errors'
+    status = error.resp.status
+    if status == 429:
+        return 'rate_limited'
+    if status >= 500:
+        return 'server_errors'
+    if status == 403 and any(reason in (error.content or b'').decode('utf-8', 'replace')
+                             for reason in RATE_LIMIT_REASONS):
+        return 'rate_limited'
+    return None
+
+
+def _retry_after(error):
+    """Seconds requested by the server's Retry-After header, if any"""
+    if isinstance(error, HttpError):
+        try:
+            return float(error.resp.get('retry-after'))
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+# Transient failures that are worth another attempt (HttpError only for some statuses)
+RETRYABLE_ERRORS = (HttpError, requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    ConnectionError, TimeoutError)
+
+
+def call_with_retries(call, stats=None, max_retries=MAX_RETRIES):
+    """Run `call()`, retrying transient failures with exponential backoff and full jitter"""
+    stats = stats or RequestStats()
+    attempt = 0
+    while True:
+        stats.add('requests')
+        try:
+            return call()
+        except RETRYABLE_ERRORS as e:
+            reason = _retry_reason(e)
+            if reason is not None:
+                stats.add(reason)
+            if reason is None or attempt >= max_retries:
+                stats.add('failed')
+                raise
+
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            delay = max(delay, _retry_after(e) or 0)
+            stats.add('retries')
+            stats.add('backoff_seconds', delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+class RetryingHttpRequest(HttpRequest):
+    """HttpRequest that retries transient failures with exponential backoff and full jitter.
+
+    Used as the discovery request builder, so every `.execute()` in the app
+    gets the same policy. Resumable uploads pick up from the last chunk the
+    server acknowledged. Media downloads do not go through `execute()`; they
+    retry each chunk with `call_with_retries`.
+    """
+
+    def __init__(self, *args, stats=None, max_retries=MAX_RETRIES, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats = stats or RequestStats()
+        self._max_retries = max_retries
+
+    def execute(self, http=None, num_retries=0):
+        # Una operación por llamada a la API, con sus reintentos incluidos
+        with measure(self.methodId or 'drive.request'):
+            return self._execute_with_retries(http)
+
+    def _execute_with_retries(self, http):
+        return call_with_retries(
+            lambda: super(RetryingHttpRequest, self).execute(http=http, num_retries=0),
+            self._stats, self._max_retries
+        )
+
+
+class _SessionHttp:
+    """httplib2-style facade over a pooled requests session.
+
+    googleapiclient only calls `request()`; unlike httplib2.Http, the session
+    can be shared between threads and keeps its connections alive.
+    """
+
+    def __init__(self, session, timeout=HTTP_TIMEOUT):
+        self.session = session
+        self.timeout = timeout
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        with measure('drive.http') as span:
+            response = self.session.request(
+                method, uri, data=body, headers=headers, timeout=self.timeout,
+                # 308 is how resumable uploads report progress, not a redirect
+                allow_redirects=method in ('GET', 'HEAD')
+            )
+            span.add_bytes(len(response.content), len(body or b''))
+        resp = httplib2.Response(response.headers)
+        resp.status = response.status_code
+        resp.reason = response.reason
+        content = response.content
+        if 'content-encoding' in resp:
+            # requests already decompressed the body; report it as httplib2 does
+            resp['-content-encoding'] = resp.pop('content-encoding')
+            resp['content-length'] = str(len(content))
+        return resp, content
+
+    def close(self):
+        self.session.close()
+
+
+class DriveClient:
+    """One Drive v3 client per process.
+
+    The discovery document is the one bundled with googleapiclient, the
+    access token is shared by every request until it expires, and HTTPS
+    connections are pooled, so only the first request pays for the TLS
+    handshake and token exchange.
+    """
+
+    def __init__(self, credentials, timeout=HTTP_TIMEOUT, max_retries=MAX_RETRIES):
+        self.credentials = credentials
+        self.stats = RequestStats()
+
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount('https://', adapter)
+        self.http = _SessionHttp(session, timeout)
+
+        self.service = build_from_document(
+            json.loads(get_static_doc('drive', 'v3')),
+            http=self.http,
+            requestBuilder=partial(RetryingHttpRequest, stats=self.stats, max_retries=max_retries)
+        )
+
+    def request_stats(self):
+        """Request, retry and rate limit counters since the process started"""
+        return self.stats.snapshot()
+
+
+def get_drive_client():
+    """Process-wide Drive client; raises ValueError without credentials"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DriveClient(load_credentials())
+        return _client
@@ -1,97 +1,311 @@
-from google.oauth2.credentials import Credentials
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from app.drive_cache import DriveFileCache
+from app.drive_client import call_with_retries, get_drive_client
+from app.metrics import measure, timed
+from app.ledger_format import PARQUET_MIMETYPE, is_parquet, read_parquet_bytes, to_parquet_bytes
+from app.upload_queue import DriveUploadQueue
 import pandas as pd
+import hashlib
 import io
+import json
 import os
 
+FILE_FIELDS = "id, name, md5Checksum, modifiedTime"
+# Metadata fetched this recently is considered current
+METADATA_FRESH_SECONDS = 2
+# Resumable uploads send files in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _is_not_found(error):
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+
 class DriveManager:
-    def __init__(self):
+    def __init__(self, conditional_fetch=True, write_behind=True, client=None):
         # Nota: Este es el ID de la carpeta donde se guardarán los archivos
         self.shared_folder_id = "127a8D2rw4SbucDdu-msPBQLlKWvraZZf"  # ID de la carpeta APP CONTABILIDAD AMPA
         self.local_data_dir = "data"
+        # Only download files whose Drive checksum differs from the local copy
+        self.conditional_fetch = conditional_fetch
 
+        # The client (credentials, token and connections) is shared by the process;
+        # another one with the same interface can be passed in (e.g. a local fake)
         try:
-            self.credentials = self._get_credentials()
-            self.service = build('drive', 'v3', credentials=self.credentials)
+            self.client = client if client is not None else get_drive_client()
+            self.service = self.client.service
             print("Google Drive connection established")
         except Exception as e:
             print(f"WARNING: Google Drive credentials not found. Using local storage mode. Error: {str(e)}")
+            self.client = None
             self.service = None
 
         # Ensure local data directory exists
         if not os.path.exists(self.local_data_dir):
             os.makedirs(self.local_data_dir)
 
-    def _get_credentials(self):
-        # Check for environment variables first
-        if all(os.getenv(key) for key in [
-            "GCP_PROJECT_ID", "GCP_PRIVATE_KEY_ID", "GCP_PRIVATE_KEY", 
-            "GCP_CLIENT_EMAIL", "GCP_CLIENT_ID", "GCP_CLIENT_X509_CERT_URL"
-        ]):
-            service_account_info = {
-                "type": "service_account",
-                "project_id": os.getenv("GCP_PROJECT_ID"),
-                "private_key_id": os.getenv("GCP_PRIVATE_KEY_ID"),
-                "private_key": os.getenv("GCP_PRIVATE_KEY").replace('\\n', '\n'),
-                "client_email": os.getenv("GCP_CLIENT_EMAIL"),
-                "client_id": os.getenv("GCP_CLIENT_ID"),
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
-                "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-                "client_x509_cert_url": os.getenv("GCP_CLIENT_X509_CERT_URL")
-            }
+        # Name -> file ID/metadata cache, persisted next to the local data
+        self.file_cache = DriveFileCache(os.path.join(self.local_data_dir, '.drive_files.json'))
+        if self.service:
+            self.warm_file_cache()
 
-            return service_account.Credentials.from_service_account_info(service_account_info)
-        else:
-            raise ValueError("Missing required service account values in environment variables")
+        # Local writes stay synchronous; Drive uploads run in the background
+        self.upload_queue = None
+        if self.service and write_behind:
+            self.upload_queue = DriveUploadQueue(self._background_upload)
 
-    def _find_file_in_drive(self, file_name):
+    def _find_file_in_drive(self, file_name, service=None, max_age=None):
         """Find a file in the shared folder by name"""
-        if not self.service:
+        service = service or self.service
+        if not service:
             return None
 
+        found, file_metadata = self.file_cache.get(self.shared_folder_id, file_name, max_age=max_age)
+        if found:
+            return file_metadata
+
         try:
-            results = self.service.files().list(
+            results = service.files().list(
                 q=f"name='{file_name}' and '{self.shared_folder_id}' in parents and trashed=false",
-                fields="files(id, name)"
+                fields=f"files({FILE_FIELDS})"
             ).execute()
 
             files = results.get('files', [])
-            if files:
-                return files[0]
-            return None
+            file_metadata = files[0] if files else None
+            self.file_cache.put(self.shared_folder_id, file_name, file_metadata)
+            return file_metadata
         except Exception as e:
             print(f"Error finding file in Drive: {str(e)}")
             return None
 
+    def warm_file_cache(self):
+        """Fill the file cache with a single listing of the shared folder"""
+        if not self.service:
+            return False
+
+        try:
+            files = []
+            page_token = None
+            while True:
+                results = self.service.files().list(
+                    q=f"'{self.shared_folder_id}' in parents and trashed=false",
+                    fields=f"nextPageToken, files({FILE_FIELDS})",
+                    pageSize=1000,
+                    pageToken=page_token
+                ).execute()
+                files.extend(results.get('files', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+
+            self.file_cache.replace_all(self.shared_folder_id, files)
+            return True
+        except Exception as e:
+            print(f"Error listing the Drive folder: {str(e)}")
+            return False
+
+    def _refresh_file_metadata(self, file_name):
+        """Fetch current metadata by file ID, bypassing the cache TTL"""
+        found, file_metadata = self.file_cache.get(
+            self.shared_folder_id, file_name, max_age=METADATA_FRESH_SECONDS
+        )
+        if found:
+            return file_metadata
+
+        # A forced refresh must not trust a "missing" entry older than that
+        file_metadata = self._find_file_in_drive(file_name, max_age=METADATA_FRESH_SECONDS)
+        if not file_metadata:
+            return None
+
+        try:
+            file_metadata = self.service.files().get(
+                fileId=file_metadata['id'],
+                fields=FILE_FIELDS
+            ).execute()
+        except Exception as e:
+            if _is_not_found(e):
+                self.file_cache.invalidate(file_name)
+                return self._find_file_in_drive(file_name)
+            raise
+        self.file_cache.put(self.shared_folder_id, file_name, file_metadata)
+        return file_metadata
+
+    def get_file_version(self, file_name, refresh=True):
+        """Return a token that changes whenever the stored file changes.
+
+        With refresh=False the cached metadata is trusted, which is enough
+        right after this process has written the file.
+        """
+        if self.upload_queue is not None:
+            pending_version = self.upload_queue.pending_version(file_name)
+            if pending_version:
+                return pending_version
+
+        if self.service:
+            try:
+                if refresh:
+                    file_metadata = self._refresh_file_metadata(file_name)
+                else:
+                    file_metadata = self._find_file_in_drive(file_name)
+            except Exception as e:
+                print(f"Error reading file metadata from Drive: {str(e)}")
+                file_metadata = None
+            if file_metadata:
+                return file_metadata.get('md5Checksum') or file_metadata.get('modifiedTime')
+
+        # Without a Drive copy the data comes from the local file
+        local_path = os.path.join(self.local_data_dir, file_name)
+        try:
+            stat = os.stat(local_path)
+        except OSError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def _sync_state_path(self, file_name):
+        directory, base_name = os.path.split(os.path.join(self.local_data_dir, file_name))
+        return os.path.join(directory, f".{base_name}.sync.json")
+
+    def _write_sync_state(self, file_name, file_metadata, content):
+        """Record which Drive version the local copy corresponds to"""
+        local_path = os.path.join(self.local_data_dir, file_name)
+        try:
+            with open(local_path, 'rb') as f:
+                local_content = f.read()
+            stat = os.stat(local_path)
+            # If the local file changed after `content` was taken, it must not
+            # look synced
+            local_matches = local_content == content
+            state = {
+                'id': file_metadata.get('id'),
+                'md5Checksum': file_metadata.get('md5Checksum'),
+                'modifiedTime': file_metadata.get('modifiedTime'),
+                'local_mtime_ns': stat.st_mtime_ns if local_matches else None,
+                'local_size': stat.st_size if local_matches else None
+            }
+            with open(self._sync_state_path(file_name), 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+        except OSError as e:
+            print(f"Error saving sync state for {file_name}: {str(e)}")
+
+    def _sync_status(self, file_name, file_metadata):
+        """Compare the local copy and Drive with the last synced version.
+
+        Returns 'current', 'local_changed', 'remote_changed' or None if unknown.
+        """
+        local_path = os.path.join(self.local_data_dir, file_name)
+        try:
+            with open(self._sync_state_path(file_name), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            stat = os.stat(local_path)
+        except (OSError, ValueError):
+            return None
+
+        if state.get('id') != file_metadata.get('id'):
+            return None
+        if file_metadata.get('md5Checksum'):
+            remote_unchanged = state.get('md5Checksum') == file_metadata['md5Checksum']
+        else:
+            remote_unchanged = state.get('modifiedTime') == file_metadata.get('modifiedTime')
+        local_unchanged = (state.get('local_mtime_ns') == stat.st_mtime_ns
+                           and state.get('local_size') == stat.st_size)
+
+        if remote_unchanged and local_unchanged:
+            return 'current'
+        if remote_unchanged:
+            return 'local_changed'
+        return 'remote_changed'
+
+    def _download(self, file_id):
+        request = self.service.files().get_media(fileId=file_id)
+
+        file_content = io.BytesIO()
+        downloader = MediaIoBaseDownload(file_content, request)
+        done = False
+
+        # next_chunk only retries HTTP statuses; dropped connections get the
+        # same backoff as API calls. A retried chunk resumes where it stopped
+        stats = getattr(self.client, 'stats', None)
+        with measure('drive.files.get_media') as span:
+            while not done:
+                status, done = call_with_retries(lambda: downloader.next_chunk(num_retries=0), stats)
+            span.add_bytes(bytes_in=file_content.tell())
+
+        return file_content
+
+    def parse_content(self, file_name, content):
+        """Parse file bytes according to the file extension (CSV or Parquet)"""
+        if is_parquet(file_name):
+            return read_parquet_bytes(content)
+        return pd.read_csv(io.StringIO(content.decode('utf-8')))
+
+    def _read_local(self, file_name):
+        local_path = os.path.join(self.local_data_dir, file_name)
+        if is_parquet(file_name):
+            with open(local_path, 'rb') as f:
+                return read_parquet_bytes(f.read())
+        return pd.read_csv(local_path)
+
+    def file_exists(self, file_name):
+        """Check whether the file exists locally or in the shared folder"""
+        if os.path.exists(os.path.join(self.local_data_dir, file_name)):
+            return True
+        return self._find_file_in_drive(file_name) is not None
+
+    @timed('drive_manager.load_data')
     def load_data(self, file_name):
         """Load data from Google Drive or local storage"""
         local_path = os.path.join(self.local_data_dir, file_name)
 
+        if self.upload_queue is not None and self.upload_queue.is_pending(file_name) \
+                and os.path.exists(local_path):
+            # The local copy is newer than Drive until its upload finishes
+            return self._read_local(file_name)
+
         try:
             if self.service:
                 # Try to load from Google Drive
-                file_metadata = self._find_file_in_drive(file_name)
+                if self.conditional_fetch:
+                    file_metadata = self._refresh_file_metadata(file_name)
+                else:
+                    file_metadata = self._find_file_in_drive(file_name)
 
-                if file_metadata:
-                    file_id = file_metadata['id']
-                    request = self.service.files().get_media(fileId=file_id)
+                sync_status = None
+                if file_metadata and self.conditional_fetch:
+                    sync_status = self._sync_status(file_name, file_metadata)
+
+                if sync_status == 'current':
+                    # Unchanged in Drive: serve the local copy
+                    return self._read_local(file_name)
 
-                    file_content = io.BytesIO()
-                    downloader = MediaIoBaseDownload(file_content, request)
-                    done = False
+                if sync_status == 'local_changed':
+                    # Saved locally but never uploaded: sync it instead of
+                    # overwriting it with the older Drive copy
+                    print(f"Local copy of {file_name} is newer than Drive. Uploading it.")
+                    with open(local_path, 'rb') as f:
+                        self._schedule_upload(f.read(), file_name)
+                    return self._read_local(file_name)
 
-                    while not done:
-                        status, done = downloader.next_chunk()
+                if file_metadata:
+                    try:
+                        file_content = self._download(file_metadata['id'])
+                    except Exception as e:
+                        if not _is_not_found(e):
+                            raise
+                        # Stale cached ID: look the file up again once
+                        self.file_cache.invalidate(file_name)
+                        file_metadata = self._find_file_in_drive(file_name)
+                        if not file_metadata:
+                            raise
+                        file_content = self._download(file_metadata['id'])
 
                     file_content.seek(0)
                     # Save a local copy for backup
                     with open(local_path, 'wb') as f:
                         f.write(file_content.getvalue())
+                    self._write_sync_state(file_name, file_metadata, file_content.getvalue())
 
-                    return pd.read_csv(io.StringIO(file_content.getvalue().decode('utf-8')))
+                    return self.parse_content(file_name, file_content.getvalue())
                 else:
                     print(f"File {file_name} not found in Drive. Using local file if available.")
         except Exception as e:
@@ -99,7 +313,7 @@ class DriveManager:
 
         # Fallback to local storage
         if os.path.exists(local_path):
-            return pd.read_csv(local_path)
+            return self._read_local(file_name)
         else:
             return pd.DataFrame()
 
@@ -110,55 +324,169 @@ class DriveManager:
         # Convert to DataFrame if it's not already
         df = pd.DataFrame(data) if not isinstance(data, pd.DataFrame) else data
 
-        # Always save locally as backup
-        df.to_csv(local_path, index=False)
+        if is_parquet(file_name):
+            content = to_parquet_bytes(df)
+            mimetype = PARQUET_MIMETYPE
+        else:
+            # Convert DataFrame to CSV content
+            content = df.to_csv(index=False).encode('utf-8')
+            mimetype = 'text/csv'
 
-        if self.service:
+        with measure('drive_manager.save_data') as span:
+            # Always save locally as backup; the rename keeps readers from seeing a partial file
+            tmp_path = f"{local_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, local_path)
+            span.add_bytes(bytes_out=len(content))
+
+            if self.service:
+                self._schedule_upload(content, file_name, mimetype)
+
+    def upload_local_file(self, file_name, mimetype='text/csv'):
+        """Upload the local copy of a file to Google Drive as it is"""
+        if not self.service:
+            return False
+
+        local_path = os.path.join(self.local_data_dir, file_name)
+        with open(local_path, 'rb') as f:
+            content = f.read()
+        return self._schedule_upload(content, file_name, mimetype)
+
+    def _schedule_upload(self, content, file_name, mimetype='text/csv'):
+        """Queue the upload in write-behind mode, otherwise upload right away"""
+        if self.upload_queue is None:
+            return self._upload_content(content, file_name, mimetype)
+
+        version = hashlib.md5(content).hexdigest()
+        self.upload_queue.enqueue(file_name, content, mimetype, version)
+        return True
+
+    def _background_upload(self, file_name, content, mimetype):
+        return self._upload_content(content, file_name, mimetype)
+
+    def request_stats(self):
+        """Drive request, retry and rate limit counters, or None without Drive"""
+        if self.client is None:
+            return None
+        return self.client.request_stats()
+
+    def sync_status(self):
+        """Pending uploads and result of the last background sync"""
+        if self.upload_queue is None:
+            return None
+        return self.upload_queue.status()
+
+    def _upload_media(self, make_media, file_name, service):
+        """Create or update `file_name` in the shared folder; raises on failure.
+
+        `make_media` returns a fresh MediaIoBaseUpload, since a failed update
+        is retried as a create from the start of the stream.
+        """
+        # Check if file already exists in Drive
+        file_metadata = self._find_file_in_drive(file_name, service)
+
+        updated_metadata = None
+        if file_metadata:
+            # Update existing file
             try:
-                # Convert DataFrame to CSV content
-                csv_content = df.to_csv(index=False).encode('utf-8')
+                updated_metadata = service.files().update(
+                    fileId=file_metadata['id'],
+                    media_body=make_media(),
+                    fields=FILE_FIELDS
+                ).execute()
+            except Exception as e:
+                if not _is_not_found(e):
+                    raise
+                # The cached ID no longer exists: create the file again
+                self.file_cache.invalidate(file_name)
+
+        if updated_metadata is None:
+            # Create new file in the shared folder
+            file_metadata = {
+                'name': file_name,
+                'parents': [self.shared_folder_id]
+            }
+            updated_metadata = service.files().create(
+                body=file_metadata,
+                media_body=make_media(),
+                fields=FILE_FIELDS
+            ).execute()
 
-                # Check if file already exists in Drive
-                file_metadata = self._find_file_in_drive(file_name)
+        self.file_cache.put(self.shared_folder_id, file_name, updated_metadata)
+        return updated_metadata
 
-                media = MediaIoBaseUpload(
-                    io.BytesIO(csv_content),
-                    mimetype='text/csv',
+    def upload_file(self, file_name, mimetype='application/octet-stream', service=None):
+        """Stream the local copy of a file to Google Drive without reading it whole.
+
+        Meant for immutable files such as backups: no sync state is recorded.
+        Safe to call from worker threads; raises if the upload fails.
+        """
+        if not self.service:
+            raise RuntimeError("No hay conexión a Google Drive")
+        service = service or self.service
+        local_path = os.path.join(self.local_data_dir, file_name)
+
+        with open(local_path, 'rb') as f:
+            def make_media():
+                f.seek(0)
+                return MediaIoBaseUpload(
+                    f,
+                    mimetype=mimetype,
+                    chunksize=UPLOAD_CHUNK_SIZE,
                     resumable=True
                 )
 
-                if file_metadata:
-                    # Update existing file
-                    self.service.files().update(
-                        fileId=file_metadata['id'],
-                        media_body=media
-                    ).execute()
-                else:
-                    # Create new file in the shared folder
-                    file_metadata = {
-                        'name': file_name,
-                        'parents': [self.shared_folder_id]
-                    }
-                    self.service.files().create(
-                        body=file_metadata,
-                        media_body=media,
-                        fields='id'
-                    ).execute()
-
-                print(f"✅ Archivo {file_name} guardado correctamente en Google Drive (Carpeta ID: {self.shared_folder_id})")
-                print(f"   También se ha guardado localmente en: {local_path}")
-            except Exception as e:
-                error_message = f"❌ Error al guardar en Google Drive: {str(e)}"
-                print(error_message)
-                print(f"   Datos guardados localmente en: {local_path}")
-                print(f"   ID de carpeta utilizado: {self.shared_folder_id}")
-                # Intentar verificar si el ID corresponde a una carpeta
-                try:
-                    file_metadata = self.service.files().get(fileId=self.shared_folder_id, fields='mimeType').execute()
-                    is_folder = file_metadata.get('mimeType') == 'application/vnd.google-apps.folder'
-                    print(f"   ¿El ID corresponde a una carpeta? {'Sí' if is_folder else 'No'}")
-                except Exception as folder_error:
-                    print(f"   No se pudo verificar el ID de la carpeta: {str(folder_error)}")
+            return self._upload_media(make_media, file_name, service)
+
+    def _upload_content(self, content, file_name, mimetype='text/csv', service=None):
+        """Create or update a file in the shared folder with the given bytes"""
+        service = service or self.service
+        local_path = os.path.join(self.local_data_dir, file_name)
+        try:
+            updated_metadata = self._upload_media(
+                lambda: MediaIoBaseUpload(io.BytesIO(content), mimetype=mimetype, resumable=True),
+                file_name,
+                service
+            )
+            self._write_sync_state(file_name, updated_metadata, content)
+
+            print(f"✅ Archivo {file_name} guardado correctamente en Google Drive (Carpeta ID: {self.shared_folder_id})")
+            print(f"   También se ha guardado localmente en: {local_path}")
+            return True
+        except Exception as e:
+            error_message = f"❌ Error al guardar en Google Drive: {str(e)}"
+            print(error_message)
+            print(f"   Datos guardados localmente en: {local_path}")
+            print(f"   ID de carpeta utilizado: {self.shared_folder_id}")
+            # Intentar verificar si el ID corresponde a una carpeta
+            try:
+                file_metadata = service.files().get(fileId=self.shared_folder_id, fields='mimeType').execute()
+                is_folder = file_metadata.get('mimeType') == 'application/vnd.google-apps.folder'
+                print(f"   ¿El ID corresponde a una carpeta? {'Sí' if is_folder else 'No'}")
+            except Exception as folder_error:
+                print(f"   No se pudo verificar el ID de la carpeta: {str(folder_error)}")
+            return False
+
+    def delete_file(self, file_name):
+        """Delete a file from the shared folder"""
+        if not self.service:
+            return False
+
+        file_metadata = self._find_file_in_drive(file_name)
+        if not file_metadata:
+            return False
+
+        try:
+            self.service.files().delete(fileId=file_metadata['id']).execute()
+            return True
+        except Exception as e:
+            if _is_not_found(e):
+                return False
+            print(f"Error deleting file from Drive: {str(e)}")
+            return False
+        finally:
+            self.file_cache.invalidate(file_name)
 
     def list_available_folders(self):
         """Listar carpetas disponibles en Google Drive para ayudar a identificar el ID correcto"""
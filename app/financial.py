@@ -1,9 +1,19 @@
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
 from datetime import datetime
+from app.concurrency import LedgerConflict, get_ledger_lock, rebase_changes
+from app.date_index import DateIndex
+from app.ledger_cache import get_ledger_cache
+from app.metrics import timed
+from app.query_cache import QueryOrderCache
+from app.report_cache import get_report_cache
+from app.search_index import DescriptionIndex, tokenize
+from app.storage import TRANSACTION_COLUMNS, create_storage
 
 class FinancialManager:
+    # Columnas por las que se puede ordenar una consulta
+    SORT_KEYS = ['date', 'amount', 'category', 'type', 'description']
     EXPENSE_CATEGORIES = [
         "Donaciones", "Verbena", "Charlas y talleres",
         "Cesiones al Colegio", "Otros"
@@ -13,80 +23,364 @@ class FinancialManager:
         "Venta de Lotería", "Otros"
     ]
 
-    def __init__(self, drive_manager):
+    def __init__(self, drive_manager, ledger_cache=None, storage=None, report_cache=None):
         self.drive_manager = drive_manager
+        self.ledger_cache = ledger_cache if ledger_cache is not None else get_ledger_cache()
+        self.report_cache = (report_cache if report_cache is not None
+                             else get_report_cache(drive_manager.local_data_dir))
+        self.storage = storage if storage is not None else create_storage(drive_manager)
         self.load_data()
 
     def load_data(self):
-        self.transactions = self.drive_manager.load_data('transactions.csv')
-        if self.transactions.empty:
-            self.transactions = pd.DataFrame({
-                'date': [], 'type': [], 'category': [],
-                'amount': [], 'description': []
-            })
-        balance_df = self.drive_manager.load_data('balance.csv')
-        if balance_df.empty:
-            self.initial_balance = 0.0
-        else:
-            self.initial_balance = float(balance_df['balance'].iloc[0])
-
-    def save_data(self):
-        self.drive_manager.save_data(self.transactions, 'transactions.csv')
-        self.drive_manager.save_data({'balance': [self.initial_balance]}, 'balance.csv')
+        snapshot = self.ledger_cache.get(
+            self.drive_manager, self.storage.file_names, self.storage.load, self.storage.version
+        )
+        # El DataFrame se comparte entre sesiones: nunca se modifica in situ
+        self._snapshot = snapshot
+        self.transactions = snapshot.transactions
+        self.initial_balance = snapshot.initial_balance
+
+    @timed('ledger.save')
+    def save_data(self, changes=None, derived=None):
+        """Guarda los cambios sobre la versión del libro en la que se hicieron.
+
+        Si otra sesión o proceso ha escrito desde entonces, los cambios se
+        vuelven a aplicar fila a fila sobre el libro actual en lugar de
+        sobrescribirlo. Sin `changes` (restauraciones) el libro se sustituye.
+        """
+        with get_ledger_lock(self.drive_manager.local_data_dir):
+            if changes:
+                latest = self.ledger_cache.get(
+                    self.drive_manager, self.storage.file_names, self.storage.load,
+                    self.storage.version, fresh=True
+                )
+                if latest is not self._snapshot:
+                    try:
+                        self.transactions, self.initial_balance, changes = rebase_changes(
+                            latest.transactions, latest.initial_balance, changes,
+                            self._snapshot.transactions
+                        )
+                    except LedgerConflict:
+                        # Los cambios ya estaban aplicados en memoria: se descartan
+                        # y la sesión sigue con el libro guardado
+                        self._snapshot = latest
+                        self.transactions = latest.transactions
+                        self.initial_balance = latest.initial_balance
+                        raise
+                    # Las estructuras derivadas eran del libro anterior
+                    derived = None
+                    if not changes:
+                        self._snapshot = latest
+                        self.transactions = latest.transactions
+                        return
+
+            self.storage.save(self.transactions, self.initial_balance, changes)
+            self._snapshot = self.ledger_cache.store(
+                self.drive_manager, self.storage.file_names,
+                self.transactions, self.initial_balance, derived, self.storage.version
+            )
+        # Los informes generados con el libro anterior ya no sirven
+        self.report_cache.invalidate()
+
+    @property
+    def ledger_version(self):
+        """Versión del contenido del libro (cambia con cualquier escritura)"""
+        return self._snapshot.version
+
+    def _derived(self, name, build):
+        """Estructura derivada del libro actual, compartida en la caché"""
+        if self._snapshot.transactions is not self.transactions:
+            return build(self.transactions)
+        return self._snapshot.get_derived(name, build)
+
+    def _aggregates(self):
+        # Cada almacenamiento los calcula a su manera (en SQLite, con consultas
+        # agregadas si el libro es el de la versión guardada)
+        version = self._snapshot.version if self._snapshot.transactions is self.transactions else None
+        return self._derived(
+            'aggregates', lambda transactions: self.storage.aggregates(transactions, version)
+        )
+
+    def _date_index(self):
+        return self._derived('date_index', DateIndex.from_frame)
+
+    def _text_index(self):
+        return self._derived('text_index', DescriptionIndex.from_frame)
+
+    @timed('ledger.filter')
+    def get_transactions_between(self, start_date=None, end_date=None):
+        """Movimientos entre dos fechas 'AAAA-MM-DD' (incluidas), ordenados por fecha.
+
+        Usa búsqueda binaria sobre el índice de fechas. Si el libro ya está
+        ordenado por fecha devuelve un corte del DataFrame sin copiarlo.
+        """
+        date_index = self._date_index()
+        lo, hi = date_index.range(start_date, end_date)
+        if date_index.is_identity:
+            return self.transactions.iloc[lo:hi]
+        return self.transactions.take(date_index.order[lo:hi])
+
+    @timed('ledger.search')
+    def search_transactions(self, term, start_date=None, end_date=None):
+        """Movimientos cuyo concepto contiene las palabras buscadas, ordenados por fecha.
+
+        No distingue mayúsculas ni acentos y acepta palabras incompletas
+        ("lot" encuentra "Lotería"). Sin término devuelve todo el rango.
+        """
+        if not tokenize(term):
+            return self.get_transactions_between(start_date, end_date)
+        return self.transactions.take(self._filtered_positions(term, start_date, end_date))
+
+    def _filtered_positions(self, term, start_date=None, end_date=None):
+        """Posiciones de los movimientos que pasan el filtro, ordenadas por fecha"""
+        if not tokenize(term):
+            return self._date_index().positions(start_date, end_date)
+
+        positions = self._text_index().search(term)
+        dates = self._normalized_dates()[positions]
+        if start_date is not None:
+            keep = dates >= start_date
+            positions, dates = positions[keep], dates[keep]
+        if end_date is not None:
+            keep = dates <= end_date
+            positions, dates = positions[keep], dates[keep]
+        # Estable: con la misma fecha se mantiene el orden de alta, como en el índice de fechas
+        return positions[np.argsort(dates, kind='stable')]
+
+    def _normalized_dates(self):
+        """Fecha de cada posición, sacada del índice de fechas"""
+        def build(_):
+            date_index = self._date_index()
+            dates = np.empty(len(date_index), dtype=object)
+            dates[date_index.order] = date_index.dates
+            return dates
+        return self._derived('dates', build)
+
+    def _sort_values(self, sort):
+        """Valores de la columna `sort` por posición, comparables entre sí"""
+        def build(transactions):
+            column = transactions[sort]
+            if sort == 'amount':
+                return column.astype(float).fillna(0).to_numpy()
+            return column.fillna('').astype(str).str.lower().to_numpy(dtype=object)
+        return self._derived(f'sort_{sort}', build)
+
+    @timed('ledger.query')
+    def query_transactions(self, term=None, start_date=None, end_date=None, sort='date',
+                           descending=False, offset=0, limit=None):
+        """Una página de movimientos filtrados y ordenados.
+
+        Devuelve (página, total de movimientos que pasan el filtro). La página
+        conserva como índice la posición de cada movimiento en el libro, que
+        es el ID que usan update_transaction y delete_transaction. El orden
+        de cada filtro se calcula una vez por versión del libro; pedir otra
+        página solo corta ese orden. Los empates se deshacen por fecha y,
+        después, por orden de alta.
+        """
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Orden desconocido: {sort}")
+        key = (tuple(sorted(set(tokenize(term)))), start_date, end_date, sort, bool(descending))
+
+        def build():
+            positions = self._filtered_positions(term, start_date, end_date)
+            if sort != 'date':
+                positions = positions[np.argsort(self._sort_values(sort)[positions], kind='stable')]
+            return positions[::-1] if descending else positions
+
+        order = self._derived('query_orders', lambda _: QueryOrderCache()).get(key, build)
+        end = None if limit is None else offset + limit
+        return self.transactions.take(order[offset:end]), len(order)
+
+    @staticmethod
+    def _row_hashes(transactions):
+        """Hash de (fecha, importe en céntimos, concepto) por fila"""
+        key = pd.DataFrame({
+            'date': transactions['date'].astype(str),
+            'cents': (transactions['amount'].astype(float) * 100).round().astype('int64'),
+            'description': transactions['description'].fillna('').astype(str).str.strip().str.lower()
+        })
+        return pd.util.hash_pandas_object(key, index=False)
+
+    @classmethod
+    def _build_duplicate_index(cls, transactions):
+        if transactions.empty:
+            return {}
+        return cls._row_hashes(transactions).value_counts().to_dict()
+
+    def _duplicate_index(self):
+        """Número de filas existentes por hash"""
+        return self._derived('duplicate_index', self._build_duplicate_index)
+
+    def find_duplicates(self, batch):
+        """Marca las filas del lote que ya están en el libro.
+
+        Se comparan multiconjuntos: si el libro tiene una cuota de 20 € de un
+        día y el lote trae dos iguales, solo la primera se considera repetida.
+        """
+        if batch.empty:
+            return pd.Series(False, index=batch.index)
+        hashes = self._row_hashes(batch)
+        existing = hashes.map(self._duplicate_index()).fillna(0)
+        occurrence = hashes.groupby(hashes).cumcount()
+        return occurrence < existing
+
+    def add_transactions(self, batch, skip_duplicates=True):
+        """Añade un lote de movimientos con una sola escritura.
+
+        Devuelve (añadidos, omitidos por estar ya registrados).
+        """
+        batch = pd.DataFrame(batch)
+        missing = [column for column in TRANSACTION_COLUMNS if column not in batch.columns]
+        if missing:
+            raise ValueError(f"Faltan columnas en el lote: {', '.join(missing)}")
+        batch = batch[TRANSACTION_COLUMNS].reset_index(drop=True)
+        batch['amount'] = batch['amount'].astype(float)
+        batch['description'] = batch['description'].fillna('')
+
+        skipped = 0
+        if skip_duplicates:
+            duplicates = self.find_duplicates(batch)
+            skipped = int(duplicates.sum())
+            batch = batch[~duplicates].reset_index(drop=True)
+        if batch.empty:
+            return 0, skipped
+
+        duplicate_index = dict(self._duplicate_index())
+        for row_hash, count in self._row_hashes(batch).value_counts().items():
+            duplicate_index[row_hash] = duplicate_index.get(row_hash, 0) + count
+        aggregates = self._aggregates().copy()
+        aggregates.add_frame(batch)
+        date_index = self._date_index().copy()
+        date_index.insert_many(len(self.transactions), batch['date'])
+        text_index = self._text_index().copy()
+        text_index.add_many(batch['description'])
+
+        self.transactions = pd.concat([self.transactions, batch], ignore_index=True)
+        changes = [{'op': 'add', 'row': row} for row in batch.to_dict('records')]
+        self.save_data(changes, {
+            'duplicate_index': duplicate_index,
+            'aggregates': aggregates,
+            'date_index': date_index,
+            'text_index': text_index
+        })
+        return len(batch), skipped
 
     def add_transaction(self, transaction_type, category, amount, description, date=None):
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
             
-        new_transaction = pd.DataFrame({
-            'date': [date],
-            'type': [transaction_type],
-            'category': [category],
-            'amount': [amount],
-            'description': [description]
-        })
+        row = {
+            'date': date,
+            'type': transaction_type,
+            'category': category,
+            'amount': amount,
+            'description': description
+        }
+        aggregates = self._aggregates().copy()
+        aggregates.add_row(row)
+        date_index = self._date_index().copy()
+        date_index.insert(len(self.transactions), date)
+        text_index = self._text_index().copy()
+        text_index.add(description)
+
+        new_transaction = pd.DataFrame({column: [value] for column, value in row.items()})
         self.transactions = pd.concat([self.transactions, new_transaction], ignore_index=True)
-        self.save_data()
+        self.save_data(
+            [{'op': 'add', 'row': row}],
+            {'aggregates': aggregates, 'date_index': date_index, 'text_index': text_index}
+        )
         
     def update_transaction(self, index, transaction_type, category, amount, description, date):
         if index >= 0 and index < len(self.transactions):
+            row = {
+                'date': date,
+                'type': transaction_type,
+                'category': category,
+                'amount': amount,
+                'description': description
+            }
+            old_row = self.transactions.loc[index]
+            aggregates = self._aggregates().copy()
+            aggregates.remove_row(old_row)
+            aggregates.add_row(row)
+            date_index = self._date_index().copy()
+            date_index.update(index, old_row['date'], date)
+            text_index = self._text_index().copy()
+            text_index.update(index, old_row['description'], description)
+
+            # Copia antes de modificar: el DataFrame original está en la caché compartida
+            self.transactions = self.transactions.copy()
             self.transactions.at[index, 'date'] = date
             self.transactions.at[index, 'type'] = transaction_type
             self.transactions.at[index, 'category'] = category
             self.transactions.at[index, 'amount'] = amount
             self.transactions.at[index, 'description'] = description
-            self.save_data()
+            self.save_data(
+                [{'op': 'update', 'index': index, 'row': row, 'old': old_row.to_dict()}],
+                {'aggregates': aggregates, 'date_index': date_index, 'text_index': text_index}
+            )
             return True
         return False
         
     def delete_transaction(self, index):
         if index >= 0 and index < len(self.transactions):
+            old_row = self.transactions.loc[index]
+            aggregates = self._aggregates().copy()
+            aggregates.remove_row(old_row)
+            date_index = self._date_index().copy()
+            date_index.delete(index, old_row['date'])
+            text_index = self._text_index().copy()
+            text_index.delete(index, old_row['description'])
+
             self.transactions = self.transactions.drop(index).reset_index(drop=True)
-            self.save_data()
+            self.save_data(
+                [{'op': 'delete', 'index': index, 'old': old_row.to_dict()}],
+                {'aggregates': aggregates, 'date_index': date_index, 'text_index': text_index}
+            )
             return True
         return False
 
+    def replace_ledger(self, transactions, initial_balance):
+        """Sustituye el libro completo (restauraciones); se guarda como instantánea"""
+        self.transactions = pd.DataFrame(transactions)[TRANSACTION_COLUMNS].reset_index(drop=True)
+        self.initial_balance = float(initial_balance)
+        self.save_data()
+
     def get_balance(self):
-        total_income = self.transactions[self.transactions['type'] == 'income']['amount'].sum()
-        total_expenses = self.transactions[self.transactions['type'] == 'expense']['amount'].sum()
-        return self.initial_balance + total_income - total_expenses
+        return self._aggregates().balance(self.initial_balance)
         
     def set_initial_balance(self, new_balance):
         self.initial_balance = float(new_balance)
-        self.save_data()
+        # Los movimientos no cambian: se conservan todas las estructuras derivadas
+        self.save_data(
+            [{'op': 'balance', 'balance': self.initial_balance}],
+            dict(self._snapshot.derived)
+        )
 
+    @timed('chart.summary')
     def create_summary_chart(self):
-        fig = go.Figure()
+        """Gráfico por categorías; se construye una vez por versión del libro"""
+        return self._derived('summary_chart', lambda _: self._build_summary_chart())
+
+    @timed('chart.monthly')
+    def create_monthly_chart(self):
+        """Ingresos y gastos por mes; se construye una vez por versión del libro"""
+        return self._derived('monthly_chart', lambda _: self._build_monthly_chart())
+
+    def _build_summary_chart(self):
+        # plotly solo se carga al mostrar el panel de inicio
+        import plotly.graph_objects as go
+        from app.charts import CachedFigure
+
+        fig = CachedFigure()
         
+        aggregates = self._aggregates()
+
         # Income by category
-        income_by_category = self.transactions[
-            self.transactions['type'] == 'income'
-        ].groupby('category')['amount'].sum()
+        income_by_category = aggregates.by_category('income')
         
         # Expenses by category
-        expenses_by_category = self.transactions[
-            self.transactions['type'] == 'expense'
-        ].groupby('category')['amount'].sum()
+        expenses_by_category = aggregates.by_category('expense')
 
         fig.add_trace(go.Bar(
             x=income_by_category.index,
@@ -110,3 +404,35 @@ class FinancialManager:
         )
 
         return fig
+
+    def _build_monthly_chart(self):
+        import plotly.graph_objects as go
+        from app.charts import CachedFigure
+
+        fig = CachedFigure()
+
+        by_month = self._aggregates().by_month()
+
+        fig.add_trace(go.Bar(
+            x=by_month.index,
+            y=by_month['income'].values,
+            name='Ingresos',
+            marker_color='green'
+        ))
+
+        fig.add_trace(go.Bar(
+            x=by_month.index,
+            y=by_month['expense'].values,
+            name='Gastos',
+            marker_color='red'
+        ))
+
+        fig.update_layout(
+            title='Ingresos y Gastos por Mes',
+            xaxis_title='Mes',
+            yaxis_title='Cantidad (€)',
+            xaxis_type='category',
+            barmode='group'
+        )
+
+        return fig
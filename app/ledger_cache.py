@@ -0,0 +1,143 @@
+import threading
+import time
+
+
+# Versión aún no leída; None es una versión válida (p. ej. aún no hay fichero)
+_UNKNOWN = object()
+
+
+class LedgerSnapshot:
+    """Estado del libro de cuentas compartido por todas las sesiones"""
+
+    def __init__(self, key, transactions, initial_balance, version, revision):
+        self.key = key
+        self.transactions = transactions
+        self.initial_balance = initial_balance
+        # Versión de los ficheros de origen (md5 en Drive o mtime en local)
+        self.version = version
+        # Contador del proceso, cambia con cada carga o escritura
+        self.revision = revision
+        self.checked_at = time.monotonic()
+        # Estructuras derivadas del libro (índices, agregados...), por nombre
+        self.derived = {}
+
+    def get_derived(self, name, build):
+        """Devuelve la estructura derivada `name`, construyéndola si falta"""
+        value = self.derived.get(name)
+        if value is None:
+            value = build(self.transactions)
+            self.derived[name] = value
+        return value
+
+
+class LedgerCache:
+    """Caché de proceso del libro de cuentas.
+
+    Streamlit vuelve a ejecutar main.py en cada interacción; esta caché evita
+    volver a descargar y parsear los CSV mientras el libro no cambie. Solo se
+    invalida con una escritura local o cuando cambia la versión remota.
+    """
+
+    def __init__(self, check_interval=15):
+        # Segundos durante los que se confía en la copia sin consultar la versión
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._revision = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _key(self, drive_manager, file_names):
+        return (drive_manager.shared_folder_id, tuple(file_names))
+
+    def _files_version(self, drive_manager, file_names, refresh=True):
+        return tuple(
+            drive_manager.get_file_version(name, refresh=refresh) for name in file_names
+        )
+
+    def get(self, drive_manager, file_names, loader, version=None, fresh=False):
+        """Devuelve el estado en caché o lo carga con `loader` si ha cambiado.
+
+        `version(refresh)` da la versión del libro; por defecto es la de los
+        ficheros `file_names` en Drive. Con `fresh` se comprueba la versión
+        aunque no haya pasado `check_interval`.
+        """
+        key = self._key(drive_manager, file_names)
+        if version is None:
+            version = lambda refresh=True: self._files_version(drive_manager, file_names, refresh)
+        with self._lock:
+            snapshot = self._snapshot
+            current = _UNKNOWN
+            if snapshot is not None and snapshot.key == key:
+                now = time.monotonic()
+                if not fresh and now - snapshot.checked_at < self.check_interval:
+                    self.hits += 1
+                    return snapshot
+
+                current = version()
+                if current == snapshot.version:
+                    snapshot.checked_at = now
+                    self.hits += 1
+                    return snapshot
+                self.invalidations += 1
+
+            self.misses += 1
+            # La versión se lee antes de cargar (si acaba de compararse, vale
+            # esa): si el fichero cambia durante la carga, la siguiente
+            # comprobación lo detectará
+            if current is _UNKNOWN:
+                current = version()
+            transactions, initial_balance = loader()
+            return self._replace(key, transactions, initial_balance, current)
+
+    def store(self, drive_manager, file_names, transactions, initial_balance, derived=None,
+              version=None):
+        """Sustituye el estado tras una escritura local.
+
+        `derived` recibe las estructuras derivadas ya actualizadas para el
+        nuevo estado; las que no se pasen se reconstruirán al pedirlas.
+        """
+        key = self._key(drive_manager, file_names)
+        with self._lock:
+            # La escritura acaba de actualizar los metadatos en caché
+            if version is None:
+                current = self._files_version(drive_manager, file_names, refresh=False)
+            else:
+                current = version(refresh=False)
+            snapshot = self._replace(key, transactions, initial_balance, current)
+            snapshot.derived.update(derived or {})
+            return snapshot
+
+    def invalidate(self):
+        """Descarta el estado para forzar una recarga en la siguiente consulta"""
+        with self._lock:
+            if self._snapshot is not None:
+                self.invalidations += 1
+            self._snapshot = None
+
+    def _replace(self, key, transactions, initial_balance, version):
+        self._revision += 1
+        self._snapshot = LedgerSnapshot(
+            key, transactions, initial_balance, version, self._revision
+        )
+        return self._snapshot
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'revision': self._revision,
+            }
+
+
+_ledger_cache = LedgerCache()
+
+
+def get_ledger_cache():
+    """Caché compartida por todas las sesiones del proceso"""
+    return _ledger_cache
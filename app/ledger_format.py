@@ -0,0 +1,81 @@
+import io
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow es opcional
+    pa = None
+
+PARQUET_MIMETYPE = 'application/vnd.apache.parquet'
+
+# Esquema del libro en Parquet: fechas como timestamp, tipo y categoría
+# codificados como diccionario e importes enteros en céntimos
+if pa is not None:
+    TRANSACTIONS_SCHEMA = pa.schema([
+        ('date', pa.timestamp('ms')),
+        ('type', pa.dictionary(pa.int8(), pa.string())),
+        ('category', pa.dictionary(pa.int16(), pa.string())),
+        ('amount_cents', pa.int64()),
+        ('description', pa.string()),
+    ])
+
+
+def parquet_available():
+    return pa is not None
+
+
+def is_parquet(file_name):
+    return file_name.endswith('.parquet')
+
+
+def to_parquet_bytes(transactions):
+    """Serializa el libro con el esquema tipado"""
+    if pa is None:
+        raise RuntimeError("pyarrow no está instalado: no se puede usar el formato Parquet")
+
+    dates = pd.to_datetime(transactions['date'], format='%Y-%m-%d', errors='coerce')
+    # Una fecha mal escrita no se puede convertir sin perderla: se rechaza el libro
+    invalid = dates.isna() & transactions['date'].notna()
+    if invalid.any():
+        rows = ', '.join(
+            f"{position} ({value!r})"
+            for position, value in zip(invalid.to_numpy().nonzero()[0][:10], transactions['date'][invalid])
+        )
+        raise ValueError(
+            f"{int(invalid.sum())} movimiento(s) con fecha no válida (AAAA-MM-DD): {rows}"
+        )
+
+    typed = pd.DataFrame({
+        'date': dates,
+        'type': transactions['type'].astype('category'),
+        'category': transactions['category'].astype('category'),
+        'amount_cents': (transactions['amount'].astype(float).fillna(0) * 100).round().astype('int64'),
+        'description': transactions['description'].fillna('').astype(str),
+    })
+    table = pa.Table.from_pandas(typed, schema=TRANSACTIONS_SCHEMA, preserve_index=False)
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression='zstd')
+    return buffer.getvalue()
+
+
+def read_parquet_bytes(content):
+    """Lee un libro en Parquet y lo devuelve con las columnas de la aplicación.
+
+    Las conversiones se hacen en Arrow: fechas a texto 'AAAA-MM-DD', tipo y
+    categoría a texto e importes a euros.
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow no está instalado: no se puede usar el formato Parquet")
+
+    table = pq.read_table(io.BytesIO(content))
+    columns = {
+        # date32 -> string produce 'AAAA-MM-DD' y es mucho más rápido que strftime
+        'date': pc.cast(pc.cast(table['date'], pa.date32()), pa.string()),
+        'type': pc.cast(table['type'], pa.string()),
+        'category': pc.cast(table['category'], pa.string()),
+        'amount': pc.divide(pc.cast(table['amount_cents'], pa.float64()), 100.0),
+        'description': table['description'],
+    }
+    return pa.table(columns).to_pandas()
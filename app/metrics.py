@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+import numpy as np
+
+# Latencias recientes que se guardan por operación para los percentiles
+SAMPLE_SIZE = 1024
+PROMETHEUS_PREFIX = 'ampa'
+
+
+class _Operation:
+    __slots__ = ('count', 'errors', 'total', 'max', 'bytes_in', 'bytes_out', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+
+class _Span:
+    """Medición en curso; `add_bytes` suma los bytes transferidos"""
+
+    __slots__ = ('metrics', 'name', 'start', 'bytes_in', 'bytes_out')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def add_bytes(self, bytes_in=0, bytes_out=0):
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(self.name, time.perf_counter() - self.start, exc_type is not None,
+                            self.bytes_in, self.bytes_out)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def add_bytes(self, bytes_in=0, bytes_out=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Metrics:
+    """Tiempos, errores y bytes por operación, para el proceso entero.
+
+    Desactivado, `measure` devuelve siempre el mismo contexto vacío y
+    `timed` solo comprueba un atributo, así que medir no cuesta nada.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._operations = {}
+        self.started = time.time()
+
+    def measure(self, name):
+        """Contexto que mide el bloque: `with metrics.measure('op') as span:`"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name)
+
+    def record(self, name, seconds, error=False, bytes_in=0, bytes_out=0):
+        with self._lock:
+            operation = self._operations.get(name)
+            if operation is None:
+                operation = self._operations[name] = _Operation()
+            operation.count += 1
+            operation.errors += error
+            operation.total += seconds
+            operation.max = max(operation.max, seconds)
+            operation.bytes_in += bytes_in
+            operation.bytes_out += bytes_out
+            operation.samples.append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        """Resumen por operación, con los tiempos en milisegundos"""
+        with self._lock:
+            operations = {name: (operation.count, operation.errors, operation.total, operation.max,
+                                 operation.bytes_in, operation.bytes_out, list(operation.samples))
+                          for name, operation in self._operations.items()}
+
+        summary = {}
+        for name, (count, errors, total, maximum, bytes_in, bytes_out, samples) in sorted(operations.items()):
+            p50, p95 = np.percentile(samples, [50, 95]) if samples else (0.0, 0.0)
+            summary[name] = {
+                'count': count,
+                'errors': errors,
+                'p50_ms': round(float(p50) * 1000, 2),
+                'p95_ms': round(float(p95) * 1000, 2),
+                'max_ms': round(maximum * 1000, 2),
+                'total_ms': round(total * 1000, 2),
+                'bytes_in': bytes_in,
+                'bytes_out': bytes_out,
+            }
+        return summary
+
+    def to_json(self, counters=None):
+        """Exportación en JSON; `counters` añade contadores sueltos (p. ej. de Drive)"""
+        return json.dumps({
+            'since': self.started,
+            'enabled': self.enabled,
+            'operations': self.snapshot(),
+            'counters': counters or {},
+        }, indent=1)
+
+    def to_prometheus(self, counters=None):
+        """Exportación en el formato de texto de Prometheus"""
+        prefix = PROMETHEUS_PREFIX
+        lines = [
+            f"# HELP {prefix}_operation_duration_seconds Duración de cada operación (ventana reciente).",
+            f"# TYPE {prefix}_operation_duration_seconds summary",
+        ]
+        snapshot = self.snapshot()
+        seconds = lambda ms: round(ms / 1000, 6)
+        for name, stats in snapshot.items():
+            label = f'operation="{name}"'
+            lines.append(f'{prefix}_operation_duration_seconds{{{label},quantile="0.5"}} {seconds(stats["p50_ms"])}')
+            lines.append(f'{prefix}_operation_duration_seconds{{{label},quantile="0.95"}} {seconds(stats["p95_ms"])}')
+            lines.append(f'{prefix}_operation_duration_seconds_sum{{{label}}} {seconds(stats["total_ms"])}')
+            lines.append(f'{prefix}_operation_duration_seconds_count{{{label}}} {stats["count"]}')
+
+        for metric, field, help_text in (
+            ('operation_max_seconds', 'max_ms', "Duración máxima de cada operación."),
+            ('operation_errors_total', 'errors', "Operaciones que terminaron con error."),
+            ('operation_bytes_in_total', 'bytes_in', "Bytes recibidos."),
+            ('operation_bytes_out_total', 'bytes_out', "Bytes enviados."),
+        ):
+            kind = 'gauge' if field == 'max_ms' else 'counter'
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for name, stats in snapshot.items():
+                value = seconds(stats[field]) if field == 'max_ms' else stats[field]
+                lines.append(f'{prefix}_{metric}{{operation="{name}"}} {value}')
+
+        for name, value in sorted((counters or {}).items()):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.append(f"{prefix}_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = Metrics(enabled=os.getenv('AMPA_METRICS', '1') != '0')
+
+
+def get_metrics():
+    """Registro de métricas del proceso (AMPA_METRICS=0 lo arranca desactivado)"""
+    return _metrics
+
+
+def measure(name):
+    return _metrics.measure(name)
+
+
+def timed(name):
+    """Decorador que mide cada llamada a la función como la operación `name`"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _metrics.enabled:
+                return function(*args, **kwargs)
+            with _Span(_metrics, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -2,8 +2,69 @@ from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from io import BytesIO
+from itertools import chain
+from tempfile import SpooledTemporaryFile
 from datetime import datetime
+from app.metrics import timed
+
+# Filas de movimientos por tabla: aproximadamente una página
+ROWS_PER_TABLE = 25
+# Filas que se formatean de una vez (por columnas) antes de partirlas en tablas
+FORMAT_BLOCK_ROWS = 2000
+# Anchos fijos para que todas las tablas de movimientos queden alineadas
+TRANSACTION_COL_WIDTHS = [62, 48, 100, 62, 196]
+DESCRIPTION_MAX_CHARS = 38
+# Hasta este tamaño el PDF se queda en memoria; a partir de ahí pasa a disco
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+TRANSACTION_HEADER = ['Fecha', 'Tipo', 'Categoría', 'Cantidad', 'Descripción']
+TRANSACTION_TABLE_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('PADDING', (0, 0), (-1, -1), 6),
+])
+
+
+class _FlowableStream(list):
+    """Lista de flowables que se rellena bajo demanda desde un generador.
+
+    SimpleDocTemplate.build consume la lista por delante, así que solo hay
+    en memoria las tablas de la página que se está maquetando.
+    """
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._pending = iter(flowables)
+
+    def __len__(self):
+        # build() pregunta la longitud antes de cada flowable: se rellena aquí
+        while list.__len__(self) < 2:
+            try:
+                self.append(next(self._pending))
+            except StopIteration:
+                break
+        return list.__len__(self)
+
+
+def format_transaction_rows(transactions):
+    """Filas de la tabla de movimientos formateadas por columnas"""
+    descriptions = transactions['description'].fillna('').astype(str)
+    too_long = descriptions.str.len() > DESCRIPTION_MAX_CHARS
+    descriptions = descriptions.where(
+        ~too_long, descriptions.str.slice(0, DESCRIPTION_MAX_CHARS - 1) + '…'
+    )
+    columns = [
+        transactions['date'].astype(str),
+        transactions['type'].eq('income').map({True: 'Ingreso', False: 'Gasto'}),
+        transactions['category'].fillna('').astype(str),
+        transactions['amount'].astype(float).map('€{:.2f}'.format),
+        descriptions,
+    ]
+    return [list(row) for row in zip(*(column.tolist() for column in columns))]
+
 
 class PDFGenerator:
     def __init__(self):
@@ -15,13 +76,24 @@ class PDFGenerator:
             spaceAfter=30
         )
 
-    def generate_report(self, transactions, initial_balance, current_balance, start_date=None, end_date=None):
-        buffer = BytesIO()
+    @timed('pdf.generate_report')
+    def generate_report(self, transactions, initial_balance, current_balance, start_date=None, end_date=None,
+                        output=None, progress=None, rows_per_table=ROWS_PER_TABLE, filtered=False):
+        """Genera el informe en PDF.
+
+        `output` puede ser una ruta o un fichero abierto; si no se indica se
+        escribe en un buffer temporal que pasa a disco si crece. Devuelve el
+        destino (el buffer, rebobinado). `progress(filas, total)` se llama a
+        medida que se maquetan los movimientos, por bloques. Con `filtered`
+        los movimientos ya son los del rango (p. ej. los de
+        FinancialManager.get_transactions_between) y no se vuelven a filtrar.
+        """
+        buffer = output if output is not None else SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
         doc = SimpleDocTemplate(buffer, pagesize=letter)
         elements = []
         
         # Filter transactions by date if date range is provided
-        if start_date and end_date:
+        if start_date and end_date and not filtered:
             filtered_transactions = transactions[
                 (transactions['date'] >= start_date) & 
                 (transactions['date'] <= end_date)
@@ -80,29 +152,31 @@ class PDFGenerator:
             elements.append(period_table)
             elements.append(Spacer(1, 20))
         
-        # Transactions
+        # Transactions: las tablas se generan a medida que se maquetan
+        transaction_tables = []
         if not filtered_transactions.empty:
-            trans_data = [['Fecha', 'Tipo', 'Categoría', 'Cantidad', 'Descripción']]
-            for _, row in filtered_transactions.iterrows():
-                trans_data.append([
-                    row['date'],
-                    'Ingreso' if row['type'] == 'income' else 'Gasto',
-                    row['category'],
-                    f"€{row['amount']:.2f}",
-                    row['description']
-                ])
-            
-            trans_table = Table(trans_data)
-            trans_table.setStyle(TableStyle([
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('PADDING', (0, 0), (-1, -1), 6),
-            ]))
-            elements.append(trans_table)
+            transaction_tables = self._transaction_tables(filtered_transactions, progress, rows_per_table)
 
-        doc.build(elements)
+        doc.build(_FlowableStream(chain(elements, transaction_tables)))
+        if output is None:
+            buffer.seek(0)
         return buffer
 
+    def _transaction_tables(self, transactions, progress=None, rows_per_table=ROWS_PER_TABLE):
+        """Genera las tablas de movimientos de `rows_per_table` filas, con la cabecera repetida"""
+        total = len(transactions)
+        done = 0
+        for block_start in range(0, total, FORMAT_BLOCK_ROWS):
+            rows = format_transaction_rows(transactions.iloc[block_start:block_start + FORMAT_BLOCK_ROWS])
+            for start in range(0, len(rows), rows_per_table):
+                table = Table(
+                    [TRANSACTION_HEADER] + rows[start:start + rows_per_table],
+                    colWidths=TRANSACTION_COL_WIDTHS,
+                    repeatRows=1
+                )
+                table.setStyle(TRANSACTION_TABLE_STYLE)
+                yield table
+            # Un aviso por bloque, no por tabla, para no saturar la interfaz
+            done += len(rows)
+            if progress is not None:
+                progress(done, total)
@@ -0,0 +1,36 @@
+import threading
+from collections import OrderedDict
+
+# Consultas distintas (filtro y orden) que se recuerdan por versión del libro
+QUERY_CACHE_SIZE = 32
+
+
+class QueryOrderCache:
+    """Resultados de las últimas consultas del libro: las posiciones de las
+    filas que pasan el filtro, ya ordenadas.
+
+    Pasar de página con el mismo filtro solo corta este array. Es una
+    estructura derivada del libro, así que se descarta con cada escritura;
+    cuando se llena se olvida la consulta usada hace más tiempo.
+    """
+
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self._orders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Orden de la consulta `key`, calculándolo con `build()` si falta"""
+        with self._lock:
+            order = self._orders.get(key)
+            if order is not None:
+                self._orders.move_to_end(key)
+                return order
+
+        order = build()
+        with self._lock:
+            self._orders[key] = order
+            self._orders.move_to_end(key)
+            while len(self._orders) > self.size:
+                self._orders.popitem(last=False)
+        return order
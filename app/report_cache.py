@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class ReportCache:
+    """Caché en disco de los informes PDF generados.
+
+    La clave incluye la versión del libro, así que un informe nunca se sirve
+    con datos antiguos; además cualquier escritura vacía la caché para liberar
+    espacio. Cuando se supera `max_bytes` se borran los informes usados hace
+    más tiempo (la fecha de modificación hace de marca de uso).
+    """
+
+    def __init__(self, cache_dir, max_bytes=50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(ledger_version, start_date, end_date, include_all, generated_on):
+        """Clave del informe; `generated_on` es la fecha que aparece en el título"""
+        raw = json.dumps(
+            [ledger_version, start_date, end_date, bool(include_all), generated_on],
+            default=str
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def _entries(self):
+        entries = []
+        try:
+            file_names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            # Directorio borrado (nuevo despliegue, limpieza de data/...): no hay informes
+            return entries
+        for file_name in file_names:
+            if not file_name.endswith('.pdf'):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get(self, key):
+        """Ruta del informe en caché o None"""
+        path = self._path(key)
+        with self._lock:
+            try:
+                os.utime(path)
+            except OSError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return path
+
+    def get_or_create(self, key, render):
+        """Devuelve la ruta del informe, generándolo con `render(ruta)` si falta"""
+        path = self.get(key)
+        if path is not None:
+            return path
+
+        path = self._path(key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            render(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep=None):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError as e:
+                    print(f"Error al borrar el informe en caché {path}: {str(e)}")
+
+    def invalidate(self):
+        """Borra todos los informes en caché"""
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reports': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+            }
+
+
+_report_cache = None
+_report_cache_lock = threading.Lock()
+
+
+def get_report_cache(data_dir='data'):
+    """Caché de informes compartida por todas las sesiones del proceso.
+
+    Vive en `data_dir`/.report_cache, con la ruta absoluta fijada al crearla
+    para que no dependa del directorio de trabajo posterior.
+    """
+    global _report_cache
+    with _report_cache_lock:
+        if _report_cache is None:
+            _report_cache = ReportCache(os.path.abspath(os.path.join(data_dir, '.report_cache')))
+        return _report_cache
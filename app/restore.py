@@ -0,0 +1,142 @@
+import os
+from datetime import datetime
+import pandas as pd
+from app.backup_manager import TIMESTAMP_FORMAT
+from app.storage import JournalStorage, TRANSACTION_COLUMNS, replay_journal
+
+
+class PointInTimeRestore:
+    """Reconstruye el libro tal como estaba en un momento dado.
+
+    Parte de la última copia de seguridad anterior a ese momento y le aplica
+    los registros del diario (de copias posteriores y del diario actual) con
+    fecha igual o anterior. Solo es exacta si el diario cubre todo el tramo
+    entre la copia y ese momento: en los modos instantánea y SQLite no se
+    escribe diario, y si faltan registros intermedios (el diario se compactó
+    sin que ninguna copia los recogiera) la reconstrucción se detiene en el
+    hueco. En esos casos el libro vuelve al último momento conocido
+    (`restored_at`), no al pedido.
+    """
+
+    def __init__(self, backup_manager):
+        self.backup_manager = backup_manager
+        self.drive_manager = backup_manager.drive_manager
+
+    def _journal_after(self, snapshot_ids, journal_seq):
+        """Registros del diario posteriores a `journal_seq`, sin repetir, por orden"""
+        journals = []
+        for snapshot_id in snapshot_ids:
+            manifest = self.backup_manager.load_manifest(snapshot_id)
+            journal, _ = self.backup_manager.read_manifest_file(manifest, JournalStorage.JOURNAL_FILE)
+            if journal is not None:
+                journals.append(journal)
+
+        local_path = os.path.join(self.drive_manager.local_data_dir, JournalStorage.JOURNAL_FILE)
+        if os.path.exists(local_path):
+            with open(local_path, 'rb') as f:
+                journals.append(self.drive_manager.parse_content(JournalStorage.JOURNAL_FILE, f.read()))
+
+        journals = [journal for journal in journals if not journal.empty]
+        if not journals:
+            return pd.DataFrame(columns=JournalStorage.JOURNAL_COLUMNS)
+        journal = pd.concat(journals, ignore_index=True)
+        journal['seq'] = journal['seq'].astype(int)
+        journal = journal[journal['seq'] > journal_seq]
+        return journal.drop_duplicates('seq', keep='last').sort_values('seq').reset_index(drop=True)
+
+    def _latest_seq(self, snapshot_ids, journal):
+        """Último número de secuencia del diario que consta en algún sitio"""
+        latest = int(journal['seq'].max()) if not journal.empty else 0
+        balances = [
+            self.backup_manager.read_manifest_file(self.backup_manager.load_manifest(snapshot_id),
+                                                   'balance.csv')[0]
+            for snapshot_id in snapshot_ids
+        ]
+        local_path = os.path.join(self.drive_manager.local_data_dir, 'balance.csv')
+        if os.path.exists(local_path):
+            balances.append(pd.read_csv(local_path))
+        for balance_df in balances:
+            if balance_df is not None and not balance_df.empty and 'journal_seq' in balance_df.columns:
+                latest = max(latest, int(balance_df['journal_seq'].iloc[0]))
+        return latest
+
+    def reconstruct(self, target, journal_active=False):
+        """Estado del libro en la fecha `target` (datetime).
+
+        `journal_active` indica si el libro se guarda ahora en modo diario,
+        es decir, si el diario actual recoge todos los cambios recientes.
+        """
+        target_id = target.strftime(TIMESTAMP_FORMAT)
+        snapshot_ids = self.backup_manager.snapshot_ids()
+        earlier = [snapshot_id for snapshot_id in snapshot_ids if snapshot_id <= target_id]
+        if not earlier:
+            raise ValueError("No hay ninguna copia de seguridad anterior a esa fecha")
+
+        snapshot_id = earlier[-1]
+        manifest = self.backup_manager.load_manifest(snapshot_id)
+        transactions, initial_balance, journal_seq = self.backup_manager.snapshot_state(manifest)
+        # Sin diario en la copia, lo que cambió después de ella no quedó registrado
+        journaled = any(entry['name'] == JournalStorage.JOURNAL_FILE for entry in manifest['files'])
+        later = [other_id for other_id in snapshot_ids if other_id > snapshot_id]
+        journal = self._journal_after(later, journal_seq)
+
+        # Solo sirve la parte del diario sin huecos en la secuencia
+        expected = pd.RangeIndex(journal_seq + 1, journal_seq + 1 + len(journal))
+        contiguous = journal[(journal['seq'].to_numpy() == expected.to_numpy()).cumprod().astype(bool)]
+        target_ts = target.isoformat(timespec='seconds')
+        records = contiguous[contiguous['ts'].astype(str) <= target_ts]
+        # El diario cubre hasta el momento pedido si se conoce algún cambio
+        # posterior sin huecos antes, o si sigue activo y no falta ningún
+        # registro hasta el último que se llegó a escribir
+        known_after_target = bool((contiguous['ts'].astype(str) > target_ts).any())
+        exact = journaled and (known_after_target or (
+            journal_active and journal_seq + len(contiguous) >= self._latest_seq(later, journal)
+        ))
+        snapshot_date = datetime.strptime(snapshot_id, TIMESTAMP_FORMAT)
+        restored_at = target if exact else snapshot_date
+        if not exact and not records.empty:
+            restored_at = max(snapshot_date, datetime.fromisoformat(str(records['ts'].iloc[-1])))
+
+        if not records.empty:
+            transactions, initial_balance = replay_journal(transactions, initial_balance, records)
+        return {
+            'transactions': transactions[TRANSACTION_COLUMNS].reset_index(drop=True),
+            'initial_balance': initial_balance,
+            'snapshot_id': snapshot_id,
+            'snapshot_date': snapshot_date,
+            'records': len(records),
+            'exact': exact,
+            'restored_at': restored_at,
+        }
+
+    @staticmethod
+    def _row_keys(transactions, row_hashes):
+        """Hash de cada fila más su número de aparición, para comparar multiconjuntos"""
+        hashes = row_hashes(transactions).reset_index(drop=True)
+        return pd.Series(list(zip(hashes, hashes.groupby(hashes).cumcount())))
+
+    def preview(self, target, financial_manager):
+        """Reconstruye el estado y lo compara con el libro actual"""
+        state = self.reconstruct(target, financial_manager.storage.mode == JournalStorage.mode)
+        current = financial_manager.transactions.reset_index(drop=True)
+        restored = state['transactions']
+
+        current_keys = self._row_keys(current, financial_manager._row_hashes)
+        restored_keys = self._row_keys(restored, financial_manager._row_hashes)
+        state['removed'] = current[~current_keys.isin(set(restored_keys)).to_numpy()]
+        state['added'] = restored[~restored_keys.isin(set(current_keys)).to_numpy()]
+        state['current_balance'] = financial_manager.initial_balance
+        return state
+
+    def apply(self, state, financial_manager):
+        """Sustituye el libro por el estado reconstruido.
+
+        Antes se hace una copia del estado actual para poder deshacerlo.
+        """
+        safety_backup = self.backup_manager.create_backup()
+        if safety_backup['status'] != 'success':
+            raise RuntimeError(
+                f"No se pudo copiar el estado actual antes de restaurar: {safety_backup.get('error')}"
+            )
+        financial_manager.replace_ledger(state['transactions'], state['initial_balance'])
+        return safety_backup['timestamp']
@@ -0,0 +1,136 @@
+import bisect
+import re
+import unicodedata
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Palabras del texto en minúsculas y sin acentos ("Lotería" -> "loteria")"""
+    if not isinstance(text, str):
+        return []
+    folded = unicodedata.normalize('NFKD', text.lower())
+    folded = ''.join(c for c in folded if not unicodedata.combining(c))
+    return TOKEN_PATTERN.findall(folded)
+
+
+class DescriptionIndex:
+    """Índice invertido de palabras de las descripciones.
+
+    Cada fila tiene un identificador interno que no cambia al borrar otras
+    filas; `row_ids` guarda los identificadores en orden de posición y, como
+    siempre es creciente, la posición de un identificador se obtiene con
+    búsqueda binaria. La búsqueda admite prefijos: "lot" encuentra "Lotería".
+    """
+
+    def __init__(self):
+        self.postings = {}
+        # Vocabulario ordenado para buscar por prefijo
+        self.tokens = []
+        self.row_ids = np.empty(0, dtype=np.int64)
+        self.next_id = 0
+
+    @classmethod
+    def from_frame(cls, transactions):
+        index = cls()
+        index.add_many(transactions['description'])
+        return index
+
+    def copy(self):
+        """Copia que comparte los conjuntos sin modificar (se sustituyen al cambiar)"""
+        index = DescriptionIndex()
+        index.postings = dict(self.postings)
+        index.tokens = list(self.tokens)
+        index.row_ids = self.row_ids.copy()
+        index.next_id = self.next_id
+        return index
+
+    def _add_tokens(self, row_id, description):
+        for token in set(tokenize(description)):
+            posting = self.postings.get(token)
+            if posting is None:
+                bisect.insort(self.tokens, token)
+                self.postings[token] = frozenset((row_id,))
+            else:
+                self.postings[token] = posting | {row_id}
+
+    def _remove_tokens(self, row_id, description):
+        for token in set(tokenize(description)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting = posting - {row_id}
+            if posting:
+                self.postings[token] = posting
+            else:
+                del self.postings[token]
+                del self.tokens[bisect.bisect_left(self.tokens, token)]
+
+    def add_many(self, descriptions):
+        """Añade filas al final del libro"""
+        ids = np.arange(self.next_id, self.next_id + len(descriptions), dtype=np.int64)
+        self.next_id += len(descriptions)
+        self.row_ids = np.concatenate([self.row_ids, ids])
+        if len(descriptions) == 1:
+            self._add_tokens(int(ids[0]), next(iter(descriptions)))
+            return
+
+        # En bloque: cada conjunto se crea una sola vez, no uno por fila
+        added = {}
+        # Los conceptos se repiten mucho (cuotas, lotería...): se tokeniza cada uno una vez
+        tokens_by_description = {}
+        for row_id, description in zip(ids.tolist(), descriptions):
+            key = description if isinstance(description, str) else None
+            tokens = tokens_by_description.get(key)
+            if tokens is None:
+                tokens = tokens_by_description[key] = set(tokenize(description))
+            for token in tokens:
+                added.setdefault(token, []).append(row_id)
+        new_tokens = [token for token in added if token not in self.postings]
+        for token, row_ids in added.items():
+            posting = self.postings.get(token)
+            self.postings[token] = frozenset(row_ids) if posting is None else posting | frozenset(row_ids)
+        if new_tokens:
+            self.tokens = sorted(self.tokens + new_tokens)
+
+    def add(self, description):
+        self.add_many([description])
+
+    def update(self, position, old_description, new_description):
+        row_id = int(self.row_ids[position])
+        self._remove_tokens(row_id, old_description)
+        self._add_tokens(row_id, new_description)
+
+    def delete(self, position, description):
+        row_id = int(self.row_ids[position])
+        self._remove_tokens(row_id, description)
+        self.row_ids = np.delete(self.row_ids, position)
+
+    def _prefix_matches(self, prefix):
+        ids = set()
+        start = bisect.bisect_left(self.tokens, prefix)
+        for token in self.tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            ids |= self.postings[token]
+        return ids
+
+    def search(self, query):
+        """Posiciones (ordenadas) de las filas que contienen todas las palabras
+        de la consulta, cada una como prefijo de alguna palabra de la fila"""
+        terms = tokenize(query)
+        if not terms:
+            return np.empty(0, dtype=np.int64)
+
+        # Primero el término más largo, que suele ser el más selectivo
+        ids = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            matches = self._prefix_matches(term)
+            ids = matches if ids is None else ids & matches
+            if not ids:
+                return np.empty(0, dtype=np.int64)
+
+        ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        ids.sort()
+        return np.searchsorted(self.row_ids, ids)
@@ -0,0 +1,114 @@
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+class ImportProfiler:
+    """Mide cuánto tarda cada importación, como `python -X importtime`.
+
+    Sustituye a `__import__` mientras está instalado, así que hay que
+    desinstalarlo en cuanto termina el arranque; si no, todas las
+    importaciones del proceso siguen pasando por él. Las de módulos ya
+    cargados pasan directamente; de los nuevos se anota el tiempo total
+    (incluidos los módulos que importan a su vez) y el propio. Ojo:
+    `importlib.import_module` no pasa por `__import__`.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = []
+        self._original_import = None
+        self._local = threading.local()
+
+    def install(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            # Si después se instaló otro envoltorio, no se le quita
+            if builtins.__import__ == self._import:
+                builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original_import = self._original_import
+        if level == 0 and not fromlist and name in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        resolved = name
+        if level:
+            package = (globals or {}).get('__package__') or ''
+            resolved = importlib.util.resolve_name('.' * level + name, package)
+        # `from paquete import submódulo` con el paquete ya cargado: se anota el submódulo
+        submodules = []
+        if fromlist and resolved in sys.modules:
+            submodules = [f"{resolved}.{item}" for item in fromlist
+                          if isinstance(item, str) and f"{resolved}.{item}" not in sys.modules]
+
+        loaded = len(sys.modules)
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            if len(sys.modules) > loaded:
+                module = next((submodule for submodule in submodules if submodule in sys.modules), resolved)
+                self.records.append({
+                    'module': module,
+                    'ms': round(elapsed * 1000, 1),
+                    'self_ms': round((elapsed - children) * 1000, 1),
+                    'at_s': round(start - self.started, 2),
+                    'depth': len(stack),
+                })
+
+    def report(self, limit=None, min_ms=0):
+        """Importaciones de mayor a menor tiempo total"""
+        records = sorted((record for record in self.records if record['ms'] >= min_ms),
+                         key=lambda record: record['ms'], reverse=True)
+        return records[:limit] if limit is not None else records
+
+    def total_ms(self):
+        """Tiempo de las importaciones de primer nivel (sin contar dos veces las anidadas)"""
+        return round(sum(record['ms'] for record in self.records if record['depth'] == 0), 1)
+
+
+def get_import_profiler():
+    """Perfilador del proceso; se instala la primera vez que se pide y no
+    vuelve a instalarse después de `uninstall()`"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = ImportProfiler()
+            _profiler.install()
+        return _profiler
+
+
+if __name__ == '__main__':
+    # Informe en consola: python -m app.startup_profile [módulo ...]
+    modules = sys.argv[1:] or [
+        'streamlit', 'app.auth', 'app.drive_manager', 'app.financial',
+        'app.backup_manager', 'app.backup_scheduler', 'app.restore',
+        'app.bank_import', 'app.pdf_generator', 'app.charts',
+    ]
+    profiler = get_import_profiler()
+    for module in modules:
+        __import__(module)
+    profiler.uninstall()
+    print(f"{'ms':>9} {'propio':>9}  módulo")
+    for record in profiler.report(limit=40, min_ms=1):
+        print(f"{record['ms']:9.1f} {record['self_ms']:9.1f}  {'  ' * record['depth']}{record['module']}")
+    print(f"Total: {profiler.total_ms()} ms")
@@ -0,0 +1,677 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from app.aggregates import LedgerAggregates
+from app.ledger_format import parquet_available
+
+TRANSACTION_COLUMNS = ['date', 'type', 'category', 'amount', 'description']
+
+# Fichero de la instantánea del libro según el formato
+TRANSACTION_FILES = {
+    'csv': 'transactions.csv',
+    'parquet': 'transactions.parquet',
+}
+# Todos los ficheros que pueden formar parte del libro, para las copias de seguridad
+LEDGER_FILES = ['transactions.csv', 'transactions.parquet', 'balance.csv',
+                'transactions_journal.csv', 'ledger.sqlite3']
+# Ficheros auxiliares de una base de datos SQLite en modo WAL
+SQLITE_SIDECARS = ('-wal', '-shm')
+
+
+def empty_transactions():
+    return pd.DataFrame({column: [] for column in TRANSACTION_COLUMNS})
+
+
+def replay_journal(transactions, initial_balance, journal):
+    """Aplica los registros del diario sobre la instantánea"""
+    frame = transactions.reset_index(drop=True)
+    # Las altas se acumulan y se concatenan al final de una sola vez
+    pending_adds = []
+
+    for record in journal.itertuples(index=False):
+        if record.op == 'balance':
+            initial_balance = float(record.balance)
+            continue
+
+        row = {column: getattr(record, column) for column in TRANSACTION_COLUMNS}
+        if record.op == 'add':
+            pending_adds.append(row)
+            continue
+
+        index = int(record.position)
+        if index < len(frame):
+            if record.op == 'update':
+                for column, value in row.items():
+                    frame.at[index, column] = value
+            elif record.op == 'delete':
+                frame = frame.drop(index).reset_index(drop=True)
+        elif index < len(frame) + len(pending_adds):
+            if record.op == 'update':
+                pending_adds[index - len(frame)] = row
+            elif record.op == 'delete':
+                del pending_adds[index - len(frame)]
+
+    if pending_adds:
+        frame = pd.concat([frame, pd.DataFrame(pending_adds)], ignore_index=True)
+    return frame, initial_balance
+
+
+def is_sqlite_file(file_name):
+    return str(file_name).endswith('.sqlite3')
+
+
+def read_sqlite_file(path):
+    """Copia coherente de una base de datos SQLite, incluido lo que aún está en el WAL"""
+    source = sqlite3.connect(path)
+    target = sqlite3.connect(':memory:')
+    try:
+        source.backup(target)
+        content = bytearray(target.serialize())
+    finally:
+        target.close()
+        source.close()
+    # Cabecera de modo rollback en lugar de WAL, para poder abrir la copia en memoria
+    content[18:20] = b'\x01\x01'
+    return bytes(content)
+
+
+def remove_sqlite_file(path):
+    """Borra la base de datos junto con su WAL"""
+    close_sqlite_database(path)
+    for suffix in ('',) + SQLITE_SIDECARS:
+        if os.path.exists(f"{path}{suffix}"):
+            os.remove(f"{path}{suffix}")
+
+
+def sqlite_mtime_ns(path):
+    """Última modificación de la base de datos, contando el WAL"""
+    return max(os.stat(f"{path}{suffix}").st_mtime_ns
+               for suffix in ('', '-wal') if os.path.exists(f"{path}{suffix}"))
+
+
+class SnapshotStorage:
+    """Guarda el libro completo en transactions.csv y balance.csv en cada cambio.
+
+    Es también la interfaz de los almacenamientos: `load()`, `save()` con
+    los cambios aplicados, `version()` para la caché del libro y
+    `aggregates()` para los totales.
+    """
+
+    mode = 'snapshot'
+
+    def __init__(self, drive_manager, ledger_format=None):
+        self.drive_manager = drive_manager
+        ledger_format = ledger_format or os.getenv('AMPA_LEDGER_FORMAT', 'csv')
+        if ledger_format not in TRANSACTION_FILES:
+            raise ValueError(f"Formato de libro desconocido: {ledger_format}")
+        if ledger_format == 'parquet' and not parquet_available():
+            print("WARNING: pyarrow no está instalado. Se usará el formato CSV.")
+            ledger_format = 'csv'
+        self.ledger_format = ledger_format
+        self.transactions_file = TRANSACTION_FILES[ledger_format]
+        self.file_names = [self.transactions_file, 'balance.csv']
+
+    def _load_transactions(self):
+        if self.ledger_format != 'csv' and not self.drive_manager.file_exists(self.transactions_file):
+            return self._migrate_from_csv()
+        return self.drive_manager.load_data(self.transactions_file)
+
+    def _migrate_from_csv(self):
+        """Convierte el transactions.csv existente al formato configurado"""
+        transactions = self.drive_manager.load_data(TRANSACTION_FILES['csv'])
+        if not transactions.empty:
+            print(f"Migrando {TRANSACTION_FILES['csv']} a {self.transactions_file}")
+            try:
+                self.drive_manager.save_data(transactions, self.transactions_file)
+            except ValueError as e:
+                # Se sigue leyendo el CSV hasta que se corrijan las filas
+                print(f"ERROR: no se ha migrado {TRANSACTION_FILES['csv']}: {str(e)}")
+        return transactions
+
+    def _load_snapshot(self):
+        transactions = self._load_transactions()
+        if transactions.empty:
+            transactions = empty_transactions()
+        balance_df = self.drive_manager.load_data('balance.csv')
+        return transactions, balance_df
+
+    def load(self):
+        """Devuelve (transactions, initial_balance)"""
+        transactions, balance_df = self._load_snapshot()
+        if balance_df.empty:
+            initial_balance = 0.0
+        else:
+            initial_balance = float(balance_df['balance'].iloc[0])
+        return transactions, initial_balance
+
+    def save(self, transactions, initial_balance, changes=None):
+        """Persiste el estado; `changes` describe las operaciones aplicadas"""
+        self._save_snapshot(transactions, initial_balance)
+
+    def version(self, refresh=True):
+        """Token que cambia con cualquier escritura del libro"""
+        return tuple(
+            self.drive_manager.get_file_version(name, refresh=refresh) for name in self.file_names
+        )
+
+    def aggregates(self, transactions, version=None):
+        """Totales del libro guardado, que es `transactions`"""
+        return LedgerAggregates.from_frame(transactions)
+
+    def _save_snapshot(self, transactions, initial_balance, balance_extra=None):
+        self.drive_manager.save_data(transactions, self.transactions_file)
+        balance = {'balance': [initial_balance]}
+        if balance_extra:
+            balance.update({key: [value] for key, value in balance_extra.items()})
+        self.drive_manager.save_data(balance, 'balance.csv')
+
+
+class JournalStorage(SnapshotStorage):
+    """Libro en modo diario: cada cambio se añade como un registro al final de
+    transactions_journal.csv y solo se reescribe la instantánea completa al
+    compactar.
+
+    El estado se reconstruye con la instantánea más los registros del diario
+    con número de secuencia mayor que el `journal_seq` guardado en balance.csv.
+    """
+
+    mode = 'journal'
+    JOURNAL_FILE = 'transactions_journal.csv'
+    JOURNAL_COLUMNS = ['seq', 'ts', 'op', 'position', 'balance'] + TRANSACTION_COLUMNS
+
+    def __init__(self, drive_manager, ledger_format=None, compact_every=500):
+        super().__init__(drive_manager, ledger_format)
+        # Número de registros a partir del cual se compacta el diario
+        self.compact_every = compact_every
+        self.file_names = [self.transactions_file, 'balance.csv', self.JOURNAL_FILE]
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.drive_manager.local_data_dir, self.JOURNAL_FILE)
+
+    def load(self):
+        transactions, balance_df = self._load_snapshot()
+        if balance_df.empty:
+            initial_balance = 0.0
+            snapshot_seq = 0
+        else:
+            initial_balance = float(balance_df['balance'].iloc[0])
+            snapshot_seq = self._snapshot_seq(balance_df)
+
+        journal = self.drive_manager.load_data(self.JOURNAL_FILE)
+        if not journal.empty:
+            journal = journal[journal['seq'] > snapshot_seq]
+        if journal.empty:
+            return transactions, initial_balance
+        return replay_journal(transactions, initial_balance, journal)
+
+    def _snapshot_seq(self, balance_df):
+        if 'journal_seq' not in balance_df.columns:
+            return 0
+        return int(balance_df['journal_seq'].iloc[0])
+
+    def _read_journal_records(self):
+        if not os.path.exists(self.journal_path):
+            return []
+        with open(self.journal_path, 'r', newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def save(self, transactions, initial_balance, changes=None):
+        if not changes:
+            self.compact(transactions, initial_balance)
+            return
+
+        records = self._read_journal_records()
+        last_seq = int(records[-1]['seq']) if records else self._local_snapshot_seq()
+        if len(records) + len(changes) >= self.compact_every:
+            self.compact(transactions, initial_balance, last_seq + len(changes))
+            return
+
+        ts = datetime.now().isoformat(timespec='seconds')
+        new_file = not os.path.exists(self.journal_path)
+        with open(self.journal_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.JOURNAL_COLUMNS)
+            if new_file:
+                writer.writeheader()
+            for offset, change in enumerate(changes, start=1):
+                record = {'seq': last_seq + offset, 'ts': ts, 'op': change['op']}
+                if 'index' in change:
+                    record['position'] = change['index']
+                if 'balance' in change:
+                    record['balance'] = change['balance']
+                record.update(change.get('row', {}))
+                writer.writerow(record)
+
+        # Solo se sube el diario, cuyo tamaño está acotado por compact_every
+        self.drive_manager.upload_local_file(self.JOURNAL_FILE)
+
+    def _local_snapshot_seq(self):
+        balance_path = os.path.join(self.drive_manager.local_data_dir, 'balance.csv')
+        if not os.path.exists(balance_path):
+            return 0
+        balance_df = pd.read_csv(balance_path)
+        if balance_df.empty:
+            return 0
+        return self._snapshot_seq(balance_df)
+
+    def compact(self, transactions, initial_balance, journal_seq=None):
+        """Escribe una instantánea completa y vacía el diario"""
+        if journal_seq is None:
+            records = self._read_journal_records()
+            journal_seq = int(records[-1]['seq']) if records else self._local_snapshot_seq()
+
+        # La instantánea se guarda antes de vaciar el diario: los registros ya
+        # incluidos se descartan al cargar por su número de secuencia
+        self._save_snapshot(transactions, initial_balance, {'journal_seq': journal_seq})
+        with open(self.journal_path, 'w', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, fieldnames=self.JOURNAL_COLUMNS).writeheader()
+        self.drive_manager.upload_local_file(self.JOURNAL_FILE)
+
+
+class _SQLiteDatabase:
+    """Conexión a una base de datos del libro compartida por todo el proceso.
+
+    Streamlit crea un almacenamiento nuevo en cada ejecución de cada sesión;
+    todos usan esta conexión (protegida por `lock`) en lugar de abrir una
+    propia. También guarda los ids de las filas por posición, válidos para
+    la versión `ids_version` del libro.
+    """
+
+    def __init__(self, path, schema):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.lock = threading.RLock()
+        # Sin transacción implícita: las escrituras abren BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(schema)
+        self.ids = None
+        self.ids_version = None
+        self.sync_lock = threading.Lock()
+        self.sync_thread = None
+        self.closed = False
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.connection.close()
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def _open_database(path, schema):
+    """Conexión compartida a la base de datos de `path`, una por proceso"""
+    path = os.path.abspath(path)
+    with _databases_lock:
+        database = _databases.get(path)
+        if database is None:
+            database = _databases[path] = _SQLiteDatabase(path, schema)
+        return database
+
+
+def close_sqlite_database(path):
+    """Cierra la conexión compartida a la base de datos de `path`, si la hay"""
+    with _databases_lock:
+        database = _databases.pop(os.path.abspath(path), None)
+    if database is not None:
+        database.close()
+
+
+class SQLiteStorage(SnapshotStorage):
+    """Libro en una base de datos SQLite local (data/ledger.sqlite3, modo WAL).
+
+    Cada alta, modificación o baja es una sola sentencia y los totales se
+    calculan con consultas agregadas sobre los índices. Drive solo recibe
+    una instantánea en el formato configurado (CSV o Parquet) cada
+    `sync_every` cambios o `sync_interval` segundos, aunque no se guarde
+    nada más; esa misma instantánea es la que se migra a la base de datos
+    cuando aún no existe.
+    """
+
+    mode = 'sqlite'
+    DATABASE_FILE = 'ledger.sqlite3'
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            type TEXT,
+            category TEXT,
+            amount_cents INTEGER NOT NULL DEFAULT 0,
+            description TEXT
+        );
+        CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date);
+        CREATE INDEX IF NOT EXISTS transactions_type_category
+            ON transactions (type, category, amount_cents);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+    INSERT = ("INSERT INTO transactions (date, type, category, amount_cents, description) "
+              "VALUES (?, ?, ?, ?, ?)")
+
+    def __init__(self, drive_manager, ledger_format=None, sync_every=100, sync_interval=600):
+        super().__init__(drive_manager, ledger_format)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.file_names = [self.DATABASE_FILE]
+
+    @property
+    def database_path(self):
+        return os.path.join(self.drive_manager.local_data_dir, self.DATABASE_FILE)
+
+    def _database(self):
+        database = _open_database(self.database_path, self.SCHEMA)
+        self._start_sync_timer(database)
+        return database
+
+    @contextmanager
+    def _read(self):
+        """Lectura con la conexión compartida: `with self._read() as connection:`"""
+        database = self._database()
+        with database.lock:
+            yield database.connection
+
+    @contextmanager
+    def _write(self):
+        """Transacción de escritura: `with self._write() as connection:`"""
+        database = self._database()
+        with database.lock:
+            database.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield database.connection
+            except BaseException:
+                database.connection.execute("ROLLBACK")
+                # Los ids por posición pueden haber cambiado a medias
+                database.ids = None
+                raise
+            database.connection.execute("COMMIT")
+
+    @staticmethod
+    def _get_meta(connection, key, default=None):
+        row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    @staticmethod
+    def _set_meta(connection, values):
+        connection.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                               [(key, str(value)) for key, value in values.items()])
+
+    @staticmethod
+    def _version(connection):
+        rows = dict(connection.execute(
+            "SELECT key, value FROM meta WHERE key IN ('generation', 'version')"
+        ).fetchall())
+        if 'generation' not in rows:
+            return None
+        return f"{rows['generation']}-{rows['version']}"
+
+    @staticmethod
+    def _row_values(row):
+        values = []
+        for column in ('date', 'type', 'category'):
+            value = row.get(column)
+            values.append(None if pd.isna(value) else str(value))
+        amount = row.get('amount')
+        values.append(0 if pd.isna(amount) else int(round(float(amount) * 100)))
+        description = row.get('description')
+        values.append(None if pd.isna(description) else str(description))
+        return values
+
+    @staticmethod
+    def _frame_values(transactions):
+        frame = transactions[TRANSACTION_COLUMNS].reset_index(drop=True)
+        cents = (frame['amount'].astype(float).fillna(0) * 100).round().astype('int64')
+        text = frame[['date', 'type', 'category', 'description']].astype(object)
+        text = text.where(text.notna(), None)
+        return zip(
+            (None if value is None else str(value) for value in text['date']),
+            text['type'], text['category'], cents.tolist(), text['description']
+        )
+
+    @classmethod
+    def _read_ledger(cls, connection):
+        rows = connection.execute(
+            "SELECT date, type, category, amount_cents, description FROM transactions ORDER BY id"
+        ).fetchall()
+        transactions = pd.DataFrame.from_records(
+            rows, columns=['date', 'type', 'category', 'amount', 'description']
+        )
+        if transactions.empty:
+            transactions = empty_transactions()
+        else:
+            transactions['amount'] = transactions['amount'] / 100
+        initial_balance = float(cls._get_meta(connection, 'balance', 0.0))
+        return transactions, initial_balance
+
+    @classmethod
+    def read_database(cls, content):
+        """(transactions, initial_balance) de una copia de la base de datos"""
+        connection = sqlite3.connect(':memory:')
+        try:
+            connection.deserialize(content)
+            return cls._read_ledger(connection)
+        finally:
+            connection.close()
+
+    def load(self):
+        with self._read() as connection:
+            migrated = self._get_meta(connection, 'generation') is not None
+        if not migrated:
+            self._migrate()
+        with self._read() as connection:
+            return self._read_ledger(connection)
+
+    def _migrate(self):
+        """Crea la base de datos a partir del libro en CSV/Parquet (y su diario)"""
+        journal_storage = JournalStorage(self.drive_manager, self.ledger_format)
+        transactions, initial_balance = journal_storage.load()
+        records = journal_storage._read_journal_records()
+        journal_seq = int(records[-1]['seq']) if records else journal_storage._local_snapshot_seq()
+
+        with self._write() as connection:
+            # Otro proceso puede haberla creado mientras se leía la instantánea
+            if self._get_meta(connection, 'generation') is not None:
+                return
+            if not transactions.empty:
+                print(f"Migrando {self.transactions_file} a {self.DATABASE_FILE}")
+            self._replace_rows(connection, transactions, initial_balance)
+            # La instantánea de Drive ya tiene este estado
+            self._set_meta(connection, {
+                'journal_seq': journal_seq, 'synced_version': 0, 'synced_at': time.time()
+            })
+
+    def _replace_rows(self, connection, transactions, initial_balance):
+        connection.execute("DELETE FROM transactions")
+        connection.executemany(self.INSERT, self._frame_values(transactions))
+        self._set_meta(connection, {
+            'generation': uuid.uuid4().hex, 'version': 0, 'balance': float(initial_balance)
+        })
+
+    def _row_ids(self, database, connection):
+        """ids de las filas en el orden del libro (el de alta).
+
+        Se leen una vez por versión; los cambios de la sesión los mantienen
+        al día, así que localizar una fila por posición no recorre la tabla.
+        """
+        version = self._version(connection)
+        if database.ids is None or database.ids_version != version:
+            database.ids = np.fromiter(
+                (row[0] for row in connection.execute("SELECT id FROM transactions ORDER BY id")),
+                dtype=np.int64
+            )
+            database.ids_version = version
+        return database.ids
+
+    def _apply_changes(self, database, connection, changes):
+        """Aplica los cambios y devuelve los ids por posición resultantes"""
+        ids = self._row_ids(database, connection)
+        # Las altas se acumulan y se insertan juntas: con la tabla bloqueada,
+        # SQLite les asigna los ids siguientes al mayor
+        added = []
+
+        def flush_adds():
+            nonlocal ids
+            if added:
+                last_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+                connection.executemany(self.INSERT, added)
+                ids = np.concatenate([ids, np.arange(last_id + 1, last_id + 1 + len(added), dtype=np.int64)])
+                added.clear()
+
+        for change in changes:
+            op = change['op']
+            if op == 'add':
+                added.append(self._row_values(change['row']))
+                continue
+            flush_adds()
+            if op == 'update':
+                connection.execute(
+                    "UPDATE transactions SET date = ?, type = ?, category = ?, amount_cents = ?, "
+                    "description = ? WHERE id = ?",
+                    self._row_values(change['row']) + [int(ids[int(change['index'])])]
+                )
+            elif op == 'delete':
+                position = int(change['index'])
+                connection.execute("DELETE FROM transactions WHERE id = ?", (int(ids[position]),))
+                ids = np.delete(ids, position)
+            elif op == 'balance':
+                self._set_meta(connection, {'balance': float(change['balance'])})
+        flush_adds()
+        return ids
+
+    def save(self, transactions, initial_balance, changes=None):
+        with self._write() as connection:
+            database = self._database()
+            if changes:
+                ids = self._apply_changes(database, connection, changes)
+                connection.execute(
+                    "UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'"
+                )
+                database.ids, database.ids_version = ids, self._version(connection)
+            else:
+                self._replace_rows(connection, transactions, initial_balance)
+                self._set_meta(connection, {'synced_version': -1})
+                database.ids = None
+
+        if self._sync_due():
+            self.sync(transactions, initial_balance)
+
+    def _sync_due(self):
+        with self._read() as connection:
+            version = int(self._get_meta(connection, 'version', 0))
+            synced_version = int(self._get_meta(connection, 'synced_version', -1))
+            synced_at = float(self._get_meta(connection, 'synced_at', 0))
+        if version == synced_version:
+            return False
+        return (synced_version < 0 or version - synced_version >= self.sync_every
+                or time.time() - synced_at >= self.sync_interval)
+
+    def sync(self, transactions=None, initial_balance=None):
+        """Sube a Drive la instantánea del libro (y la deja en data/).
+
+        Sin `transactions` se sube lo que haya en la base de datos.
+        """
+        database = self._database()
+        # Una sola subida a la vez por proceso (guardado y temporizador)
+        with database.sync_lock:
+            with self._read() as connection:
+                version = self._get_meta(connection, 'version', 0)
+                journal_seq = self._get_meta(connection, 'journal_seq')
+                if transactions is None:
+                    transactions, initial_balance = self._read_ledger(connection)
+            # journal_seq evita que el diario antiguo se vuelva a aplicar si se
+            # vuelve al modo diario
+            self._save_snapshot(transactions, initial_balance,
+                                {'journal_seq': journal_seq} if journal_seq is not None else None)
+            with self._write() as connection:
+                self._set_meta(connection, {'synced_version': version, 'synced_at': time.time()})
+
+    def _start_sync_timer(self, database):
+        """Hilo que sube los cambios pendientes cuando pasa `sync_interval`
+        sin que ningún guardado haya llegado a `sync_every`"""
+        if database.sync_thread is not None:
+            return
+        with _databases_lock:
+            if database.sync_thread is not None:
+                return
+            database.sync_thread = threading.Thread(
+                target=self._sync_periodically, args=(database,), daemon=True,
+                name=f"ledger-sync-{os.path.basename(database.path)}"
+            )
+        database.sync_thread.start()
+
+    def _sync_periodically(self, database):
+        # Se comprueba a menudo para que el retraso no llegue al doble del intervalo
+        check_seconds = max(1, min(60, self.sync_interval / 4))
+        while True:
+            time.sleep(check_seconds)
+            if database.closed:
+                return
+            if not os.path.exists(database.path):
+                # Han borrado data/: la conexión ya no sirve
+                close_sqlite_database(database.path)
+                return
+            try:
+                if self._sync_due():
+                    self.sync()
+            except Exception as e:
+                print(f"Error subiendo el libro a Drive: {str(e)}")
+
+    def version(self, refresh=True):
+        if not os.path.exists(self.database_path):
+            return None
+        with self._read() as connection:
+            return self._version(connection)
+
+    def aggregates(self, transactions, version=None):
+        """Totales por tipo, categoría y mes con consultas agregadas.
+
+        Solo si `transactions` es el libro de la versión `version` y esa
+        sigue siendo la de la base de datos; si no, se calculan sobre el
+        DataFrame.
+        """
+        if version is None:
+            return LedgerAggregates.from_frame(transactions)
+        with self._read() as connection:
+            # Una transacción de lectura: la versión y los totales son del mismo estado
+            connection.execute("BEGIN")
+            try:
+                if self._version(connection) != version:
+                    return LedgerAggregates.from_frame(transactions)
+                # Solo recorre el índice (type, category, amount_cents)
+                by_category = connection.execute(
+                    "SELECT type, COALESCE(category, ''), SUM(amount_cents), COUNT(*) "
+                    "FROM transactions GROUP BY type, category"
+                ).fetchall()
+                by_month = connection.execute(
+                    "SELECT type, COALESCE(substr(date, 1, 7), ''), SUM(amount_cents), COUNT(*) "
+                    "FROM transactions GROUP BY type, substr(date, 1, 7)"
+                ).fetchall()
+            finally:
+                connection.execute("COMMIT")
+        return LedgerAggregates.from_grouped(by_category, by_month)
+
+
+STORAGE_MODES = {
+    SnapshotStorage.mode: SnapshotStorage,
+    JournalStorage.mode: JournalStorage,
+    SQLiteStorage.mode: SQLiteStorage,
+}
+
+
+def create_storage(drive_manager, mode=None, ledger_format=None):
+    """Crea el almacenamiento indicado o el configurado en AMPA_STORAGE_MODE
+    y AMPA_LEDGER_FORMAT"""
+    mode = mode or os.getenv('AMPA_STORAGE_MODE', SnapshotStorage.mode)
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Modo de almacenamiento desconocido: {mode}")
+    return STORAGE_MODES[mode](drive_manager, ledger_format)
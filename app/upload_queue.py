@@ -0,0 +1,137 @@
+import atexit
+import random
+import threading
+import time
+from datetime import datetime
+
+
+class DriveUploadQueue:
+    """Write-behind uploader for Google Drive.
+
+    A single worker thread owns the pending uploads, keyed by file name. If a
+    file is saved again before its upload starts, only the latest content is
+    uploaded. Failed uploads are retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, upload_fn, max_retries=5, base_delay=1.0, max_delay=60.0):
+        # upload_fn(file_name, content, mimetype) -> bool
+        self.upload_fn = upload_fn
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._in_flight = None
+        self._thread = None
+        self.coalesced = 0
+        self.uploaded = 0
+        self.last_sync = None
+        self.last_error = None
+        self.failed = {}
+        atexit.register(self.flush, 10)
+
+    def enqueue(self, file_name, content, mimetype='text/csv', version=None):
+        """Schedule an upload, replacing any pending content for the same file"""
+        with self._cond:
+            if file_name in self._pending:
+                self.coalesced += 1
+            self._pending[file_name] = {
+                'content': content,
+                'mimetype': mimetype,
+                'version': version,
+                'attempts': 0,
+                'not_before': 0
+            }
+            self.failed.pop(file_name, None)
+            self._ensure_worker()
+            self._cond.notify_all()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='drive-upload-queue', daemon=True
+            )
+            self._thread.start()
+
+    def pending_version(self, file_name):
+        """Version of the content waiting to be uploaded, or None"""
+        with self._cond:
+            if self._in_flight and self._in_flight[0] == file_name:
+                return self._in_flight[1]['version']
+            entry = self._pending.get(file_name)
+            return entry['version'] if entry else None
+
+    def is_pending(self, file_name):
+        with self._cond:
+            in_flight = self._in_flight is not None and self._in_flight[0] == file_name
+            return in_flight or file_name in self._pending
+
+    def _next_job(self):
+        """Wait for the next upload whose backoff has expired"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                ready = [name for name, entry in self._pending.items()
+                         if entry['not_before'] <= now]
+                if ready:
+                    file_name = ready[0]
+                    self._in_flight = (file_name, self._pending.pop(file_name))
+                    return self._in_flight
+                if self._pending:
+                    wait = min(entry['not_before'] for entry in self._pending.values()) - now
+                    self._cond.wait(timeout=max(wait, 0.01))
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            file_name, entry = self._next_job()
+            try:
+                ok = self.upload_fn(file_name, entry['content'], entry['mimetype'])
+                error = None if ok else 'upload failed'
+            except Exception as e:
+                ok = False
+                error = str(e)
+
+            with self._cond:
+                self._in_flight = None
+                if ok:
+                    self.uploaded += 1
+                    self.last_sync = datetime.now()
+                    self.last_error = None
+                elif file_name not in self._pending:
+                    # A newer save replaces the failed content and restarts the retries
+                    self.last_error = f"{file_name}: {error}"
+                    entry['attempts'] += 1
+                    if entry['attempts'] > self.max_retries:
+                        self.failed[file_name] = error
+                    else:
+                        delay = min(self.max_delay, self.base_delay * 2 ** (entry['attempts'] - 1))
+                        entry['not_before'] = time.monotonic() + delay * random.uniform(0.5, 1.0)
+                        self._pending[file_name] = entry
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every pending upload has finished or given up"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+            return True
+
+    def status(self):
+        with self._cond:
+            return {
+                'pending': len(self._pending) + (1 if self._in_flight else 0),
+                'pending_files': sorted(
+                    list(self._pending) + ([self._in_flight[0]] if self._in_flight else [])
+                ),
+                'uploaded': self.uploaded,
+                'coalesced': self.coalesced,
+                'last_sync': self.last_sync,
+                'last_error': self.last_error,
+                'failed': dict(self.failed)
+            }
@@ -0,0 +1,232 @@
+"""Sustituto en memoria de la API files() de Google Drive v3.
+
+Implementa lo que usa DriveManager (list, get, get_media, create, update y
+delete) con latencia y fallos configurables, sin red ni credenciales. Las
+descargas devuelven una petición compatible con MediaIoBaseDownload, así
+que se mide el mismo código que en producción.
+"""
+import collections
+import hashlib
+import itertools
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+import httplib2
+from googleapiclient.errors import HttpError
+
+FILE_FIELDS = ('id', 'name', 'md5Checksum', 'modifiedTime', 'mimeType')
+
+
+def _response(status, headers=None):
+    resp = httplib2.Response(dict(headers or {}, status=str(status)))
+    resp.status = status
+    resp.reason = 'Fake Drive'
+    return resp
+
+
+class FakeDriveService:
+    """Almacén de ficheros en memoria con la interfaz de `service.files()`.
+
+    `latency` son los segundos de cada llamada, `bandwidth` los bytes por
+    segundo de las transferencias (None: instantáneas) y `failure_rate` la
+    probabilidad de que una llamada falle con un 503 o un 429.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.files_by_id = {}
+        self.calls = collections.Counter()
+        self.failures = collections.Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def files(self):
+        return _FakeFiles(self)
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.failures.clear()
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def counters(self):
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'failures': dict(self.failures),
+                'bytes_uploaded': self.bytes_in,
+                'bytes_downloaded': self.bytes_out,
+            }
+
+    def _call(self, method, transferred=0):
+        """Cuenta la llamada, espera la latencia y, a veces, falla"""
+        with self._lock:
+            self.calls[method] += 1
+            fail = self.failure_rate and self._random.random() < self.failure_rate
+            status = self._random.choice((503, 429)) if fail else None
+            if fail:
+                self.failures[method] += 1
+        delay = self.latency
+        if self.bandwidth and transferred:
+            delay += transferred / self.bandwidth
+        if delay:
+            time.sleep(delay)
+        if status is not None:
+            raise HttpError(_response(status), b'{"error": {"message": "Fallo simulado"}}')
+
+    def _get(self, file_id):
+        stored = self.files_by_id.get(file_id)
+        if stored is None:
+            raise HttpError(_response(404), b'{"error": {"message": "File not found"}}')
+        return stored
+
+    @staticmethod
+    def _metadata(stored):
+        return {key: stored[key] for key in FILE_FIELDS if key in stored}
+
+    def _write(self, stored, media_body):
+        content = media_body.getbytes(0, media_body.size()) if media_body is not None else b''
+        stored['content'] = content
+        stored['md5Checksum'] = hashlib.md5(content).hexdigest()
+        stored['modifiedTime'] = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            self.bytes_in += len(content)
+        return len(content)
+
+    def put_file(self, name, content, parent='root'):
+        """Deja un fichero en el almacén sin contar la llamada (para preparar pruebas)"""
+        file_id = f"fake{next(self._ids)}"
+        self.files_by_id[file_id] = {
+            'id': file_id,
+            'name': name,
+            'parents': [parent],
+            'content': content,
+            'md5Checksum': hashlib.md5(content).hexdigest(),
+            'modifiedTime': datetime.now(timezone.utc).isoformat(),
+        }
+        return file_id
+
+
+class _FakeRequest:
+    def __init__(self, run):
+        self._run = run
+
+    def execute(self, num_retries=0):
+        return self._run()
+
+
+class _FakeMediaHttp:
+    """Transporte de las descargas: responde a peticiones con cabecera Range"""
+
+    def __init__(self, service, file_id):
+        self.service = service
+        self.file_id = file_id
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        content = self.service._get(self.file_id)['content']
+        start, end = 0, len(content) - 1
+        match = re.match(r'bytes=(\d+)-(\d+)', (headers or {}).get('range', ''))
+        if match:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(content) - 1)
+        chunk = content[start:end + 1]
+        try:
+            self.service._call('get_media', len(chunk))
+        except HttpError as e:
+            # Como el servidor real: una respuesta de error que el cliente puede reintentar
+            return e.resp, e.content
+        with self.service._lock:
+            self.service.bytes_out += len(chunk)
+        if not content:
+            return _response(416, {'content-range': 'bytes */0'}), b''
+        return _response(206, {'content-range': f"bytes {start}-{end}/{len(content)}"}), chunk
+
+
+class _FakeMediaRequest:
+    """Lo mínimo que MediaIoBaseDownload necesita de una petición"""
+
+    def __init__(self, service, file_id):
+        self.uri = f"https://fake.drive/files/{file_id}?alt=media"
+        self.http = _FakeMediaHttp(service, file_id)
+        self.headers = {}
+
+
+class _FakeFiles:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, q='', fields=None, pageSize=None, pageToken=None, **kwargs):
+        def run():
+            self.service._call('list')
+            name = re.search(r"name='([^']*)'", q)
+            parent = re.search(r"'([^']*)' in parents", q)
+            files = [
+                self.service._metadata(stored) for stored in self.service.files_by_id.values()
+                if (name is None or stored['name'] == name.group(1))
+                and (parent is None or parent.group(1) in stored.get('parents', []))
+                and ("mimeType='application/vnd.google-apps.folder'" not in q
+                     or stored.get('mimeType') == 'application/vnd.google-apps.folder')
+            ]
+            return {'files': files}
+        return _FakeRequest(run)
+
+    def get(self, fileId, fields=None, **kwargs):
+        def run():
+            self.service._call('get')
+            return self.service._metadata(self.service._get(fileId))
+        return _FakeRequest(run)
+
+    def get_media(self, fileId, **kwargs):
+        self.service._get(fileId)
+        return _FakeMediaRequest(self.service, fileId)
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        def run():
+            size = media_body.size() if media_body is not None else 0
+            self.service._call('create', size)
+            file_id = f"fake{next(self.service._ids)}"
+            stored = {'id': file_id, 'name': body['name'], 'parents': body.get('parents', ['root'])}
+            if 'mimeType' in body:
+                stored['mimeType'] = body['mimeType']
+            self.service._write(stored, media_body)
+            self.service.files_by_id[file_id] = stored
+            return self.service._metadata(stored)
+        return _FakeRequest(run)
+
+    def update(self, fileId, media_body=None, fields=None, **kwargs):
+        def run():
+            size = media_body.size() if media_body is not None else 0
+            self.service._call('update', size)
+            stored = self.service._get(fileId)
+            self.service._write(stored, media_body)
+            return self.service._metadata(stored)
+        return _FakeRequest(run)
+
+    def delete(self, fileId, **kwargs):
+        def run():
+            self.service._call('delete')
+            self.service._get(fileId)
+            del self.service.files_by_id[fileId]
+        return _FakeRequest(run)
+
+
+class FakeDriveClient:
+    """Cliente con la interfaz de app.drive_client.DriveClient sobre FakeDriveService"""
+
+    def __init__(self, service=None, **kwargs):
+        self.service = service or FakeDriveService(**kwargs)
+        self.credentials = None
+
+    def request_stats(self):
+        counters = self.service.counters()
+        return {
+            'requests': sum(counters['calls'].values()),
+            'failed': sum(counters['failures'].values()),
+        }
@@ -0,0 +1,78 @@
+"""Libros de cuentas sintéticos para las pruebas de rendimiento."""
+import numpy as np
+import pandas as pd
+from app.financial import FinancialManager
+from app.storage import TRANSACTION_COLUMNS
+
+# Peso de cada categoría e importe típico (media, desviación) en euros
+INCOME_PROFILE = {
+    "Cuota de socios": (0.70, 30, 8),
+    "Subvención": (0.03, 1500, 600),
+    "Donación": (0.10, 60, 40),
+    "Venta de Lotería": (0.12, 20, 5),
+    "Otros": (0.05, 80, 50),
+}
+EXPENSE_PROFILE = {
+    "Donaciones": (0.15, 150, 80),
+    "Verbena": (0.25, 300, 150),
+    "Charlas y talleres": (0.35, 200, 90),
+    "Cesiones al Colegio": (0.10, 800, 400),
+    "Otros": (0.15, 60, 40),
+}
+DESCRIPTIONS = {
+    "Cuota de socios": ["Cuota socio familia {name}", "Cuota anual {name}", "Recibo cuota {name}"],
+    "Subvención": ["Subvención Ayuntamiento", "Subvención Consejería de Educación"],
+    "Donación": ["Donación familia {name}", "Donación anónima"],
+    "Venta de Lotería": ["Venta lotería Navidad {name}", "Lotería del Niño {name}"],
+    "Donaciones": ["Donación ONG {name}", "Donación banco de alimentos"],
+    "Verbena": ["Verbena fin de curso: sonido", "Verbena: bebidas", "Verbena: hinchables"],
+    "Charlas y talleres": ["Taller de robótica", "Charla sobre redes sociales", "Taller de teatro {name}"],
+    "Cesiones al Colegio": ["Material deportivo", "Libros para la biblioteca", "Pizarras digitales"],
+    "Otros": ["Comisión bancaria", "Material de oficina", "Gastos varios {name}"],
+}
+SURNAMES = ["García", "Martínez", "López", "Sánchez", "Pérez", "Gómez", "Martín", "Jiménez",
+            "Ruiz", "Hernández", "Díaz", "Moreno", "Muñoz", "Álvarez", "Romero", "Navarro"]
+INCOME_SHARE = 0.75
+
+
+def _profile(categories, profile):
+    # Solo las categorías que existen en la aplicación
+    weights = np.array([profile[category][0] for category in categories])
+    return weights / weights.sum()
+
+
+def generate_ledger(rows, seed=0, start='2015-09-01', years=10):
+    """Libro de `rows` movimientos repartidos en `years` cursos, ordenado por fecha"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.integers(0, 365 * years, rows)), unit='D')
+    is_income = rng.random(rows) < INCOME_SHARE
+
+    categories = np.empty(rows, dtype=object)
+    amounts = np.empty(rows)
+    for mask, names, profile in (
+        (is_income, FinancialManager.INCOME_CATEGORIES, INCOME_PROFILE),
+        (~is_income, FinancialManager.EXPENSE_CATEGORIES, EXPENSE_PROFILE),
+    ):
+        count = int(mask.sum())
+        chosen = rng.choice(len(names), count, p=_profile(names, profile))
+        categories[mask] = np.array(names, dtype=object)[chosen]
+        means = np.array([profile[name][1] for name in names])[chosen]
+        deviations = np.array([profile[name][2] for name in names])[chosen]
+        amounts[mask] = np.maximum(1, rng.normal(means, deviations)).round(2)
+
+    # Conceptos: una plantilla de la categoría con un apellido al azar
+    surnames = np.array(SURNAMES, dtype=object)[rng.integers(0, len(SURNAMES), rows)]
+    template_choice = rng.integers(0, 3, rows)
+    descriptions = [
+        DESCRIPTIONS[category][choice % len(DESCRIPTIONS[category])].format(name=surname)
+        for category, choice, surname in zip(categories, template_choice, surnames)
+    ]
+
+    ledger = pd.DataFrame({
+        'date': dates.strftime('%Y-%m-%d'),
+        'type': np.where(is_income, 'income', 'expense'),
+        'category': categories,
+        'amount': amounts,
+        'description': descriptions,
+    })
+    return ledger[TRANSACTION_COLUMNS]
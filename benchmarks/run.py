@@ -0,0 +1,240 @@
+"""Pruebas de rendimiento de la aplicación, sin conexión.
+
+Genera libros sintéticos de varios tamaños, los deja en un Drive simulado
+en memoria (benchmarks.fake_drive) y mide las operaciones de
+FinancialManager, DriveManager, PDFGenerator y BackupManager. Cada tamaño
+se ejecuta en un directorio temporal propio.
+
+    python -m benchmarks.run --sizes 1000 10000 100000 --output resultados.json
+    python -m benchmarks.run --latency 0.05 --failure-rate 0.1
+    python -m benchmarks.run --compare resultados.json
+
+El resultado es un JSON con una entrada por tamaño y operación (tiempos
+mínimo, mediano y máximo, llamadas a Drive y bytes transferidos).
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from benchmarks.fake_drive import FakeDriveClient, FakeDriveService
+from benchmarks.ledger import generate_ledger
+from app.backup_manager import BackupManager
+from app.drive_manager import DriveManager
+from app.financial import FinancialManager
+from app.ledger_cache import LedgerCache
+from app.metrics import get_metrics
+from app.pdf_generator import PDFGenerator
+from app.report_cache import ReportCache
+from app.storage import (
+    LEDGER_FILES, STORAGE_MODES, create_storage, is_sqlite_file, remove_sqlite_file
+)
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Por encima de este tamaño el PDF tarda minutos; se omite salvo que se pida
+PDF_MAX_ROWS = 50000
+
+
+class BenchmarkRun:
+    """Mide las operaciones sobre un libro de `size` movimientos"""
+
+    def __init__(self, size, args):
+        self.size = size
+        self.args = args
+        self.results = []
+        self.service = FakeDriveService(
+            latency=args.latency, bandwidth=args.bandwidth,
+            failure_rate=args.failure_rate, seed=args.seed
+        )
+        self.drive_manager = DriveManager(
+            write_behind=not args.no_write_behind, client=FakeDriveClient(self.service)
+        )
+        self.ledger_cache = LedgerCache()
+        self.report_cache = ReportCache(os.path.join('data', '.report_cache'))
+
+    def _financial_manager(self, ledger_cache=None):
+        return FinancialManager(
+            self.drive_manager,
+            ledger_cache=ledger_cache or self.ledger_cache,
+            storage=create_storage(self.drive_manager, self.args.storage, self.args.format),
+            report_cache=self.report_cache,
+        )
+
+    def measure(self, operation, action, repeat=None, setup=None):
+        """Ejecuta `action` varias veces y guarda tiempos y tráfico con Drive"""
+        timings = []
+        self.service.reset_counters()
+        result = None
+        for _ in range(repeat or self.args.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = action()
+            timings.append(time.perf_counter() - start)
+        counters = self.service.counters()
+        entry = {
+            'size': self.size,
+            'operation': operation,
+            'repeat': len(timings),
+            'min_s': round(min(timings), 6),
+            'median_s': round(statistics.median(timings), 6),
+            'max_s': round(max(timings), 6),
+            'drive_calls': counters['calls'],
+            'drive_failures': counters['failures'],
+            'bytes_uploaded': counters['bytes_uploaded'],
+            'bytes_downloaded': counters['bytes_downloaded'],
+        }
+        self.results.append(entry)
+        print(f"{self.size:>9} {operation:<20} {entry['median_s'] * 1000:>11.2f} ms "
+              f"{sum(counters['calls'].values()):>6} llamadas", file=sys.stderr)
+        return result
+
+    def _drop_local_copies(self):
+        """Borra las copias locales para que la carga tenga que descargar de Drive"""
+        for file_name in LEDGER_FILES:
+            if is_sqlite_file(file_name):
+                remove_sqlite_file(os.path.join('data', file_name))
+                continue
+            for path in (os.path.join('data', file_name), os.path.join('data', f".{file_name}.sync.json")):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def prepare(self):
+        ledger = generate_ledger(self.size, seed=self.args.seed)
+        storage = create_storage(self.drive_manager, self.args.storage, self.args.format)
+        # Se guarda con la aplicación (así el formato es el real) y se sube a Drive
+        storage.save(ledger, 1000.0)
+        if self.drive_manager.upload_queue is not None:
+            self.drive_manager.upload_queue.flush()
+        self.drive_manager.warm_file_cache()
+
+    def run(self):
+        self.prepare()
+        dm = self.drive_manager
+
+        self.measure('load_cold', lambda: self._financial_manager(LedgerCache()),
+                     setup=self._drop_local_copies)
+        self.measure('load_local_current', lambda: self._financial_manager(LedgerCache()))
+        fm = self._financial_manager()
+        self.measure('load_cached', self._financial_manager)
+
+        self.measure('balance', fm.get_balance)
+        self.measure('filter_by_date', lambda: fm.get_transactions_between('2018-01-01', '2018-12-31'))
+        self.measure('search_first', lambda: fm.search_transactions('lotería navidad'), repeat=1)
+        self.measure('search', lambda: fm.search_transactions('lotería navidad'))
+        page_query = lambda offset: fm.query_transactions(
+            'lotería', sort='amount', descending=True, offset=offset, limit=50)
+        self.measure('query_first', lambda: page_query(0), repeat=1)
+        self.measure('query_page', lambda: page_query(50))
+        self.measure('summary_chart', fm.create_summary_chart, repeat=1)
+
+        middle = len(fm.transactions) // 2
+        self.measure('add', lambda: fm.add_transaction(
+            'income', 'Donación', 25.0, 'Donación benchmark', '2020-05-05'))
+        self.measure('edit', lambda: fm.update_transaction(
+            middle, 'expense', 'Verbena', 99.5, 'Verbena benchmark', '2020-06-20'))
+        self.measure('delete', lambda: fm.delete_transaction(len(fm.transactions) - 1))
+        if dm.upload_queue is not None:
+            self.measure('sync_uploads', dm.upload_queue.flush, repeat=1)
+
+        if self.size <= self.args.pdf_max_rows:
+            pdf_path = os.path.join('data', 'benchmark.pdf')
+            self.measure('pdf_report', lambda: PDFGenerator().generate_report(
+                fm.transactions, fm.initial_balance, fm.get_balance(), output=pdf_path), repeat=1)
+
+        backup_manager = BackupManager(dm)
+        self.measure('backup_full', backup_manager.create_backup, repeat=1)
+        self.measure('backup_unchanged', backup_manager.create_backup)
+        self.measure('backup_incremental', backup_manager.create_backup, setup=lambda: fm.add_transaction(
+            'income', 'Cuota de socios', 30.0, 'Cuota benchmark', '2021-01-10'))
+        return self.results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, file=sys.stderr):
+    """Imprime la relación entre las medianas de dos ejecuciones"""
+    previous = {(entry['size'], entry['operation']): entry for entry in baseline['results']}
+    print(f"{'tamaño':>9} {'operación':<20} {'antes (ms)':>11} {'ahora (ms)':>11} {'relación':>9}", file=file)
+    for entry in current['results']:
+        before = previous.get((entry['size'], entry['operation']))
+        if before is None:
+            continue
+        ratio = entry['median_s'] / before['median_s'] if before['median_s'] else float('inf')
+        print(f"{entry['size']:>9} {entry['operation']:<20} {before['median_s'] * 1000:>11.2f} "
+              f"{entry['median_s'] * 1000:>11.2f} {ratio:>8.2f}x", file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento sin conexión")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Número de movimientos de cada libro (hasta 1000000)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help="Segundos por llamada a Drive")
+    parser.add_argument('--bandwidth', type=float, default=None, help="Bytes por segundo de Drive")
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help="Probabilidad de que una llamada a Drive falle (503/429)")
+    parser.add_argument('--storage', choices=sorted(STORAGE_MODES), default='snapshot')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--no-write-behind', action='store_true',
+                        help="Subir a Drive dentro de cada operación en lugar de en segundo plano")
+    parser.add_argument('--pdf-max-rows', type=int, default=PDF_MAX_ROWS)
+    parser.add_argument('--output', help="Fichero JSON de resultados (por defecto, la salida estándar)")
+    parser.add_argument('--compare', help="Resultados anteriores con los que comparar")
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': [],
+        'app_metrics': {},
+    }
+
+    metrics = get_metrics()
+    cwd = os.getcwd()
+    # Los mensajes de la aplicación van a stderr para no mezclarse con el JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        for size in args.sizes:
+            workdir = tempfile.mkdtemp(prefix='ampa-bench-')
+            os.chdir(workdir)
+            metrics.reset()
+            try:
+                report['results'].extend(BenchmarkRun(size, args).run())
+                report['app_metrics'][str(size)] = metrics.snapshot()
+            finally:
+                os.chdir(cwd)
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=1, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
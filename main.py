@@ -1,30 +1,80 @@
 import streamlit as st
+from app.startup_profile import get_import_profiler
+
+# Se instala antes que el resto de importaciones para medirlas todas
+import_profiler = get_import_profiler()
+
 from app.auth import init_auth, login, logout
-from app.drive_manager import DriveManager
-from app.financial import FinancialManager
-from app.pdf_generator import PDFGenerator
-from app.backup_manager import BackupManager
-from datetime import datetime
+from app.metrics import get_metrics
+from datetime import datetime, timedelta
 import io
+import pandas as pd
 
 # Initialize session state
 init_auth()
 
+
+# Los gestores se crean una vez por proceso y se comparten entre sesiones y
+# reejecuciones; el libro de cuentas vive en la caché de app.ledger_cache.
+# Sus módulos (cliente de Drive, reportlab...) se importan al crearlos, así
+# que la pantalla de acceso no los carga
+@st.cache_resource
+def get_drive_manager():
+    from app.drive_manager import DriveManager
+    return DriveManager()
+
+
+@st.cache_resource
+def get_pdf_generator():
+    from app.pdf_generator import PDFGenerator
+    return PDFGenerator()
+
+
+@st.cache_resource
+def get_backup_manager():
+    from app.backup_manager import BackupManager
+    return BackupManager(get_drive_manager())
+
+
+@st.cache_resource
+def get_backup_scheduler():
+    from app.backup_scheduler import BackupScheduler
+    backup_manager = get_backup_manager()
+    scheduler = BackupScheduler(
+        backup_manager, str(backup_manager.local_backup_path / 'scheduler.json')
+    )
+    scheduler.start()
+    return scheduler
+
+
 # Main application
 if not st.session_state.authenticated:
     login()
 else:
     st.set_page_config(page_title="AMPA Sagrada Familia - Contabilidad", layout="wide")
 
+    from app.concurrency import LedgerConflict
+    from app.financial import FinancialManager
+    from app.restore import PointInTimeRestore
+
     # Initialize managers
-    drive_manager = DriveManager()
+    drive_manager = get_drive_manager()
     financial_manager = FinancialManager(drive_manager)
-    pdf_generator = PDFGenerator()
-    backup_manager = BackupManager(drive_manager)
+    backup_manager = get_backup_manager()
+    backup_scheduler = get_backup_scheduler()
+    point_in_time = PointInTimeRestore(backup_manager)
 
     # Show storage status
     if drive_manager.service:
         st.sidebar.success("✅ Conectado a Google Drive")
+        sync_status = drive_manager.sync_status()
+        if sync_status:
+            if sync_status['pending']:
+                st.sidebar.info(f"⏳ Sincronización pendiente: {sync_status['pending']} archivo(s)")
+            if sync_status['failed']:
+                st.sidebar.error(f"❌ No se pudo sincronizar: {', '.join(sync_status['failed'])}")
+            elif sync_status['last_sync']:
+                st.sidebar.caption(f"Última sincronización: {sync_status['last_sync'].strftime('%H:%M:%S')}")
     else:
         st.sidebar.warning("⚠️ Usando almacenamiento local (sin conexión a Google Drive)")
 
@@ -32,7 +82,7 @@ else:
     st.sidebar.image("attached_assets/LogoAMPA.png", width=200)
     selected_option = st.sidebar.selectbox(
         "Menú",
-        ["Inicio", "Registrar Movimiento", "Buscar Movimientos", "Generar Informe", "Configuración"]
+        ["Inicio", "Registrar Movimiento", "Importar Movimientos", "Buscar Movimientos", "Generar Informe", "Configuración"]
     )
 
     if st.sidebar.button("Cerrar Sesión"):
@@ -50,6 +100,7 @@ else:
             st.metric("Número de Transacciones", len(financial_manager.transactions))
 
         st.plotly_chart(financial_manager.create_summary_chart(), use_container_width=True)
+        st.plotly_chart(financial_manager.create_monthly_chart(), use_container_width=True)
 
     elif selected_option == "Registrar Movimiento":
         st.title("Registrar Movimiento")
@@ -81,6 +132,38 @@ else:
             )
             st.success("Movimiento registrado correctamente")
 
+    elif selected_option == "Importar Movimientos":
+        st.title("Importar Movimientos")
+        st.write("Sube un extracto bancario en CSV o en formato Norma 43 (AEB43).")
+
+        uploaded_file = st.file_uploader("Extracto bancario", type=['csv', 'txt', 'n43', 'aeb', 'q43'])
+
+        if uploaded_file is not None:
+            from app.bank_import import parse_statement
+            try:
+                batch = parse_statement(uploaded_file.getvalue(), uploaded_file.name)
+            except Exception as e:
+                st.error(f"No se pudo leer el extracto: {str(e)}")
+                batch = None
+
+            if batch is not None and batch.empty:
+                st.warning("El extracto no contiene movimientos")
+            elif batch is not None:
+                duplicates = financial_manager.find_duplicates(batch)
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("Movimientos nuevos", int((~duplicates).sum()))
+                with col2:
+                    st.metric("Ya registrados", int(duplicates.sum()))
+
+                preview = batch.assign(ya_registrado=duplicates)
+                st.dataframe(preview, use_container_width=True)
+
+                if st.button("Importar movimientos nuevos", disabled=bool(duplicates.all())):
+                    with st.spinner("Importando movimientos..."):
+                        added, skipped = financial_manager.add_transactions(batch)
+                    st.success(f"Se han importado {added} movimientos ({skipped} omitidos por estar ya registrados)")
+
     elif selected_option == "Buscar Movimientos":
         st.title("Buscar Movimientos")
 
@@ -96,44 +179,68 @@ else:
         if use_date_filter:
             date_col1, date_col2 = st.columns(2)
             with date_col1:
-                start_date = st.date_input("Fecha inicial", datetime.now() - datetime.timedelta(days=30))
+                start_date = st.date_input("Fecha inicial", datetime.now() - timedelta(days=30))
             with date_col2:
                 end_date = st.date_input("Fecha final", datetime.now())
                 
-        # Aplicar filtros
-        filtered_data = financial_manager.transactions
-        
-        if search_term:
-            filtered_data = filtered_data[
-                filtered_data['description'].str.contains(search_term, case=False)
-            ]
-            
-        if use_date_filter:
-            filtered_data = filtered_data[
-                (filtered_data['date'] >= start_date.strftime('%Y-%m-%d')) & 
-                (filtered_data['date'] <= end_date.strftime('%Y-%m-%d'))
-            ]
+        sort_options = {
+            'date': "Fecha",
+            'amount': "Cantidad",
+            'category': "Categoría",
+            'type': "Tipo",
+            'description': "Descripción",
+        }
+        sort_col1, sort_col2, sort_col3 = st.columns(3)
+        with sort_col1:
+            sort_key = st.selectbox("Ordenar por", list(sort_options), format_func=sort_options.get,
+                                    key='search_sort')
+        with sort_col2:
+            sort_descending = st.radio("Orden", ["Descendente", "Ascendente"], horizontal=True,
+                                       key='search_order') == "Descendente"
+        with sort_col3:
+            page_size = st.selectbox("Movimientos por página", [25, 50, 100], key='search_page_size')
+
+        # Aplicar filtros: el rango de fechas usa el índice ordenado del libro
+        # y el texto el índice de palabras (sin mayúsculas ni acentos). Solo
+        # se envía al navegador la página visible.
+        query = {
+            'term': search_term,
+            'start_date': start_date.strftime('%Y-%m-%d') if use_date_filter else None,
+            'end_date': end_date.strftime('%Y-%m-%d') if use_date_filter else None,
+            'sort': sort_key,
+            'descending': sort_descending,
+        }
+        _, total_results = financial_manager.query_transactions(**query, limit=0)
+        page_count = max(1, -(-total_results // page_size))
+        search_page = st.number_input("Página", min_value=1, max_value=page_count, value=1,
+                                      key='search_page') if page_count > 1 else 1
+        page_data, _ = financial_manager.query_transactions(
+            **query, offset=(search_page - 1) * page_size, limit=page_size
+        )
             
         # Mostrar datos con formato
-        if not filtered_data.empty:
-            # Agregar una columna de índices para seleccionar transacciones
-            filtered_data_with_index = filtered_data.reset_index().rename(columns={'index': 'original_index'})
-            selected_row = st.dataframe(filtered_data_with_index.sort_values(by='date', ascending=False))
+        if not page_data.empty:
+            st.caption(f"{total_results} movimientos · página {search_page} de {page_count}")
+            # El índice es la posición en el libro: el ID del movimiento
+            st.dataframe(page_data.rename_axis('ID'))
             
             # Opciones para editar o eliminar
             st.subheader("Editar o Eliminar Movimiento")
             
             col1, col2 = st.columns(2)
             with col1:
-                selected_index = st.number_input("ID del movimiento a modificar", 
-                                               min_value=-1, 
-                                               max_value=len(financial_manager.transactions)-1, 
-                                               value=-1,
-                                               step=1)
+                selected_index = st.selectbox(
+                    "Movimiento a modificar",
+                    [-1] + page_data.index.tolist(),
+                    format_func=lambda position: "—" if position < 0 else (
+                        f"{position} · {page_data.at[position, 'date']} · "
+                        f"{page_data.at[position, 'description']}"
+                    )
+                )
             
             if selected_index >= 0:
-                # Mostrar formulario de edición
-                trans = financial_manager.transactions.iloc[selected_index]
+                # Mostrar formulario de edición con la fila de la página
+                trans = page_data.loc[selected_index]
                 
                 transaction_type = st.radio("Tipo de Movimiento", 
                                           ["Ingreso", "Gasto"], 
@@ -175,28 +282,36 @@ else:
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("Actualizar Movimiento"):
-                        success = financial_manager.update_transaction(
-                            selected_index,
-                            'income' if transaction_type == "Ingreso" else 'expense',
-                            category,
-                            amount,
-                            description,
-                            transaction_date.strftime('%Y-%m-%d')
-                        )
+                        try:
+                            success = financial_manager.update_transaction(
+                                selected_index,
+                                'income' if transaction_type == "Ingreso" else 'expense',
+                                category,
+                                amount,
+                                description,
+                                transaction_date.strftime('%Y-%m-%d')
+                            )
+                        except LedgerConflict as e:
+                            st.error(f"{e}. Revisa el movimiento y vuelve a intentarlo.")
+                            success = None
                         if success:
                             st.success("Movimiento actualizado correctamente")
                             st.rerun()
-                        else:
+                        elif success is False:
                             st.error("Error al actualizar el movimiento")
                 
                 with col2:
                     if st.button("Eliminar Movimiento", type="primary", help="Esta acción no se puede deshacer"):
                         if st.warning("¿Estás seguro de que deseas eliminar este movimiento? Esta acción no se puede deshacer."):
-                            success = financial_manager.delete_transaction(selected_index)
+                            try:
+                                success = financial_manager.delete_transaction(selected_index)
+                            except LedgerConflict as e:
+                                st.error(f"{e}. Revisa el movimiento y vuelve a intentarlo.")
+                                success = None
                             if success:
                                 st.success("Movimiento eliminado correctamente")
                                 st.rerun()
-                            else:
+                            elif success is False:
                                 st.error("Error al eliminar el movimiento")
             else:
                 st.info("Selecciona un ID de movimiento para editar o eliminar")
@@ -233,13 +348,31 @@ else:
                 start_date_str = None
                 end_date_str = None
                 
-            pdf_buffer = pdf_generator.generate_report(
-                financial_manager.transactions,
-                financial_manager.initial_balance,
-                financial_manager.get_balance(),
-                start_date_str,
-                end_date_str
+            def render_report(path):
+                pdf_generator = get_pdf_generator()
+                progress_bar = st.progress(0.0, text="Generando informe...")
+                pdf_generator.generate_report(
+                    financial_manager.get_transactions_between(start_date_str, end_date_str),
+                    financial_manager.initial_balance,
+                    financial_manager.get_balance(),
+                    start_date_str,
+                    end_date_str,
+                    output=path,
+                    filtered=True,
+                    progress=lambda done, total: progress_bar.progress(
+                        done / total, text=f"Generando informe... {done}/{total} movimientos"
+                    )
+                )
+                progress_bar.empty()
+
+            # Si el libro y el rango no han cambiado se reutiliza el informe ya generado
+            report_key = financial_manager.report_cache.key(
+                financial_manager.ledger_version, start_date_str, end_date_str,
+                include_all, datetime.now().strftime('%Y-%m-%d')
             )
+            report_path = financial_manager.report_cache.get_or_create(report_key, render_report)
+            with open(report_path, 'rb') as report_file:
+                report_data = report_file.read()
 
             report_filename = f"informe_ampa_{datetime.now().strftime('%Y%m%d')}"
             if not include_all:
@@ -247,7 +380,7 @@ else:
                 
             st.download_button(
                 label="Descargar Informe",
-                data=pdf_buffer.getvalue(),
+                data=report_data,
                 file_name=f"{report_filename}.pdf",
                 mime="application/pdf"
             )
@@ -256,7 +389,7 @@ else:
         st.title("Configuración")
 
         # Pestañas de configuración
-        tab1, tab2, tab3 = st.tabs(["Google Drive", "Saldo Inicial", "Copias de Seguridad"])
+        tab1, tab2, tab3, tab4 = st.tabs(["Google Drive", "Saldo Inicial", "Copias de Seguridad", "Diagnósticos"])
 
         with tab1:
             st.subheader("Conexión a Google Drive")
@@ -268,6 +401,15 @@ else:
                 # Mostrar ID de la carpeta actual
                 st.info(f"ID de carpeta utilizado actualmente: {drive_manager.shared_folder_id}")
 
+                # Peticiones a Drive desde que arrancó la aplicación
+                request_stats = drive_manager.request_stats()
+                if request_stats:
+                    stats_col1, stats_col2, stats_col3, stats_col4 = st.columns(4)
+                    stats_col1.metric("Peticiones", request_stats['requests'])
+                    stats_col2.metric("Reintentos", request_stats['retries'])
+                    stats_col3.metric("Límite de uso (429)", request_stats['rate_limited'])
+                    stats_col4.metric("Errores", request_stats['failed'])
+
                 # Botón para mostrar carpetas disponibles
                 if st.button("Explorar carpetas disponibles"):
                     folders = drive_manager.list_available_folders()
@@ -303,62 +445,220 @@ else:
         with tab3:
             st.subheader("Copias de Seguridad")
 
-            # Crear backup manual
+            # Crear backup manual: se hace en segundo plano, como las automáticas
             if st.button("Crear Copia de Seguridad"):
-                with st.spinner("Creando copia de seguridad..."):
-                    backup_result = backup_manager.create_backup()
-                    if backup_result['status'] == 'success':
-                        st.success("Copia de seguridad creada correctamente")
-                        for file_info in backup_result['files']:
-                            if file_info['drive_sync']:
-                                st.info(f"✅ {file_info['name']}: Guardado en local y Google Drive")
-                            else:
-                                st.warning(f"⚠️ {file_info['name']}: Guardado solo localmente")
-                    else:
-                        st.error(f"Error al crear la copia de seguridad: {backup_result.get('error', 'Error desconocido')}")
+                if backup_scheduler.run_now():
+                    st.info("Copia de seguridad en curso. El resultado aparecerá en el historial.")
+                else:
+                    st.warning("Ya se está haciendo otra copia de seguridad. Inténtalo cuando termine.")
+
+            scheduler_status = backup_scheduler.status()
+            if scheduler_status['running']:
+                st.caption("⏳ Se está creando una copia de seguridad...")
+            elif scheduler_status['skipped']:
+                st.warning(f"La copia pedida a las {scheduler_status['skipped'][11:]} no se hizo: "
+                           "otro proceso estaba haciendo una copia de seguridad")
+            last_job = scheduler_status['history'][0] if scheduler_status['history'] else None
+            if last_job:
+                if last_job['status'] != 'success':
+                    st.error(f"Error en la última copia de seguridad ({last_job['started_at']}): "
+                             f"{last_job.get('error') or 'Error desconocido'}")
+                elif last_job['unchanged']:
+                    st.info(f"Última copia ({last_job['started_at']}): los datos no habían cambiado")
+                elif last_job['drive_errors']:
+                    st.warning(f"Última copia ({last_job['started_at']}) guardada solo localmente: "
+                               f"{', '.join(last_job['drive_errors'])} no se subieron a Google Drive")
+                else:
+                    st.success(f"Última copia ({last_job['started_at']}): "
+                               f"{', '.join(last_job['changed_files'])}")
 
             # Listar backups existentes
             st.subheader("Copias de Seguridad Disponibles")
-            backups = backup_manager.list_backups()
+            filter_col1, filter_col2, filter_col3 = st.columns(3)
+            with filter_col1:
+                backup_file_filter = st.text_input("Archivo", key='backup_file_filter')
+            with filter_col2:
+                drive_states = {
+                    None: "Todas",
+                    'synced': "Subidas a Drive",
+                    'failed': "Con errores de subida",
+                    'local': "Solo locales",
+                }
+                backup_drive_filter = st.selectbox("Estado en Drive", list(drive_states),
+                                                   format_func=drive_states.get, key='backup_drive_filter')
+            with filter_col3:
+                backup_dates = st.date_input("Fechas", [], key='backup_date_filter', format="DD/MM/YYYY")
+
+            backup_start = backup_dates[0].isoformat() if len(backup_dates) > 0 else None
+            backup_end = backup_dates[-1].isoformat() if len(backup_dates) > 0 else None
+            page_size = 10
+            _, backup_total = backup_manager.list_backups(
+                limit=0, start_date=backup_start, end_date=backup_end,
+                file_name=backup_file_filter, drive_state=backup_drive_filter
+            )
+            page_count = max(1, -(-backup_total // page_size))
+            backup_page = st.number_input("Página", min_value=1, max_value=page_count, value=1,
+                                          key='backup_page') if page_count > 1 else 1
+            backups, _ = backup_manager.list_backups(
+                offset=(backup_page - 1) * page_size, limit=page_size,
+                start_date=backup_start, end_date=backup_end,
+                file_name=backup_file_filter, drive_state=backup_drive_filter
+            )
 
             if backups:
-                for backup in backups:
-                    col1, col2, col3 = st.columns([2,2,1])
-                    with col1:
-                        st.text(backup['filename'])
-                    with col2:
-                        st.text(backup['date'].strftime('%d/%m/%Y %H:%M:%S'))
-                    with col3:
-                        if st.button("Restaurar", key=backup['filename']):
-                           # Mostrar un mensaje de advertencia
-                           st.warning("¿Está seguro de que desea restaurar esta copia de seguridad? Los datos actuales serán reemplazados.")
-    
-                            # Usar un checkbox para confirmar la acción
-                           if st.checkbox("Sí, estoy seguro de que quiero restaurar esta copia de seguridad.", key=f"confirm_{backup['filename']}"):
-                               try:
-                                   # Ejecutar la restauración
-                                   backup_manager.restore_backup(backup['filename'])
-                                   st.success("Copia de seguridad restaurada correctamente")
-                                   st.rerun()
-                               except Exception as e:
-                                   st.error(f"Error al restaurar: {str(e)}")
-                           else:
-                              st.warning("Debes confirmar la acción para continuar.")
+                drive_labels = {True: "✅", False: "⚠️", None: "—"}
+                st.caption(f"{backup_total} copias · página {backup_page} de {page_count}")
+                st.dataframe(pd.DataFrame([{
+                    'Copia': backup['filename'],
+                    'Fecha': backup['date'].strftime('%d/%m/%Y %H:%M:%S'),
+                    'Archivos': ', '.join(backup['files']),
+                    'Tamaño (KB)': round(backup['size'] / 1024, 1),
+                    'Drive': drive_labels[backup['drive_sync']],
+                } for backup in backups]), hide_index=True, use_container_width=True)
+
+                selected_backup = st.selectbox("Copia a restaurar", [backup['filename'] for backup in backups])
+                confirm_restore = st.checkbox(
+                    "Sí, estoy seguro de que quiero restaurar esta copia de seguridad. "
+                    "Los datos actuales serán reemplazados.",
+                    key='confirm_backup_restore'
+                )
+                if st.button("Restaurar", disabled=not confirm_restore):
+                    try:
+                        backup_manager.restore_backup(selected_backup, financial_manager)
+                        st.success("Copia de seguridad restaurada correctamente")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Error al restaurar: {str(e)}")
             else:
               st.info("No hay copias de seguridad disponibles")
 
+            # Restauración a un momento concreto: copia + cambios del diario
+            st.subheader("Restaurar el Libro a una Fecha")
+            restore_col1, restore_col2 = st.columns(2)
+            with restore_col1:
+                restore_date = st.date_input("Fecha", datetime.now(), key='restore_date', format="DD/MM/YYYY")
+            with restore_col2:
+                restore_time = st.time_input("Hora", datetime.now().time().replace(second=0, microsecond=0),
+                                             key='restore_time')
+            restore_target = datetime.combine(restore_date, restore_time).replace(second=59)
+
+            if st.button("Previsualizar restauración"):
+                try:
+                    st.session_state.restore_preview = point_in_time.preview(restore_target, financial_manager)
+                except ValueError as e:
+                    st.session_state.pop('restore_preview', None)
+                    st.error(str(e))
+
+            restore_preview = st.session_state.get('restore_preview')
+            if restore_preview is not None:
+                st.write(
+                    f"Copia del {restore_preview['snapshot_date'].strftime('%d/%m/%Y %H:%M:%S')} "
+                    f"más {restore_preview['records']} cambio(s) del diario: "
+                    f"{len(restore_preview['transactions'])} movimientos, "
+                    f"saldo inicial €{restore_preview['initial_balance']:.2f} "
+                    f"(ahora €{restore_preview['current_balance']:.2f})"
+                )
+                if not restore_preview['exact']:
+                    st.warning(
+                        "No hay registro de todos los cambios entre la copia y la fecha elegida: "
+                        "el libro volverá a como estaba el "
+                        f"{restore_preview['restored_at'].strftime('%d/%m/%Y %H:%M:%S')}, "
+                        "no a la fecha elegida."
+                    )
+                diff_col1, diff_col2 = st.columns(2)
+                with diff_col1:
+                    st.caption(f"Movimientos que se recuperan: {len(restore_preview['added'])}")
+                    st.dataframe(restore_preview['added'], hide_index=True)
+                with diff_col2:
+                    st.caption(f"Movimientos que se eliminan: {len(restore_preview['removed'])}")
+                    st.dataframe(restore_preview['removed'], hide_index=True)
+
+                if st.checkbox("Sí, quiero sustituir el libro actual por este estado", key='confirm_restore_point'):
+                    if st.button("Restaurar a esta fecha"):
+                        try:
+                            safety_backup = point_in_time.apply(restore_preview, financial_manager)
+                            st.session_state.pop('restore_preview', None)
+                            st.success(f"Libro restaurado. El estado anterior está en la copia {safety_backup}.")
+                        except Exception as e:
+                            st.error(f"Error al restaurar: {str(e)}")
+
             # Configuración de backup automático
             st.subheader("Configuración de Backup Automático")
-            if 'backup_interval' not in st.session_state:
-                st.session_state.backup_interval = 'daily'
-
+            backup_intervals = ['daily', 'weekly', 'monthly']
             backup_interval = st.radio(
                 "Frecuencia de copias de seguridad automáticas",
-                options=['daily', 'weekly', 'monthly'],
+                options=backup_intervals,
+                index=backup_intervals.index(backup_scheduler.interval),
                 format_func=lambda x: {
                     'daily': 'Diaria',
                     'weekly': 'Semanal',
                     'monthly': 'Mensual'
-                }[x],
-                key='backup_interval'
+                }[x]
             )
+            if backup_interval != backup_scheduler.interval:
+                backup_scheduler.set_interval(backup_interval)
+            next_backup = backup_scheduler.next_run()
+            if next_backup is not None:
+                st.caption(f"Próxima copia automática: {next_backup.strftime('%d/%m/%Y %H:%M')}")
+
+            if scheduler_status['history']:
+                with st.expander("Historial de copias de seguridad"):
+                    st.dataframe(pd.DataFrame(scheduler_status['history'])[
+                        ['started_at', 'trigger', 'status', 'duration', 'snapshot', 'unchanged', 'error']
+                    ], hide_index=True)
+
+        with tab4:
+            # Tiempos de las operaciones frecuentes desde que arrancó el proceso
+            st.subheader("Rendimiento")
+            metrics = get_metrics()
+            metrics_enabled = st.toggle("Medir tiempos y transferencias", value=metrics.enabled)
+            if metrics_enabled != metrics.enabled:
+                metrics.enabled = metrics_enabled
+
+            operations = metrics.snapshot()
+            if operations:
+                st.dataframe(pd.DataFrame.from_dict(operations, orient='index').rename(columns={
+                    'count': 'Llamadas',
+                    'errors': 'Errores',
+                    'p50_ms': 'p50 (ms)',
+                    'p95_ms': 'p95 (ms)',
+                    'max_ms': 'Máx. (ms)',
+                    'total_ms': 'Total (ms)',
+                    'bytes_in': 'Bytes recibidos',
+                    'bytes_out': 'Bytes enviados',
+                }), use_container_width=True)
+            else:
+                st.info("Todavía no hay mediciones")
+
+            # Contadores del cliente de Drive (reintentos, límites de uso...)
+            drive_counters = {f"drive_{name}_total": value
+                              for name, value in (drive_manager.request_stats() or {}).items()}
+            export_col1, export_col2, export_col3 = st.columns(3)
+            with export_col1:
+                st.download_button("Exportar JSON", metrics.to_json(drive_counters),
+                                   file_name="metricas.json", mime="application/json")
+            with export_col2:
+                st.download_button("Exportar Prometheus", metrics.to_prometheus(drive_counters),
+                                   file_name="metricas.prom", mime="text/plain")
+            with export_col3:
+                if st.button("Reiniciar mediciones"):
+                    metrics.reset()
+                    st.rerun()
+
+            # Importaciones del arranque del proceso: la pantalla de acceso y
+            # la primera ejecución con la sesión iniciada
+            st.subheader("Tiempo de Importación de Módulos")
+            import_report = import_profiler.report(min_ms=1)
+            st.caption(f"Total: {import_profiler.total_ms():.0f} ms en {len(import_profiler.records)} módulos")
+            if import_report:
+                st.dataframe(pd.DataFrame(import_report).rename(columns={
+                    'module': 'Módulo',
+                    'ms': 'Total (ms)',
+                    'self_ms': 'Propio (ms)',
+                    'at_s': 'Segundo',
+                    'depth': 'Nivel',
+                }), hide_index=True, use_container_width=True)
+
+    # El arranque ya ha importado lo principal: a partir de aquí las
+    # importaciones no pasan por el perfilador
+    import_profiler.uninstall()
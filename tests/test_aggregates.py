@@ -0,0 +1,92 @@
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from app.aggregates import LedgerAggregates
+from app.drive_manager import DriveManager
+from app.storage import TRANSACTION_COLUMNS, SQLiteStorage
+
+CATEGORIES = ["Cuota de socios", "Donación", "Verbena", "Otros", np.nan]
+
+
+def _random_row(rng):
+    amount = np.nan if rng.random() < 0.1 else round(rng.uniform(0, 500), 2)
+    return {
+        'date': f"20{rng.randint(20, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'type': rng.choice(['income', 'expense']),
+        'category': rng.choice(CATEGORIES),
+        'amount': amount,
+        'description': 'movimiento',
+    }
+
+
+def _assert_matches_recompute(aggregates, rows, initial_balance):
+    frame = pd.DataFrame(rows, columns=TRANSACTION_COLUMNS)
+    expected = LedgerAggregates.from_frame(frame)
+    assert aggregates.totals == expected.totals
+    assert aggregates.categories == expected.categories
+    assert aggregates.months == expected.months
+    assert aggregates.balance(initial_balance) == pytest.approx(expected.balance(initial_balance))
+    for transaction_type in LedgerAggregates.TYPES:
+        pd.testing.assert_series_equal(
+            aggregates.by_category(transaction_type), expected.by_category(transaction_type)
+        )
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_totals_match_full_recompute(seed):
+    rng = random.Random(seed)
+    rows = [_random_row(rng) for _ in range(50)]
+    aggregates = LedgerAggregates.from_frame(pd.DataFrame(rows, columns=TRANSACTION_COLUMNS))
+
+    for step in range(300):
+        operation = rng.choice(['add', 'update', 'delete']) if rows else 'add'
+        if operation == 'add':
+            row = _random_row(rng)
+            aggregates.add_row(row)
+            rows.append(row)
+        elif operation == 'update':
+            index = rng.randrange(len(rows))
+            row = _random_row(rng)
+            aggregates.remove_row(rows[index])
+            aggregates.add_row(row)
+            rows[index] = row
+        else:
+            index = rng.randrange(len(rows))
+            aggregates.remove_row(rows.pop(index))
+        if step % 10 == 0:
+            _assert_matches_recompute(aggregates, rows, 1000.0)
+    _assert_matches_recompute(aggregates, rows, 1000.0)
+
+
+def test_batch_add_matches_row_by_row():
+    rng = random.Random(42)
+    batch = pd.DataFrame([_random_row(rng) for _ in range(100)], columns=TRANSACTION_COLUMNS)
+    by_rows = LedgerAggregates()
+    for row in batch.to_dict('records'):
+        by_rows.add_row(row)
+    by_batch = LedgerAggregates()
+    by_batch.add_frame(batch)
+    assert by_rows.totals == by_batch.totals
+    assert by_rows.categories == by_batch.categories
+    assert by_rows.months == by_batch.months
+
+
+def test_sqlite_totals_only_for_the_stored_version(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    drive_manager = DriveManager(write_behind=False)
+    drive_manager.client = drive_manager.service = None
+    storage = SQLiteStorage(drive_manager)
+    transactions, initial_balance = storage.load()
+    rng = random.Random(0)
+    rows = [_random_row(rng) for _ in range(30)]
+    storage.save(transactions, initial_balance, [{'op': 'add', 'row': row} for row in rows])
+    version = storage.version()
+    frame = pd.DataFrame(rows, columns=TRANSACTION_COLUMNS)
+
+    _assert_matches_recompute(storage.aggregates(frame, version), rows, initial_balance)
+
+    # Otra sesión cambia un importe: el mismo número de filas, otra versión
+    storage.save(frame, initial_balance, [{'op': 'update', 'index': 0, 'old': rows[0],
+                                           'row': dict(rows[0], amount=99999.0)}])
+    _assert_matches_recompute(storage.aggregates(frame, version), rows, initial_balance)
@@ -0,0 +1,126 @@
+import pandas as pd
+import pytest
+from app.concurrency import LedgerConflict, rebase_changes
+from app.drive_manager import DriveManager
+from app.financial import FinancialManager
+from app.ledger_cache import LedgerCache
+from app.storage import TRANSACTION_COLUMNS
+
+
+def _row(description, amount=10.0):
+    return {
+        'date': '2024-01-01',
+        'type': 'income',
+        'category': 'Cuota de socios',
+        'amount': amount,
+        'description': description,
+    }
+
+
+def _frame(*rows):
+    return pd.DataFrame(list(rows), columns=TRANSACTION_COLUMNS)
+
+
+def _update(index, old, new):
+    return {'op': 'update', 'index': index, 'row': new, 'old': old}
+
+
+def _delete(index, old):
+    return {'op': 'delete', 'index': index, 'old': old}
+
+
+BASE = _frame(_row('x'), _row('cuota'), _row('y'), _row('cuota'))
+
+
+def test_adds_from_both_sessions_survive():
+    latest = pd.concat([BASE, _frame(_row('otra sesión'))], ignore_index=True)
+    frame, _, changes = rebase_changes(latest, 0.0, [{'op': 'add', 'row': _row('esta sesión')}], BASE)
+    assert frame['description'].tolist()[-2:] == ['otra sesión', 'esta sesión']
+    assert changes == [{'op': 'add', 'row': _row('esta sesión')}]
+
+
+def test_update_matches_same_occurrence_among_identical_rows():
+    # Otra sesión borró 'x': la segunda gemela pasa de la posición 3 a la 2
+    latest = BASE.drop(0).reset_index(drop=True)
+    frame, _, changes = rebase_changes(latest, 0.0, [_update(3, _row('cuota'), _row('cuota', 20.0))], BASE)
+    assert frame['amount'].tolist() == [10.0, 10.0, 20.0]
+    assert changes[0]['index'] == 2
+
+
+def test_changes_in_the_same_batch_use_the_session_positions():
+    changes = [{'op': 'add', 'row': _row('cuota')}, _delete(0, _row('x')),
+               _update(0, _row('cuota'), _row('cuota', 5.0))]
+    frame, _, rebased = rebase_changes(BASE, 0.0, changes, BASE)
+    assert frame['amount'].tolist() == [5.0, 10.0, 10.0, 10.0]
+    assert [change.get('index') for change in rebased] == [None, 0, 0]
+
+
+def test_stale_update_raises_conflict():
+    latest = BASE.copy()
+    latest.at[2, 'amount'] = 99.0
+    with pytest.raises(LedgerConflict):
+        rebase_changes(latest, 0.0, [_update(2, _row('y'), _row('y', 1.0))], BASE)
+
+
+def test_update_already_applied_by_other_session_is_skipped():
+    latest = BASE.copy()
+    latest.at[2, 'amount'] = 1.0
+    frame, _, changes = rebase_changes(latest, 0.0, [_update(2, _row('y'), _row('y', 1.0))], BASE)
+    assert changes == []
+    assert frame.equals(latest)
+
+
+def test_delete_of_missing_row_is_skipped():
+    latest = BASE.drop(0).reset_index(drop=True)
+    frame, _, changes = rebase_changes(latest, 0.0, [_delete(0, _row('x'))], BASE)
+    assert changes == []
+    assert len(frame) == 3
+
+
+@pytest.mark.parametrize('change', [
+    _update(3, _row('cuota'), _row('cuota', 20.0)),
+    _delete(3, _row('cuota')),
+])
+def test_changed_number_of_identical_rows_is_ambiguous(change):
+    # Otra sesión borró una de las dos gemelas: no se sabe cuál era
+    latest = BASE.drop(1).reset_index(drop=True)
+    with pytest.raises(LedgerConflict):
+        rebase_changes(latest, 0.0, [change], BASE)
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    drive_manager = DriveManager(write_behind=False)
+    drive_manager.client = drive_manager.service = None
+    cache = LedgerCache()
+    return lambda: FinancialManager(drive_manager, ledger_cache=cache)
+
+
+def test_concurrent_adds_are_both_saved(sessions):
+    first, second = sessions(), sessions()
+    first.add_transaction('income', 'Donación', 1.0, 'primera', '2024-01-01')
+    second.add_transaction('income', 'Donación', 2.0, 'segunda', '2024-01-02')
+    assert set(sessions().transactions['description']) == {'primera', 'segunda'}
+
+
+@pytest.mark.parametrize('operation', ['update', 'delete'])
+def test_conflict_writes_nothing(sessions, operation):
+    setup = sessions()
+    setup.add_transaction('income', 'Donación', 1.0, 'cuota', '2024-01-01')
+    setup.add_transaction('income', 'Donación', 1.0, 'cuota', '2024-01-01')
+    stale, other = sessions(), sessions()
+    other.delete_transaction(0)
+    saved = sessions().transactions
+
+    with pytest.raises(LedgerConflict):
+        if operation == 'update':
+            stale.update_transaction(1, 'income', 'Donación', 5.0, 'cuota', '2024-01-01')
+        else:
+            stale.delete_transaction(1)
+
+    pd.testing.assert_frame_equal(sessions().transactions, saved)
+    # La sesión vuelve al libro guardado y sus siguientes cambios no arrastran el fallido
+    pd.testing.assert_frame_equal(stale.transactions, saved)
+    stale.add_transaction('income', 'Donación', 3.0, 'después', '2024-01-03')
+    assert sessions().transactions['amount'].tolist() == [1.0, 3.0]